@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Benchmark suite runner.
+
+Runs the benchmarks, writes a JSON report and optionally compares it against
+a baseline report, failing if any metric regressed beyond the tolerance.
+Lower is better for every metric, except for the ones the reports list in
+``higher_is_better``.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+import logging
+from sys import exit, version
+from platform import platform
+from json import dumps, loads
+from argparse import ArgumentParser
+from numbers import Real
+from collections import OrderedDict
+
+from topology_docker_openswitch.cache import configure_image_cache
+from topology_docker_openswitch.engine import configure_engine
+
+from .suite import BENCHMARKS, QUICK, flatten, higher_is_better
+
+
+def compare(current, baseline, tolerance, min_delta, higher_is_better=()):
+    """
+    List the metrics that regressed against the baseline.
+
+    A metric regresses if it is worse than the baseline by more than the
+    given ratio and by more than the given absolute delta: if it increased,
+    or if it decreased for the metrics named in ``higher_is_better``. Values
+    that are not numbers, like the boot time of a topology that did not
+    boot, are not compared.
+    """
+    current = flatten(current)
+    regressions = []
+    for name, reference in flatten(baseline).items():
+        value = current.get(name)
+        if not all(
+                isinstance(number, Real) and
+                not isinstance(number, bool)
+                for number in (value, reference)):
+            continue
+        if name in higher_is_better:
+            worse = reference - value
+        else:
+            worse = value - reference
+        if worse > abs(reference) * tolerance and worse > min_delta:
+            regressions.append((name, reference, value))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(
+        prog='python -m benchmark',
+        description='Benchmark the OpenSwitch node against a fake backend.'
+    )
+    parser.add_argument(
+        'benchmarks', nargs='*', choices=[[]] + list(BENCHMARKS),
+        help='Benchmarks to run, all by default'
+    )
+    parser.add_argument('--output', help='Write the JSON report to a file')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.5,
+        help='Allowed regression ratio against the baseline (default: 0.5)'
+    )
+    parser.add_argument(
+        '--min-delta', type=float, default=0.01,
+        help='Ignore regressions smaller than this delta (default: 0.01)'
+    )
+    parser.add_argument(
+        '--quick', action='store_true',
+        help='Run a reduced set of sizes and repetitions'
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # Never reuse nor pollute the data cached by test sessions
+    configure_image_cache(None)
+    # The fake backend has no Docker Engine API
+    configure_engine(False)
+
+    results = OrderedDict()
+    for name in args.benchmarks or BENCHMARKS:
+        kwargs = QUICK.get(name, {}) if args.quick else {}
+        print('Running {}...'.format(name))
+        results[name] = BENCHMARKS[name](**kwargs)
+
+    report = OrderedDict([
+        ('python', version.split()[0]),
+        ('platform', platform()),
+        ('results', results),
+        ('higher_is_better', higher_is_better(results)),
+    ])
+    dumped = dumps(report, indent=4)
+    print(dumped)
+    if args.output:
+        with open(args.output, 'w') as fd:
+            fd.write(dumped)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as fd:
+            baseline = loads(fd.read())
+        regressions = compare(
+            results, baseline['results'], args.tolerance, args.min_delta,
+            higher_is_better=set(
+                baseline.get('higher_is_better', []) +
+                higher_is_better(results)
+            )
+        )
+        for name, reference, value in regressions:
+            print('REGRESSION {}: {:.4f} -> {:.4f}'.format(
+                name, reference, value
+            ))
+        if regressions:
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
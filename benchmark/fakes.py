@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+Local stand-ins of the pytest objects the plugin is given.
+
+The stand-ins of the Docker engine and of the OpenSwitch image are shared
+with the test suite, see :mod:`test.fakes`.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+
+class FakeTopology(object):
+    """
+    Minimal stand-in of the ``topology`` pytest fixture.
+    """
+
+    engine = 'docker'
+
+    def __init__(self, nodes):
+        self._nodes = dict((node.identifier, node) for node in nodes)
+        self.nodes = sorted(self._nodes)
+
+    def get(self, identifier):
+        return self._nodes.get(identifier)
+
+
+class FakeItem(object):
+    """
+    Minimal stand-in of a pytest test item using the ``topology`` fixture.
+    """
+
+    class Parent(object):
+        name = 'bench_fake_suite.py'
+
+    def __init__(self, topology, name='test_fake'):
+        self.funcargs = {'topology': topology}
+        self.parent = FakeItem.Parent()
+        self.name = name
+
+
+__all__ = ['FakeTopology', 'FakeItem']
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+Resource usage of the benchmarked nodes.
+
+The stand-in containers of :mod:`test.fakes` run inside the benchmark
+process, so their usage is sampled as the resident memory and CPU time of
+the process. Docker containers report their cgroup memory and CPU time
+through the Engine API stats.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from os import times, sysconf
+from logging import getLogger
+from threading import Thread, Event
+from collections import OrderedDict
+
+try:
+    from resource import getrusage, RUSAGE_SELF
+except ImportError:
+    getrusage = None
+
+
+log = getLogger(__name__)
+
+
+def process_rss():
+    """
+    Get the resident memory of the benchmark process.
+
+    :rtype: int
+    :return: Bytes of resident memory, or the peak resident memory where the
+     current one is unknown.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as fd:
+            return int(fd.read().split()[1]) * sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        pass
+    if getrusage is None:
+        return 0
+    # In kibibytes on Linux
+    return getrusage(RUSAGE_SELF).ru_maxrss * 1024
+
+
+def process_cpu():
+    """
+    Get the CPU time of the benchmark process and its waited children.
+
+    :rtype: float
+    :return: Seconds of user and system time.
+    """
+    usage = times()
+    return sum(usage[:4])
+
+
+class ResourceProfiler(object):
+    """
+    Sampler of the memory and CPU time of the benchmark process while a
+    block runs.
+
+    :param float interval: Seconds between memory samples.
+    :var dict usage: After the block, the resident memory when it started,
+     at its peak and when it ended, in bytes, and the CPU time it took, in
+     seconds.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.usage = None
+        self._peak = 0
+        self._stop = Event()
+        self._thread = None
+
+    def _sample(self):
+        while True:
+            self._peak = max(self._peak, process_rss())
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._rss = process_rss()
+        self._cpu = process_cpu()
+        self._peak = self._rss
+        self._stop.clear()
+        self._thread = Thread(target=self._sample)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+        rss = process_rss()
+        self.usage = OrderedDict([
+            ('rss_start', self._rss),
+            ('rss_peak', max(self._peak, rss)),
+            ('rss_end', rss),
+            ('cpu', process_cpu() - self._cpu),
+        ])
+
+
+def container_usage(node):
+    """
+    Get the cgroup memory and CPU time of the container of a node.
+
+    :param node: The OpenSwitch node.
+    :rtype: dict
+    :return: The memory in use and its peak, in bytes, and the CPU time, in
+     seconds, or ``None`` if the Docker client doesn't report them, as the
+     stand-in one.
+    """
+    stats = getattr(node._client, 'stats', None)
+    if stats is None:
+        return None
+    try:
+        sample = stats(node.container_id, stream=False)
+    except Exception:
+        log.debug('No stats for {}'.format(node.identifier), exc_info=True)
+        return None
+
+    memory = sample.get('memory_stats', {})
+    cpu = sample.get('cpu_stats', {}).get('cpu_usage', {})
+    return OrderedDict([
+        ('memory', memory.get('usage')),
+        # Not reported on cgroup v2 hosts
+        ('memory_peak', memory.get('max_usage')),
+        ('cpu', cpu['total_usage'] / 1e9 if 'total_usage' in cpu else None),
+    ])
+
+
+__all__ = [
+    'process_rss', 'process_cpu', 'ResourceProfiler', 'container_usage'
+]
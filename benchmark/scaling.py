@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+Scaling benchmark of topologies of increasing numbers of OpenSwitch nodes.
+
+For each size, a chain of switches is written in the SZN format of the
+``TOPOLOGY`` of the tests, built, measured and torn down. The report has,
+for every node, its boot time, from the start of its container to the end
+of its setup, and the phases of its setup script, and for the topology, the
+memory and CPU time it took.
+
+It runs against the local stand-in of :mod:`test.fakes` by default, or
+against the Docker engine and the real image with ``--docker``::
+
+    python -m benchmark.scaling --switches 2 4 8 16 32 --output scaling.json
+
+It parses the topologies with ``pyszn``, installed with the ``benchmark``
+extra.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+import logging
+from sys import version
+from platform import platform
+from json import dumps
+from time import time, strptime
+from calendar import timegm
+from argparse import ArgumentParser
+from collections import OrderedDict
+
+from pyszn.parser import parse_txtmeta
+
+from topology_docker_openswitch.openswitch import (
+    OpenSwitchNode, configure_parallel_setup
+)
+from topology_docker_openswitch.scheduler import configure_scheduler
+from topology_docker_openswitch.cache import configure_image_cache
+from topology_docker_openswitch.engine import configure_engine
+
+from test.fakes import FakeBackend, FakeOpenSwitchNode
+
+from .suite import median, higher_is_better
+from .profiler import ResourceProfiler, container_usage
+
+
+def chain_topology(switches, image=None):
+    """
+    Describe a chain of switches in the SZN format.
+
+    :param int switches: Number of switches.
+    :param str image: Image of the switches, the default one if ``None``.
+    :rtype: str
+    """
+    attributes = 'type=openswitch'
+    if image is not None:
+        attributes += ' image="{}"'.format(image)
+
+    lines = ['# Nodes']
+    lines.extend(
+        '[{} name="Switch {}"] sw{}'.format(attributes, number, number)
+        for number in range(1, switches + 1)
+    )
+    lines.extend(['', '# Links'])
+    lines.extend(
+        'sw{}:4 -- sw{}:3'.format(number, number + 1)
+        for number in range(1, switches)
+    )
+    return '\n'.join(lines) + '\n'
+
+
+def _docker_time(value):
+    # Like 2016-10-16T20:55:23.123456789Z, in UTC
+    seconds, _, fraction = value.rstrip('Z').partition('.')
+    return timegm(strptime(seconds, '%Y-%m-%dT%H:%M:%S')) + \
+        float('0.{}'.format(fraction or '0'))
+
+
+def build_fake(txtmeta, step_delay=0.05):
+    """
+    Build the OpenSwitch nodes of a topology on the stand-in backend, as the
+    platform does.
+
+    :param str txtmeta: The topology in the SZN format.
+    :param float step_delay: Seconds each boot step of the stand-in image
+     takes.
+    :rtype: tuple
+    :return: The nodes, the epoch each one was started at, by identifier,
+     and a callable tearing the topology down.
+    """
+    backend = FakeBackend(step_delay=step_delay)
+    data = parse_txtmeta(txtmeta)
+
+    ports = {}
+    for link in data['links']:
+        for identifier, port in link['endpoints']:
+            ports.setdefault(identifier, []).append(port)
+
+    nodes = []
+    started = OrderedDict()
+
+    def teardown():
+        for node in nodes:
+            node.stop()
+        backend.close()
+
+    try:
+        for entry in data['nodes']:
+            attributes = dict(entry['attributes'])
+            if attributes.get('type') != 'openswitch':
+                continue
+            # The stand-in has a single image
+            attributes.pop('image', None)
+            for identifier in entry['nodes']:
+                nodes.append(FakeOpenSwitchNode(
+                    identifier, backend, ports=ports.get(identifier, ()),
+                    **attributes
+                ))
+
+        for node in nodes:
+            started[node.identifier] = time()
+            node.start()
+        for node in nodes:
+            node.notify_post_build()
+    except Exception:
+        teardown()
+        raise
+
+    return nodes, started, teardown
+
+
+def build_docker(txtmeta):
+    """
+    Build a topology on the Docker engine.
+
+    :param str txtmeta: The topology in the SZN format.
+    :rtype: tuple
+    :return: The OpenSwitch nodes, the epoch each one was started at, by
+     identifier, and a callable tearing the topology down.
+    """
+    from topology.manager import TopologyManager
+
+    manager = TopologyManager(engine='docker')
+    manager.parse(txtmeta)
+    manager.resolve()
+    manager.build()
+
+    nodes = [
+        node for node in manager.nodes.values()
+        if isinstance(node, OpenSwitchNode)
+    ]
+    started = OrderedDict(
+        (node.identifier, _docker_time(node._client.inspect_container(
+            node.container_id
+        )['State']['StartedAt']))
+        for node in nodes
+    )
+    return nodes, started, manager.unbuild
+
+
+def measure(txtmeta, docker=False, step_delay=0.05):
+    """
+    Build a topology, measure it and tear it down.
+
+    :param str txtmeta: The topology in the SZN format.
+    :param bool docker: Build it on the Docker engine, or on the stand-in
+     backend otherwise.
+    :param float step_delay: Seconds each boot step of the stand-in image
+     takes.
+    :rtype: dict
+    """
+    start = time()
+    with ResourceProfiler() as profiler:
+        if docker:
+            nodes, started, teardown = build_docker(txtmeta)
+        else:
+            nodes, started, teardown = build_fake(txtmeta, step_delay)
+    build = time() - start
+
+    try:
+        results = OrderedDict()
+        for node in nodes:
+            timings = node.setup_timings or {}
+            finished = timings.get('started', 0) + timings.get('total', 0)
+            results[node.identifier] = OrderedDict([
+                ('boot', finished - started[node.identifier]
+                    if timings else None),
+                ('setup', timings.get('total')),
+                ('phases', OrderedDict(
+                    (phase['name'], phase['duration'])
+                    for phase in timings.get('phases', [])
+                )),
+                ('container', container_usage(node)),
+            ])
+    finally:
+        start = time()
+        teardown()
+        teardown_time = time() - start
+
+    usage = profiler.usage
+    boots = [
+        result['boot'] for result in results.values()
+        if result['boot'] is not None
+    ]
+    count = max(len(nodes), 1)
+    return OrderedDict([
+        ('switches', len(nodes)),
+        ('build', build),
+        ('teardown', teardown_time),
+        ('boot', OrderedDict([
+            ('median', median(boots) if boots else None),
+            ('max', max(boots) if boots else None),
+        ])),
+        ('process', usage),
+        ('per_node', OrderedDict([
+            ('rss', (usage['rss_peak'] - usage['rss_start']) / count),
+            ('cpu', usage['cpu'] / count),
+        ])),
+        ('nodes', results),
+    ])
+
+
+def scale(
+        switches=(2, 4, 8, 16, 32), docker=False, image=None,
+        step_delay=0.05, parallel=None, boot_limit=None):
+    """
+    Measure topologies of increasing numbers of switches.
+
+    :param list switches: Numbers of switches of the topologies.
+    :param bool docker: Build them on the Docker engine, or on the stand-in
+     backend otherwise.
+    :param str image: Image of the switches on the Docker engine.
+    :param float step_delay: Seconds each boot step of the stand-in image
+     takes.
+    :param int parallel: Nodes set up at the same time, ``None`` for all the
+     nodes of the topology.
+    :param float boot_limit: Stop once the slowest node of a topology takes
+     longer than these seconds to boot. ``None`` for no limit.
+    :rtype: dict
+    :return: The measurements by number of switches, and the largest number
+     booting within the limit.
+    """
+    topologies = OrderedDict()
+    sustained = None
+
+    for count in switches:
+        configure_parallel_setup(count if parallel is None else parallel)
+        try:
+            result = measure(
+                chain_topology(count, image=image), docker=docker,
+                step_delay=step_delay
+            )
+        finally:
+            configure_parallel_setup(0)
+        topologies[str(count)] = result
+
+        slowest = result['boot']['max']
+        if boot_limit is not None and (
+                slowest is None or slowest > boot_limit):
+            break
+        sustained = count
+
+    return OrderedDict([
+        ('sustained', sustained),
+        ('topologies', topologies),
+    ])
+
+
+def main():
+    parser = ArgumentParser(
+        prog='python -m benchmark.scaling',
+        description='Measure topologies of increasing numbers of switches.'
+    )
+    parser.add_argument(
+        '--switches', type=int, nargs='+', default=[2, 4, 8, 16, 32],
+        metavar='N', help='Numbers of switches (default: 2 4 8 16 32)'
+    )
+    parser.add_argument(
+        '--docker', action='store_true',
+        help='Use the Docker engine and the real image instead of the '
+        'stand-in'
+    )
+    parser.add_argument('--image', help='Image of the switches with --docker')
+    parser.add_argument(
+        '--step-delay', type=float, default=0.05,
+        help='Seconds each boot step of the stand-in image takes '
+        '(default: 0.05)'
+    )
+    parser.add_argument(
+        '--parallel', type=int,
+        help='Nodes set up at the same time (default: all)'
+    )
+    parser.add_argument(
+        '--cpus', type=int, default=0,
+        help='CPUs each container is pinned to (default: 0, unpinned)'
+    )
+    parser.add_argument(
+        '--max-setups', type=int, default=0,
+        help='Nodes running their setup script at the same time (default: 0, '
+        'no limit)'
+    )
+    parser.add_argument(
+        '--boot-limit', type=float,
+        help='Stop once a node takes longer than these seconds to boot'
+    )
+    parser.add_argument('--output', help='Write the JSON report to a file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # Never reuse nor pollute the data cached by test sessions
+    configure_image_cache(None)
+    # The stand-in backend has no Docker Engine API
+    configure_engine(args.docker)
+    configure_scheduler(args.cpus, max_setups=args.max_setups)
+
+    results = scale(
+        switches=args.switches, docker=args.docker, image=args.image,
+        step_delay=args.step_delay, parallel=args.parallel,
+        boot_limit=args.boot_limit
+    )
+
+    report = OrderedDict([
+        ('python', version.split()[0]),
+        ('platform', platform()),
+        ('backend', 'docker' if args.docker else 'fake'),
+        ('results', results),
+        ('higher_is_better', higher_is_better(results)),
+    ])
+    dumped = dumps(report, indent=4)
+    print(dumped)
+    if args.output:
+        with open(args.output, 'w') as fd:
+            fd.write(dumped)
+
+
+__all__ = ['chain_topology', 'build_fake', 'build_docker', 'measure', 'scale']
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,535 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Bring-up and teardown benchmarks of the OpenSwitch node.
+
+Every benchmark returns a dictionary of metrics, nested by scenario. Lower is
+better, except for the metrics named in ``HIGHER_IS_BETTER``, such as the
+largest number of switches of :mod:`benchmark.scaling` booting in time.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from os import urandom
+from shutil import rmtree
+from os.path import basename, splitext, exists
+from collections import OrderedDict
+from time import time, sleep
+from multiprocessing.pool import ThreadPool
+
+try:
+    from docker import APIClient
+except ImportError:
+    from docker import Client as APIClient
+
+from topology_docker_openswitch.openswitch import configure_parallel_setup
+from topology_docker_openswitch.pool import warm_pool, configure_warm_pool
+from topology_docker_openswitch.snapshot import (
+    snapshots, configure_snapshots
+)
+from topology_docker_openswitch.diagnostics import diagnostics
+from topology_docker_openswitch.engine import DockerEngine
+from topology_docker_openswitch.artifacts import (
+    incremental_copy, log_follower, configure_collector,
+    configure_incremental_copy, configure_log_follower
+)
+from topology_docker_openswitch.plugin import plugin
+
+from test.fakes import FakeBackend, FakeOpenSwitchNode
+
+from .fakes import FakeTopology, FakeItem
+
+
+# Names of the metrics that improve when they increase
+HIGHER_IS_BETTER = frozenset(['sustained'])
+
+
+def flatten(results, prefix=''):
+    """
+    Flatten nested metrics into a ``{'a.b.c': value}`` dictionary.
+    """
+    flat = OrderedDict()
+    for key, value in results.items():
+        name = '{}{}'.format(prefix, key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix=name + '.'))
+        else:
+            flat[name] = value
+    return flat
+
+
+def higher_is_better(results):
+    """
+    List the flattened names of the given metrics that improve when they
+    increase, to record them in the report along with the metrics.
+    """
+    return [
+        name for name in flatten(results)
+        if name.rsplit('.', 1)[-1] in HIGHER_IS_BETTER
+    ]
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def _bring_up(backend, identifiers, ports=()):
+    """
+    Create, start and set up nodes as the platform does, returning the nodes
+    and the seconds taken by the post build stage.
+    """
+    nodes = [
+        FakeOpenSwitchNode(identifier, backend, ports=ports)
+        for identifier in identifiers
+    ]
+    for node in nodes:
+        node.start()
+
+    start = time()
+    for node in nodes:
+        node.notify_post_build()
+    return nodes, time() - start
+
+
+def bench_bringup(repeat=5, step_delay=0.05, hwports=54, ports=4):
+    """
+    Post build latency of a single node.
+
+    Reports the total post build time, the latency between the last boot
+    step of the image (``cur_hw`` set) and the end of the setup, and the
+    duration of each phase recorded by the setup script, for the first node
+    of an image, for a later one using the data cached for the image, for
+    one started from the snapshot of the image and for one taking over a
+    container of the warm pool.
+    """
+    results = OrderedDict()
+
+    for mode in ['cold', 'cached', 'snapshot', 'warm_pool']:
+        totals = []
+        latencies = []
+        phases = OrderedDict()
+
+        for _ in range(repeat):
+            backend = FakeBackend(step_delay=step_delay, hwports=hwports)
+            try:
+                if mode == 'warm_pool':
+                    configure_warm_pool(1)
+                if mode == 'snapshot':
+                    configure_snapshots(True)
+                if mode != 'cold':
+                    (first,), _ = _bring_up(backend, ['sw0'])
+                if mode == 'warm_pool':
+                    deadline = time() + 30
+                    while not warm_pool.ready(first._pool_key):
+                        if time() > deadline:
+                            raise Exception('Warm pool never got ready')
+                        sleep(0.01)
+                (node,), total = _bring_up(
+                    backend, ['sw1'],
+                    ports=[str(port) for port in range(1, ports + 1)]
+                )
+                finished = time()
+                converged = dict(node.container.boot_schedule)['cur_hw']
+                totals.append(total)
+                latencies.append(finished - converged)
+                for phase in node.setup_timings['phases']:
+                    phases.setdefault(phase['name'], []).append(
+                        phase['duration']
+                    )
+            finally:
+                configure_snapshots(False)
+                configure_warm_pool(0)
+                warm_pool.shutdown(wait=True)
+                snapshots.remove()
+                backend.close()
+
+        results[mode] = OrderedDict([
+            ('total', median(totals)),
+            ('after_converged', median(latencies)),
+            ('phases', OrderedDict(
+                (name, median(durations))
+                for name, durations in phases.items()
+            ))
+        ])
+
+    return results
+
+
+def bench_bringup_parallel(nodes=8, step_delay=0.05):
+    """
+    Post build time of a topology of several nodes, set up one by one and
+    concurrently.
+    """
+    results = OrderedDict()
+    identifiers = ['sw{}'.format(i) for i in range(1, nodes + 1)]
+
+    for mode, workers in [('serial', 0), ('parallel', nodes)]:
+        configure_parallel_setup(workers)
+        backend = FakeBackend(step_delay=step_delay)
+        try:
+            _, results[mode] = _bring_up(backend, identifiers)
+        finally:
+            configure_parallel_setup(0)
+            backend.close()
+
+    return results
+
+
+def bench_port_mapping(counts=(8, 16, 32, 64, 128, 256, 512), repeat=3):
+    """
+    Duration of the interfaces creation phase against the number of ports in
+    the hardware description. Half of the ports are linked.
+    """
+    results = OrderedDict()
+
+    for count in counts:
+        durations = []
+        for _ in range(repeat):
+            backend = FakeBackend(step_delay=0, hwports=count)
+            try:
+                (node,), _ = _bring_up(
+                    backend, ['sw1'],
+                    ports=['p{}'.format(port) for port in range(count // 2)]
+                )
+                durations.extend(
+                    phase['duration']
+                    for phase in node.setup_timings['phases']
+                    if phase['name'] == 'interfaces'
+                )
+            finally:
+                backend.close()
+        results[str(count)] = median(durations)
+
+    return results
+
+
+def bench_port_flap(counts=(8, 32, 64), flaps=3, exec_delay=0.02):
+    """
+    Time to flap every port of a node down and up again against the number
+    of ports, one port at a time and all ports at once. Each command
+    execution in the container takes ``exec_delay`` seconds.
+    """
+    results = OrderedDict()
+
+    for count in counts:
+        backend = FakeBackend(step_delay=0, exec_delay=exec_delay)
+        try:
+            (node,), _ = _bring_up(
+                backend, ['sw1'],
+                ports=['p{}'.format(port) for port in range(count)]
+            )
+
+            start = time()
+            for _ in range(flaps):
+                for state in [False, True]:
+                    for portlbl in node.ports:
+                        node.set_port_state(portlbl, state)
+            single = (time() - start) / flaps
+
+            start = time()
+            for _ in range(flaps):
+                for state in [False, True]:
+                    results_ = node.set_ports_state(
+                        dict.fromkeys(node.ports, state)
+                    )
+                    assert not any(results_.values()), results_
+            bulk = (time() - start) / flaps
+
+            results[str(count)] = OrderedDict([
+                ('single', single), ('bulk', bulk)
+            ])
+        finally:
+            backend.close()
+
+    return results
+
+
+def bench_ovsdb_set(counts=(8, 48), repeat=3):
+    """
+    Time to enable interfaces through the OVSDB fast path against their
+    number, one transaction per interface and all of them in a single
+    transaction. Also reports the time to spawn the relay to the server.
+    """
+    results = OrderedDict()
+
+    for count in counts:
+        backend = FakeBackend(step_delay=0, hwports=count)
+        node = None
+        try:
+            (node,), _ = _bring_up(backend, ['sw1'])
+            names = [str(port) for port in range(1, count + 1)]
+
+            start = time()
+            node.ovsdb_select('Interface', ['name'])
+            connect = time() - start
+
+            singles = []
+            batches = []
+            for _ in range(repeat):
+                start = time()
+                for name in names:
+                    node.ovsdb_set(
+                        'Interface', {name: {'user_config:admin': 'up'}}
+                    )
+                singles.append(time() - start)
+
+                start = time()
+                node.ovsdb_set('Interface', dict(
+                    (name, {'user_config:admin': 'down'}) for name in names
+                ))
+                batches.append(time() - start)
+
+            results[str(count)] = OrderedDict([
+                ('connect', connect),
+                ('single', median(singles)),
+                ('batch', median(batches)),
+            ])
+        finally:
+            if node is not None:
+                node._close_ovsdb()
+            backend.close()
+
+    return results
+
+
+def bench_engine(commands=50, concurrency=8, image='topology/ops:latest'):
+    """
+    Latency of the commands run in a container through the Docker Engine API
+    and through the docker CLI, one at a time and per command when run
+    concurrently.
+
+    Unlike the other benchmarks, it needs a Docker daemon and the given
+    image, only run with a ``sleep`` command. It reports nothing without
+    them.
+    """
+    try:
+        client = APIClient(version='auto')
+        client.inspect_image(image)
+    except Exception as e:
+        print('Skipping engine benchmark: {}'.format(e))
+        return OrderedDict()
+
+    container = client.create_container(
+        image=image, command='sleep 3600', detach=True
+    )['Id']
+    results = OrderedDict()
+    try:
+        client.start(container)
+        for mode, api in [('api', True), ('cli', False)]:
+            engine = DockerEngine(api=api, max_pool_size=concurrency)
+            # Connect to the daemon before measuring
+            engine.execute(container, 'true')
+
+            latencies = []
+            for _ in range(commands):
+                start = time()
+                engine.execute(container, 'true')
+                latencies.append(time() - start)
+
+            pool = ThreadPool(concurrency)
+            try:
+                start = time()
+                pool.map(
+                    lambda _: engine.execute(container, 'true'),
+                    range(commands)
+                )
+                concurrent = (time() - start) / commands
+            finally:
+                pool.close()
+                pool.join()
+
+            results[mode] = OrderedDict([
+                ('serial', median(latencies)),
+                ('concurrent', concurrent),
+            ])
+    finally:
+        client.remove_container(container, force=True)
+
+    return results
+
+
+def _fill(directory, size, chunk=1024 * 1024):
+    written = 0
+    index = 0
+    while written < size:
+        length = min(chunk, size - written)
+        with open('{}/log{}.txt'.format(directory, index), 'wb') as fd:
+            fd.write(urandom(length))
+        written += length
+        index += 1
+
+
+def bench_log_collection(
+        sizes=(1, 16, 64), nodes=4, tests=3, messages_size=1024 * 1024,
+        appended=64 * 1024,
+        modes=('serial', 'parallel', 'incremental', 'follow')):
+    """
+    Duration of the teardown artifact collection against the size in MiB of
+    the shared directory of each node, for a module of several tests that
+    append to the logs.
+
+    The modes collect the nodes one by one, concurrently, concurrently
+    copying only what changed since the previous test, and concurrently
+    slicing the followed container logs.
+    """
+    results = OrderedDict()
+
+    for mode in modes:
+        configure_collector(1 if mode == 'serial' else nodes)
+        configure_incremental_copy(mode == 'incremental')
+        configure_log_follower(mode == 'follow')
+        results[mode] = OrderedDict()
+
+        for size in sizes:
+            backend = FakeBackend()
+            fake_nodes = []
+            path_names = []
+            try:
+                fake_nodes = [
+                    FakeOpenSwitchNode('sw{}'.format(i), backend)
+                    for i in range(1, nodes + 1)
+                ]
+                for node in fake_nodes:
+                    _fill(node.shared_dir, size * 1024 * 1024)
+                    with open(
+                            node.container.path('/var/log/messages'),
+                            'wb') as fd:
+                        fd.write(b'x' * messages_size)
+                    log_follower.start(node)
+
+                topology = FakeTopology(fake_nodes)
+                durations = []
+                for test in range(tests):
+                    item = FakeItem(topology, name='test_{}'.format(test))
+                    start = time()
+                    plugin.pytest_runtest_teardown(item)
+                    durations.append(time() - start)
+
+                    path_names.append('/tmp/{}_{}_{}'.format(
+                        splitext(basename(item.parent.name))[0], item.name,
+                        str(id(item))
+                    ))
+                    for node in fake_nodes:
+                        with open('{}/log0.txt'.format(node.shared_dir),
+                                  'ab') as fd:
+                            fd.write(urandom(appended))
+                        with open(
+                                node.container.path('/var/log/messages'),
+                                'ab') as fd:
+                            fd.write(b'y' * appended)
+
+                results[mode][str(size)] = OrderedDict([
+                    ('first', durations[0]),
+                    ('total', sum(durations))
+                ])
+            finally:
+                for node in fake_nodes:
+                    incremental_copy.forget(node.shared_dir)
+                    log_follower.stop(node)
+                for path_name in path_names:
+                    if exists(path_name):
+                        rmtree(path_name)
+                backend.close()
+
+    configure_collector(8)
+    configure_incremental_copy(False)
+    configure_log_follower(False)
+    return results
+
+
+def bench_diagnostics(exec_delays=(0.0, 0.1), repeat=3):
+    """
+    Duration of the diagnostics of a node that failed to set up, against the
+    seconds each command execution in its container takes.
+    """
+    results = OrderedDict()
+
+    for exec_delay in exec_delays:
+        backend = FakeBackend(exec_delay=exec_delay)
+        try:
+            with backend.installed():
+                node = FakeOpenSwitchNode('sw1', backend)
+            node.start()
+            durations = []
+            for _ in range(repeat):
+                start = time()
+                diagnostics.collect(node, Exception('Benchmark'))
+                durations.append(time() - start)
+            results[str(exec_delay)] = median(durations)
+        finally:
+            backend.close()
+
+    return results
+
+
+def bench_scaling(switches=(4, 16, 32), step_delay=0.05):
+    """
+    Build time of chains of increasing numbers of switches set up
+    concurrently, with the median and slowest boot time of their nodes and
+    the CPU time per node. See :mod:`benchmark.scaling` for the full report,
+    with the memory and the timings of every node.
+    """
+    # Imported here, the scaling module imports the median from this one
+    from .scaling import scale
+
+    results = OrderedDict()
+    for count, result in scale(
+            switches=switches, step_delay=step_delay)['topologies'].items():
+        results[count] = OrderedDict([
+            ('build', result['build']),
+            ('boot_median', result['boot']['median']),
+            ('boot_max', result['boot']['max']),
+            ('cpu_per_node', result['per_node']['cpu']),
+        ])
+    return results
+
+
+BENCHMARKS = OrderedDict([
+    ('bringup', bench_bringup),
+    ('bringup_parallel', bench_bringup_parallel),
+    ('port_mapping', bench_port_mapping),
+    ('port_flap', bench_port_flap),
+    ('ovsdb_set', bench_ovsdb_set),
+    ('engine', bench_engine),
+    ('log_collection', bench_log_collection),
+    ('diagnostics', bench_diagnostics),
+    ('scaling', bench_scaling),
+])
+
+QUICK = {
+    'bringup': {'repeat': 1},
+    'bringup_parallel': {'nodes': 4},
+    'port_mapping': {'counts': (8, 64, 512), 'repeat': 1},
+    'port_flap': {'counts': (8, 32), 'flaps': 1},
+    'ovsdb_set': {'repeat': 1},
+    'engine': {'commands': 10},
+    'log_collection': {'sizes': (1, 16), 'tests': 2},
+    'diagnostics': {'repeat': 1},
+    'scaling': {'switches': (2, 4)},
+}
+
+
+__all__ = [
+    'BENCHMARKS', 'QUICK', 'HIGHER_IS_BETTER', 'flatten', 'higher_is_better',
+    'median'
+] + list(BENCHMARKS)
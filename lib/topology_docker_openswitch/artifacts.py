@@ -0,0 +1,801 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Collection of the artifacts of OpenSwitch nodes after each test.
+
+The shared directory of every node is copied to a directory per test. The
+logs in it accumulate across the tests of a module, so copying the whole
+tree every time makes the disk usage grow quadratically. In incremental
+mode, only the bytes appended to a file since the previous test are copied,
+and files that didn't change are hard links to their previous copy.
+
+The artifacts of the nodes are collected concurrently, each node within a
+deadline, so the teardown of a test takes as long as its slowest node.
+
+Instead of reading the whole ``/var/log/messages`` of every container after
+each test, the :class:`LogFollower` can follow it as it grows, so only the
+lines logged during the test are written.
+
+The :class:`ArtifactPolicy` decides what is collected: everything after every
+test, or only lightweight artifacts after tests that passed, within size
+budgets per test and per session, and either copied or streamed into
+compressed archives.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from os import link, makedirs, stat, lstat, walk
+from os.path import join, relpath, exists, basename, getsize
+from json import dumps
+from time import time
+from hashlib import sha1
+from logging import getLogger
+from shutil import copy2, copyfileobj, copytree, Error
+from stat import S_ISREG, S_ISDIR
+from threading import Thread, Lock
+import tarfile
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+
+log = getLogger(__name__)
+
+
+# Bytes before the copied offset of a file checked to tell whether it was
+# appended to or rewritten
+TAIL_WINDOW = 4096
+
+# File of each copied tree listing the files holding only appended bytes
+MANIFEST = '.incremental.json'
+
+# File of each test directory listing the files left out by the budgets
+SKIPPED = 'skipped.txt'
+
+# File of the shared directory where the container log is followed to
+FOLLOWED_LOG = '.var_messages.follow'
+
+# File of the shared directory holding the pid of the follower of the log
+FOLLOWER_PID = '.var_messages.follow.pid'
+
+# Extension of the archives per compression
+ARCHIVE_EXTENSIONS = {'gz': '.tar.gz', 'zst': '.tar.zst'}
+
+
+def _walk(src, ignore=None):
+    """
+    Walk a directory tree like :func:`os.walk`, leaving out the entries
+    ignored like :func:`shutil.copytree` does.
+    """
+    for root, dirs, files in walk(src):
+        if ignore is not None:
+            ignored = set(ignore(root, dirs + files))
+            dirs[:] = [name for name in dirs if name not in ignored]
+            files = [name for name in files if name not in ignored]
+        yield root, files
+
+
+def archive(src, dst, compression='gz', ignore=None):
+    """
+    Stream a directory tree into a compressed tar archive.
+
+    Files are read and compressed one at a time, never copied as is.
+    ``zst`` requires the ``zstandard`` package, ``gz`` is used if it's
+    missing.
+
+    :param str src: Directory to archive.
+    :param str dst: Path of the archive, without extension.
+    :param str compression: ``gz`` or ``zst``.
+    :param ignore: Callable like the ``ignore`` argument of
+     :func:`shutil.copytree`.
+    :rtype: str
+    :return: Path of the archive.
+    """
+    if compression == 'zst':
+        try:
+            import zstandard
+        except ImportError:
+            log.warning('zstandard is not installed, using gzip instead')
+            compression = 'gz'
+
+    path = dst + ARCHIVE_EXTENSIONS[compression]
+    with open(path, 'wb') as raw:
+        stream = raw
+        if compression == 'zst':
+            stream = zstandard.ZstdCompressor().stream_writer(raw)
+            tar = tarfile.open(fileobj=stream, mode='w|')
+        else:
+            tar = tarfile.open(fileobj=raw, mode='w|gz')
+
+        with tar:
+            for root, files in _walk(src, ignore):
+                for filename in files:
+                    name = join(root, filename)
+                    if not S_ISREG(lstat(name).st_mode):
+                        continue
+                    tar.add(name, arcname=join(
+                        basename(src), relpath(name, src)
+                    ))
+
+        if stream is not raw:
+            # Ends the frame, and closes the file
+            stream.close()
+    return path
+
+
+class _FileState(object):
+    """
+    State of a file at its last copy.
+    """
+
+    def __init__(self, size, mtime, digest, dest, full):
+        self.size = size
+        self.mtime = mtime
+        self.digest = digest
+        self.dest = dest
+        self.full = full
+
+
+class IncrementalCopy(object):
+    """
+    Copy directory trees incrementally against their previous copy.
+
+    For each file of the tree, the copy is:
+
+    - A hard link to the previous copy, if the file didn't change and the
+      previous copy was complete.
+    - The bytes appended since the previous copy, if the file only grew.
+      These files are listed in the manifest file of the copy, along with the
+      offset their bytes start at.
+    - A complete copy otherwise.
+
+    :param bool enabled: Copy incrementally, or copy whole trees otherwise.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = Lock()
+        self._files = {}
+
+    def copytree(self, src, dst, ignore=None):
+        """
+        Copy a directory tree.
+
+        :param str src: Directory to copy.
+        :param str dst: Destination directory, must not exist.
+        :param ignore: Callable like the ``ignore`` argument of
+         :func:`shutil.copytree`.
+        :raises shutil.Error: With the list of ``(src, dst, reason)`` of the
+         files that couldn't be copied, after copying the others.
+        """
+        errors = []
+        manifest = {}
+
+        for root, files in _walk(src, ignore):
+            target = join(dst, relpath(root, src))
+            if not exists(target):
+                makedirs(target)
+            for filename in files:
+                srcname = join(root, filename)
+                dstname = join(target, filename)
+                try:
+                    offset = self._copy_file(srcname, dstname)
+                except (IOError, OSError) as e:
+                    errors.append((srcname, dstname, str(e)))
+                    continue
+                if offset:
+                    manifest[relpath(srcname, src)] = offset
+
+        if manifest:
+            with open(join(dst, MANIFEST), 'w') as fd:
+                fd.write(dumps(manifest, indent=4, sort_keys=True))
+
+        if errors:
+            raise Error(errors)
+
+    def forget(self, src):
+        """
+        Forget the previous copies of the files of a tree, so the next copy
+        is complete.
+
+        :param str src: Directory copied.
+        """
+        with self._lock:
+            for path in list(self._files):
+                if path == src or path.startswith(join(src, '')):
+                    del self._files[path]
+
+    def cost(self, src, status):
+        """
+        Get the bytes the next copy of a file would write.
+
+        :param str src: File to copy.
+        :param status: Status of the file, as returned by :func:`os.stat`.
+        :rtype: int
+        :return: ``0`` for a file that didn't change, the bytes appended to
+         a file that only grew, and its size otherwise.
+        """
+        with self._lock:
+            state = self._files.get(src)
+
+        if state is None:
+            return status.st_size
+        if (status.st_size, status.st_mtime) == (state.size, state.mtime):
+            return 0
+        if status.st_size > state.size and \
+                self._digest(src, state.size) == state.digest:
+            return status.st_size - state.size
+        return status.st_size
+
+    def _copy_file(self, src, dst):
+        # Return the offset the copied bytes start at in the source file
+        status = stat(src)
+        if not S_ISREG(status.st_mode):
+            # Sockets, pipes, etc.
+            return 0
+
+        with self._lock:
+            state = self._files.get(src)
+
+        unchanged = state is not None and \
+            (status.st_size, status.st_mtime) == (state.size, state.mtime)
+
+        if unchanged and state.full:
+            try:
+                link(state.dest, dst)
+                return 0
+            except OSError:
+                # For example, on different file systems
+                pass
+
+        elif unchanged:
+            open(dst, 'w').close()
+            return state.size
+
+        elif state is not None and status.st_size > state.size and \
+                self._digest(src, state.size) == state.digest:
+            with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+                fin.seek(state.size)
+                copyfileobj(fin, fout)
+                size = fin.tell()
+            self._update(src, size, status.st_mtime, dst, False)
+            return state.size
+
+        copy2(src, dst)
+        with open(dst, 'rb') as fd:
+            fd.seek(0, 2)
+            size = fd.tell()
+        self._update(src, size, status.st_mtime, dst, True)
+        return 0
+
+    def _update(self, src, size, mtime, dst, full):
+        state = _FileState(size, mtime, self._digest(src, size), dst, full)
+        with self._lock:
+            self._files[src] = state
+
+    def _digest(self, path, offset):
+        start = max(0, offset - TAIL_WINDOW)
+        with open(path, 'rb') as fd:
+            fd.seek(start)
+            return sha1(fd.read(offset - start)).hexdigest()
+
+
+class LogFollower(object):
+    """
+    Follow the ``/var/log/messages`` of the nodes into their shared
+    directory, to slice it per test.
+
+    A ``tail -F`` left running in the container appends the log to a file of
+    the shared directory as it grows. Before each test, the end of the log
+    is marked, and after it, the bytes since the mark are written to another
+    file, without reading the log again nor executing anything in the
+    container.
+
+    :param bool enabled: Follow the logs of the nodes.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = Lock()
+        self._offsets = {}
+
+    def start(self, node):
+        """
+        Start following the log of a node, if enabled and not done yet.
+
+        :param node: OpenSwitch node to follow the log of.
+        """
+        with self._lock:
+            if not self.enabled or node.shared_dir in self._offsets:
+                return
+            self._offsets[node.shared_dir] = 0
+
+        try:
+            node._docker_spawn('sh -c {}'.format(quote(
+                'echo $$ > {mount}/{pid}; '
+                'exec tail -F -c +0 /var/log/messages > {mount}/{log} '
+                '2>/dev/null'.format(
+                    mount=node.shared_dir_mount, pid=FOLLOWER_PID,
+                    log=FOLLOWED_LOG
+                )
+            )))
+        except Exception:
+            log.warning('Unable to follow the log of {}'.format(
+                node.identifier
+            ), exc_info=True)
+            self.stop(node)
+
+    def stop(self, node):
+        """
+        Stop following the log of a node and forget it.
+
+        :param node: OpenSwitch node followed.
+        """
+        with self._lock:
+            if self._offsets.pop(node.shared_dir, None) is None:
+                return
+
+        # The follower would otherwise keep writing to the shared directory,
+        # along with the next one started in the same container
+        try:
+            node._docker_exec('sh -c {}'.format(quote(
+                'read pid < {}/{} && kill $pid'.format(
+                    node.shared_dir_mount, FOLLOWER_PID
+                )
+            )))
+        except Exception:
+            log.debug('Unable to stop following the log of {}'.format(
+                node.identifier
+            ), exc_info=True)
+
+    def following(self, node):
+        """
+        Tell whether the log of a node is followed.
+
+        :rtype: bool
+        """
+        with self._lock:
+            return node.shared_dir in self._offsets
+
+    def mark(self):
+        """
+        Start the next slices of all the followed logs at their current end,
+        leaving out the lines logged between tests.
+        """
+        with self._lock:
+            offsets = dict(self._offsets)
+
+        for shared_dir, start in offsets.items():
+            followed = join(shared_dir, FOLLOWED_LOG)
+            try:
+                end = self._last_line(followed, start)
+            except (IOError, OSError):
+                continue
+            with self._lock:
+                if self._offsets.get(shared_dir, end) < end:
+                    self._offsets[shared_dir] = end
+
+    def _last_line(self, followed, start):
+        # Offset of the end of the last complete line after start
+        position = getsize(followed)
+        with open(followed, 'rb') as fd:
+            while position > start:
+                size = min(64 * 1024, position - start)
+                fd.seek(position - size)
+                newline = fd.read(size).rfind(b'\n')
+                if newline >= 0:
+                    return position - size + newline + 1
+                position -= size
+        return start
+
+    def slice(self, node, filename):
+        """
+        Write the complete lines logged by a node since the previous mark or
+        slice to a file of its shared directory.
+
+        :param node: OpenSwitch node followed.
+        :param str filename: Name of the file, relative to the shared
+         directory.
+        """
+        with self._lock:
+            start = self._offsets[node.shared_dir]
+
+        followed = join(node.shared_dir, FOLLOWED_LOG)
+        end = getsize(followed)
+        last_line = 0
+        with open(followed, 'rb') as fin, \
+                open(join(node.shared_dir, filename), 'wb') as fout:
+            fin.seek(start)
+            while fin.tell() < end:
+                chunk = fin.read(min(1024 * 1024, end - fin.tell()))
+                if not chunk:
+                    break
+                newline = chunk.rfind(b'\n')
+                if newline >= 0:
+                    last_line = fout.tell() + newline + 1
+                fout.write(chunk)
+            # The last line may still be being written
+            fout.truncate(last_line)
+
+        with self._lock:
+            if node.shared_dir in self._offsets:
+                self._offsets[node.shared_dir] = start + last_line
+
+
+class Budget(object):
+    """
+    Bytes that may still be collected.
+
+    :param int limit: Bytes that may be collected, ``None`` for no limit.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.used = 0
+        self.skipped = []
+        self._lock = Lock()
+
+    def take(self, size, name):
+        """
+        Take bytes from the budget.
+
+        :param int size: Bytes to take.
+        :param str name: Name of the file of the bytes, recorded as skipped
+         if the budget is exhausted.
+        :rtype: bool
+        :return: True if the bytes fit in the budget.
+        """
+        with self._lock:
+            if self.limit is not None and self.used + size > self.limit:
+                self.skipped.append(name)
+                return False
+            self.used += size
+            return True
+
+
+class ArtifactPolicy(object):
+    """
+    Policy deciding which artifacts are collected after each test, and how.
+
+    Budgets count the bytes of the files collected, before compression. With
+    incremental copies, they count the bytes actually written, so unchanged
+    files take nothing and files that grew only take the bytes appended. A
+    file that doesn't fit in the budget left is skipped and listed in the
+    ``skipped.txt`` file of the test directory.
+
+    :param str collect: ``always`` to collect all the artifacts after every
+     test, or ``failed`` to do so after the tests that failed or errored,
+     and only lightweight artifacts after the tests that passed.
+    :param int light_size: Largest file, in bytes, of the lightweight
+     artifacts.
+    :param int test_budget: Bytes collected per test, ``0`` for no limit.
+    :param int session_budget: Bytes collected per session, ``0`` for no
+     limit.
+    :param str compression: ``gz`` or ``zst`` to stream the artifacts of each
+     node into an archive, ``None`` to copy them.
+    """
+
+    def __init__(
+            self, collect='always', light_size=64 * 1024,
+            test_budget=0, session_budget=0, compression=None):
+        self.collect = collect
+        self.light_size = light_size
+        self.test_budget = test_budget
+        self.session_budget = session_budget
+        self.compression = compression
+        self._lock = Lock()
+        self._used = 0
+
+    def full(self, failed):
+        """
+        Tell whether to collect all the artifacts of a test.
+
+        :param bool failed: The test failed or errored.
+        :rtype: bool
+        """
+        return self.collect == 'always' or failed
+
+    def budget(self):
+        """
+        Get the budget of a test, bounded by what's left of the session
+        budget.
+
+        :rtype: :class:`Budget`
+        """
+        limits = []
+        if self.test_budget:
+            limits.append(self.test_budget)
+        if self.session_budget:
+            with self._lock:
+                limits.append(max(0, self.session_budget - self._used))
+        return Budget(min(limits) if limits else None)
+
+    def charge(self, budget):
+        """
+        Charge the bytes used by a test to the session budget.
+
+        :param budget: Budget of the test.
+        :type budget: :class:`Budget`
+        """
+        with self._lock:
+            self._used += budget.used
+
+    def ignore(self, full, budget, cost=None):
+        """
+        Get the filter of the files to collect.
+
+        :param bool full: Collect all the artifacts, or only the lightweight
+         ones.
+        :param budget: Budget of the test.
+        :type budget: :class:`Budget`
+        :param cost: Callable like :meth:`IncrementalCopy.cost`, giving the
+         bytes a file takes from the budget. ``None`` to take its size.
+        :return: Callable like the ``ignore`` argument of
+         :func:`shutil.copytree`.
+        """
+        if cost is None:
+            def cost(path, status):
+                return status.st_size
+
+        def ignore(directory, names):
+            ignored = []
+            for name in names:
+                path = join(directory, name)
+                status = lstat(path)
+                if S_ISDIR(status.st_mode):
+                    continue
+                if not full and status.st_size > self.light_size:
+                    ignored.append(name)
+                elif not budget.take(cost(path, status), path):
+                    ignored.append(name)
+            return ignored
+
+        return ignore
+
+
+class ArtifactCollector(object):
+    """
+    Collect the artifacts of the nodes of a test concurrently.
+
+    The artifacts of a node are its shared directory, including a copy of
+    the ``/var/log/messages`` of its container.
+
+    :param copy: Copy of the shared directories.
+    :type copy: :class:`IncrementalCopy`
+    :param policy: Policy deciding which artifacts are collected, and how.
+    :type policy: :class:`ArtifactPolicy`
+    :param int concurrency: Nodes collected at the same time.
+    :param float deadline: Seconds given to each node. The collection of a
+     node still running after them is abandoned in background.
+    :param follower: Follower of the logs of the nodes.
+    :type follower: :class:`LogFollower`
+    """
+
+    def __init__(
+            self, copy, policy, concurrency=8, deadline=120.0,
+            follower=None):
+        self.copy = copy
+        self.policy = policy
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.follower = follower
+
+    def collect(self, nodes, path, failed=False):
+        """
+        Collect the artifacts of some nodes.
+
+        :param list nodes: OpenSwitch nodes to collect the artifacts of.
+        :param str path: Directory to collect them into.
+        :param bool failed: The test failed or errored.
+        :rtype: list
+        :return: Identifiers of the nodes abandoned after their deadline.
+        """
+        full = self.policy.full(failed)
+        budget = self.policy.budget()
+        pending = list(reversed(nodes))
+        running = {}
+        done = Queue()
+        abandoned = []
+
+        while pending or running:
+            while pending and len(running) < max(1, self.concurrency):
+                node = pending.pop()
+                worker = Thread(
+                    target=self._worker,
+                    args=(node, path, full, budget, done)
+                )
+                worker.daemon = True
+                running[node.identifier] = time() + self.deadline
+                worker.start()
+
+            try:
+                running.pop(done.get(
+                    timeout=max(0, min(running.values()) - time())
+                ), None)
+            except Empty:
+                now = time()
+                for identifier, deadline in list(running.items()):
+                    if deadline <= now:
+                        log.warning(
+                            'Abandoned the collection of the artifacts of {} '
+                            'after {} seconds'.format(
+                                identifier, self.deadline
+                            )
+                        )
+                        del running[identifier]
+                        abandoned.append(identifier)
+
+        self.policy.charge(budget)
+        if budget.skipped:
+            log.warning('Artifacts budget exhausted, skipped {} files'.format(
+                len(budget.skipped)
+            ))
+            with open(join(path, SKIPPED), 'w') as fd:
+                fd.write(''.join(
+                    '{}\n'.format(name) for name in sorted(budget.skipped)
+                ))
+
+        return abandoned
+
+    def _worker(self, node, path, full, budget, done):
+        try:
+            self.collect_node(node, path, full=full, budget=budget)
+        except Exception:
+            log.exception('Unable to collect the artifacts of {}'.format(
+                node.identifier
+            ))
+        finally:
+            done.put(node.identifier)
+
+    def collect_node(self, node, path, full=True, budget=None):
+        """
+        Collect the artifacts of a node.
+
+        :param node: OpenSwitch node to collect the artifacts of.
+        :param str path: Directory to collect them into.
+        :param bool full: Collect all the artifacts, or only the lightweight
+         ones.
+        :param budget: Budget of the test, ``None`` for no limit.
+        :type budget: :class:`Budget`
+        """
+        logs_path = '/var/log/messages'
+        if self.follower is not None and self.follower.following(node):
+            try:
+                self.follower.slice(node, 'var_messages.log')
+            except (IOError, OSError):
+                log.warning('Unable to slice {} of container {}'.format(
+                    logs_path, node.identifier
+                ), exc_info=True)
+        elif full:
+            try:
+                node.capture_output(
+                    'cat {}'.format(logs_path), 'var_messages.log',
+                    shell='bash'
+                )
+            except Exception:
+                log.warning('Unable to get {} from container {}'.format(
+                    logs_path, node.identifier
+                ))
+
+        # Incremental copies only take the bytes they write
+        incremental = self.copy.enabled and not self.policy.compression
+        policy_ignore = self.policy.ignore(
+            full, budget or Budget(),
+            cost=self.copy.cost if incremental else None
+        )
+
+        def ignore(directory, names):
+            # The followed log is collected in slices
+            followed = [
+                name for name in names if name in (FOLLOWED_LOG, FOLLOWER_PID)
+            ]
+            return followed + policy_ignore(
+                directory, [name for name in names if name not in followed]
+            )
+
+        shared_dir = node.shared_dir
+        dst = join(path, basename(shared_dir))
+
+        if self.policy.compression:
+            try:
+                archive(shared_dir, dst, self.policy.compression, ignore)
+            except (IOError, OSError) as e:
+                log.warning('Unable to archive {}, Error {}'.format(
+                    shared_dir, e
+                ))
+            return
+
+        copy = self.copy.copytree if incremental else copytree
+        try:
+            copy(shared_dir, dst, ignore=ignore)
+        except Error as err:
+            for src, _, msg in err.args[0]:
+                log.warning('Unable to copy file {}, Error {}'.format(
+                    src, msg
+                ))
+
+
+incremental_copy = IncrementalCopy()
+policy = ArtifactPolicy()
+log_follower = LogFollower()
+collector = ArtifactCollector(incremental_copy, policy, follower=log_follower)
+
+
+def configure_incremental_copy(enabled):
+    """
+    Enable or disable the incremental copy of the artifacts of the nodes.
+
+    :param bool enabled: Copy only what changed since the previous test.
+    """
+    incremental_copy.enabled = enabled
+
+
+def configure_log_follower(enabled):
+    """
+    Enable or disable following the logs of the nodes to slice them per test.
+
+    :param bool enabled: Follow the logs of the nodes started from now on.
+    """
+    log_follower.enabled = enabled
+
+
+def configure_collector(concurrency, deadline=None):
+    """
+    Configure the collection of the artifacts of the nodes.
+
+    :param int concurrency: Nodes collected at the same time.
+    :param float deadline: Seconds given to each node. ``None`` to leave it
+     unchanged.
+    """
+    collector.concurrency = concurrency
+    if deadline is not None:
+        collector.deadline = deadline
+
+
+def configure_policy(
+        collect='always', light_size=64 * 1024, test_budget=0,
+        session_budget=0, compression=None):
+    """
+    Configure which artifacts of the nodes are collected, and how.
+
+    See :class:`ArtifactPolicy` for the arguments.
+    """
+    with policy._lock:
+        policy.collect = collect
+        policy.light_size = light_size
+        policy.test_budget = test_budget
+        policy.session_budget = session_budget
+        policy.compression = compression
+        policy._used = 0
+
+
+__all__ = [
+    'IncrementalCopy', 'LogFollower', 'Budget', 'ArtifactPolicy',
+    'ArtifactCollector', 'archive',
+    'incremental_copy', 'policy', 'log_follower', 'collector',
+    'configure_incremental_copy', 'configure_log_follower',
+    'configure_collector', 'configure_policy'
+]
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Host side cache of data derived from OpenSwitch images.
+
+Entries are keyed by the Docker image ID, so a rebuilt or re-pulled image
+never reuses the data of its predecessor.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from os import getpid, rename, remove
+from os.path import join, exists
+from json import dumps, loads
+from threading import Lock
+from tempfile import gettempdir
+
+from topology_docker.utils import ensure_dir
+
+
+class ImageCache(object):
+    """
+    Cache of JSON serializable values per Docker image.
+
+    Values are kept in memory and, if a directory is given, persisted to disk
+    so they survive across test sessions.
+
+    :param str directory: Directory to persist the entries to. ``None`` to
+     keep them in memory only.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = Lock()
+        self._entries = {}
+
+    def path(self, image_id, name=None):
+        """
+        Get the directory of the entries of an image, or the file of one of
+        its entries.
+
+        :param str image_id: ID of the image, as returned by
+         ``inspect_image``.
+        :param str name: Name of the entry.
+        :rtype: str
+        """
+        image_dir = join(self.directory, image_id.replace(':', '_'))
+        if name is None:
+            return image_dir
+        return join(image_dir, '{}.json'.format(name))
+
+    def get(self, image_id, name):
+        """
+        Get a cached value.
+
+        :param str image_id: ID of the image the value was derived from.
+        :param str name: Name of the entry.
+        :return: The cached value or ``None`` if not cached.
+        """
+        with self._lock:
+            key = (image_id, name)
+            if key in self._entries:
+                return self._entries[key]
+
+            if self.directory is None:
+                return None
+
+            entry = self.path(image_id, name)
+            if not exists(entry):
+                return None
+
+            with open(entry, 'r') as fd:
+                value = loads(fd.read())
+            self._entries[key] = value
+            return value
+
+    def set(self, image_id, name, value):
+        """
+        Cache a value.
+
+        :param str image_id: ID of the image the value was derived from.
+        :param str name: Name of the entry.
+        :param value: JSON serializable value.
+        """
+        with self._lock:
+            self._entries[(image_id, name)] = value
+
+            if self.directory is None:
+                return
+
+            ensure_dir(self.path(image_id))
+            entry = self.path(image_id, name)
+            # Write and rename so concurrent sessions never read a partial
+            # entry
+            tmp = '{}.{}.tmp'.format(entry, getpid())
+            with open(tmp, 'w') as fd:
+                fd.write(dumps(value))
+            rename(tmp, entry)
+
+    def delete(self, image_id, name):
+        """
+        Remove a cached value, if any.
+
+        :param str image_id: ID of the image the value was derived from.
+        :param str name: Name of the entry.
+        """
+        with self._lock:
+            self._entries.pop((image_id, name), None)
+
+            if self.directory is None:
+                return
+
+            entry = self.path(image_id, name)
+            if exists(entry):
+                remove(entry)
+
+    def clear(self):
+        """
+        Forget the entries kept in memory.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+image_cache = ImageCache(join(gettempdir(), 'topology_docker_openswitch'))
+
+
+def configure_image_cache(directory):
+    """
+    Set the directory where the data derived from images is persisted.
+
+    :param str directory: Directory to persist the entries to. ``None`` to
+     keep them in memory only.
+    """
+    image_cache.directory = directory
+    image_cache.clear()
+
+
+__all__ = ['ImageCache', 'image_cache', 'configure_image_cache']
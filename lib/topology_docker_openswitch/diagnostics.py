@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Diagnostics of OpenSwitch nodes that failed to set up.
+
+On a hung image, any command may hang too. The diagnostics are gathered by
+independent probes run concurrently, each one within a timeout and with its
+output capped, and written to a single ``diagnostics.json`` bundle in the
+shared directory of the node.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from json import dumps
+from time import time
+from logging import getLogger
+from collections import OrderedDict
+from threading import Thread
+from subprocess import CalledProcessError
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+from .engine import engine
+from .hostlog import extract
+
+
+log = getLogger(__name__)
+
+
+# Name of the bundle in the shared directory
+BUNDLE = 'diagnostics.json'
+
+# Exit status of the commands killed by timeout
+TIMEOUT_STATUS = [124, 137]
+
+# Seconds given to a probe over its timeout before abandoning it
+GRACE = 2.0
+
+# Syslog identifiers of the OpenSwitch daemons. They log to the host syslog
+# through the bind mounted /dev/log, without the ID of their container, so
+# they match the daemons of every OpenSwitch container.
+SYSLOG_IDENTIFIERS = [' ops-', ' ops_', ' ovsdb-server[', ' ovs-vswitchd[']
+
+
+def _cap(output, max_output):
+    return output[:max_output], len(output) > max_output
+
+
+def _containers(node, max_output):
+    return _cap(engine.containers(), max_output)
+
+
+def _container_state(node, max_output):
+    return _cap(dumps(
+        node._client.inspect_container(node.container_id)['State'],
+        indent=4, sort_keys=True
+    ), max_output)
+
+
+class Probe(object):
+    """
+    Probe of a diagnostic of a node.
+
+    :param str name: Name of the probe in the bundle.
+    :param command: Command run in the container, or callable run in the host
+     taking the node and the bytes of output to keep, and returning the
+     diagnostic and whether it was truncated.
+    """
+
+    def __init__(self, name, command):
+        self.name = name
+        self.command = command
+
+    def run(self, node, timeout, max_output):
+        """
+        Run the probe.
+
+        :param node: OpenSwitch node to diagnose.
+        :param float timeout: Seconds the probe may take.
+        :param int max_output: Bytes of output to keep.
+        :rtype: dict
+        :return: Result of the probe, with keys ``status``, ``output`` and
+         ``truncated``.
+        """
+        if callable(self.command):
+            output, truncated = self.command(node, max_output)
+            return OrderedDict([
+                ('status', 0),
+                ('output', output),
+                ('truncated', truncated),
+            ])
+
+        # Only read back one byte more than the cap, to tell if it was hit
+        output_file = '/tmp/diagnostics.{}'.format(self.name)
+        script = (
+            'timeout -s KILL {timeout} sh -c {command} > {output} 2>&1; '
+            'status=$?; head -c {max_output} {output}; rm -f {output}; '
+            'exit $status'
+        ).format(
+            timeout=int(max(1, timeout)), command=quote(self.command),
+            output=output_file, max_output=max_output + 1
+        )
+        try:
+            output = node._docker_exec('sh -c {}'.format(quote(script)))
+            status = 0
+        except CalledProcessError as e:
+            output = e.output or ''
+            if isinstance(output, bytes):
+                output = output.decode('utf-8', 'replace')
+            status = e.returncode
+
+        result = OrderedDict([
+            ('status', status),
+            ('output', output[:max_output]),
+            ('truncated', len(output) > max_output),
+        ])
+        if status in TIMEOUT_STATUS:
+            result['timed_out'] = True
+        return result
+
+
+class SyslogProbe(Probe):
+    """
+    Probe of the lines of the host syslog about the container of a node,
+    logged since the node was created.
+
+    :param str name: Name of the probe in the bundle.
+    :param str path: Path to the host syslog.
+    :param bool daemons: Also extract the lines of the OpenSwitch daemons,
+     logged without the ID of their container, and the whole window if no
+     line matches. These include the lines of the other OpenSwitch
+     containers of the host.
+    """
+
+    def __init__(self, name, path='/var/log/syslog', daemons=False):
+        super(SyslogProbe, self).__init__(name, self._extract)
+        self.path = path
+        self.daemons = daemons
+
+    def _extract(self, node, max_output):
+        needles = [node.container_id[:12], node.container_name]
+        if self.daemons:
+            needles += SYSLOG_IDENTIFIERS
+        return extract(
+            self.path, needles, since=node._created_at, until=time(),
+            max_bytes=max_output, fallback=self.daemons
+        )
+
+
+class Diagnostics(object):
+    """
+    Gatherer of the diagnostics of the nodes that failed to set up.
+
+    :param list probes: The :class:`Probe` to run.
+    :param float timeout: Seconds each probe may take.
+    :param int max_output: Bytes of output kept per probe.
+    """
+
+    def __init__(self, probes, timeout=10.0, max_output=256 * 1024):
+        self.probes = probes
+        self.timeout = timeout
+        self.max_output = max_output
+
+    def collect(self, node, error=None):
+        """
+        Run all the probes concurrently and write the bundle to the shared
+        directory of the node.
+
+        :param node: OpenSwitch node to diagnose.
+        :param error: The exception of the failed setup.
+        :rtype: dict
+        :return: The results of the probes, by probe name.
+        """
+        results = {}
+        start = time()
+
+        def run(probe):
+            begin = time()
+            try:
+                result = probe.run(node, self.timeout, self.max_output)
+            except Exception as e:
+                result = OrderedDict([('error', str(e))])
+            result['duration'] = time() - begin
+            results[probe.name] = result
+
+        threads = []
+        for probe in self.probes:
+            thread = Thread(target=run, args=(probe,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        deadline = start + self.timeout + GRACE
+        for thread in threads:
+            thread.join(max(0, deadline - time()))
+
+        # Probes still running keep running in background, leave them out
+        abandoned = OrderedDict([
+            ('error', 'Abandoned after {} seconds'.format(
+                self.timeout + GRACE
+            ))
+        ])
+        results = OrderedDict(
+            (probe.name, results.get(probe.name, abandoned))
+            for probe in self.probes
+        )
+
+        bundle = OrderedDict([
+            ('node', node.identifier),
+            ('container', node.container_id),
+            ('error', str(error) if error is not None else None),
+            ('duration', time() - start),
+            ('probes', results),
+        ])
+        with open('{}/{}'.format(node.shared_dir, BUNDLE), 'w') as fd:
+            fd.write(dumps(bundle, indent=4))
+
+        return results
+
+
+PROBES = [
+    Probe('daemons', 'ovs-vsctl list Daemon'),
+    Probe('coredumps', 'coredumpctl info --no-pager'),
+    Probe('processes', 'ps -aef'),
+    Probe('systemctl_status', 'systemctl status --no-pager'),
+    Probe('systemctl_failed', 'systemctl --state=failed --all --no-pager'),
+    Probe('ovsdb_dump', 'ovsdb-client dump'),
+    Probe('container_state', _container_state),
+    Probe('containers', _containers),
+    SyslogProbe('syslog'),
+]
+
+diagnostics = Diagnostics(PROBES)
+
+
+def configure_diagnostics(timeout, max_output=None, syslog_daemons=None):
+    """
+    Bound the diagnostics of the nodes that failed to set up.
+
+    :param float timeout: Seconds each probe may take.
+    :param int max_output: Bytes of output kept per probe. ``None`` to leave
+     it unchanged.
+    :param bool syslog_daemons: Also extract the host syslog lines of the
+     OpenSwitch daemons of all the containers, see :class:`SyslogProbe`.
+     ``None`` to leave it unchanged.
+    """
+    diagnostics.timeout = timeout
+    if max_output is not None:
+        diagnostics.max_output = max_output
+    if syslog_daemons is not None:
+        for probe in diagnostics.probes:
+            if isinstance(probe, SyslogProbe):
+                probe.daemons = syslog_daemons
+
+
+__all__ = [
+    'Probe', 'SyslogProbe', 'Diagnostics', 'PROBES', 'diagnostics',
+    'configure_diagnostics'
+]
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Docker Engine API access shared by all OpenSwitch nodes.
+
+Running a command with the ``docker exec`` CLI spawns a process that opens a
+new connection to the Docker daemon every time. Dense topologies run
+thousands of them, so commands are run through the Engine API instead, over
+a pool of persistent connections shared by all nodes, so concurrent commands
+don't wait for each other. The CLI is used if the API is unavailable.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from logging import getLogger
+from threading import Lock
+from shlex import split as shsplit
+from subprocess import check_output, CalledProcessError
+
+try:
+    from docker import APIClient
+except ImportError:
+    from docker import Client as APIClient
+
+
+log = getLogger(__name__)
+
+
+class DockerEngine(object):
+    """
+    Runs commands in containers through the Docker Engine API.
+
+    :param bool api: Use the Engine API, or the ``docker`` CLI otherwise.
+    :param int max_pool_size: Connections to the Docker daemon kept open.
+    """
+
+    def __init__(self, api=True, max_pool_size=32):
+        self.api = api
+        self.max_pool_size = max_pool_size
+        self._lock = Lock()
+        self._client = None
+        # Older clients can't split the output streams
+        self._demux = True
+
+    def client(self):
+        """
+        Get the shared Docker API client, creating it on first use.
+
+        :return: The Docker API client or ``None`` if the Engine API is
+         disabled or unavailable.
+        """
+        with self._lock:
+            if not self.api:
+                return None
+            if self._client is None:
+                try:
+                    try:
+                        self._client = APIClient(
+                            version='auto', max_pool_size=self.max_pool_size
+                        )
+                    except TypeError:
+                        # Older clients have a fixed pool size
+                        self._client = APIClient(version='auto')
+                except Exception:
+                    log.warning(
+                        'Docker Engine API unavailable, using the docker CLI',
+                        exc_info=True
+                    )
+                    self.api = False
+            return self._client
+
+    def execute(self, container_id, command, detach=False):
+        """
+        Execute a command inside a container.
+
+        :param str container_id: ID of the container.
+        :param str command: The command to execute.
+        :param bool detach: Leave the command running in background.
+        :rtype: str
+        :return: The standard output of the command, or an empty string if
+         detached. The standard error is never part of it, whatever the
+         client version or the path taken.
+        :raises CalledProcessError: If the command exits with a non zero
+         status.
+        """
+        client = self.client()
+        if client is not None:
+            # Only fall back before the command runs, it may not be
+            # idempotent
+            try:
+                exec_id = self._exec_create(client, container_id, command)
+            except Exception:
+                log.debug(
+                    'Engine API exec failed, retrying with the docker CLI',
+                    exc_info=True
+                )
+            else:
+                if detach:
+                    client.exec_start(exec_id, detach=True)
+                    return ''
+                return self._api_exec(client, container_id, exec_id, command)
+
+        return check_output(shsplit('docker exec {}{} {}'.format(
+            '-d ' if detach else '', container_id, command.strip()
+        ))).decode('utf8')
+
+    def _exec_create(self, client, container_id, command):
+        return client.exec_create(
+            container_id, shsplit(command.strip()),
+            stdout=True, stderr=self._demux
+        )
+
+    def _api_exec(self, client, container_id, exec_id, command):
+        if self._demux:
+            try:
+                stdout, stderr = client.exec_start(exec_id, demux=True)
+            except TypeError:
+                # The exec didn't start, create it again without its
+                # standard error, which couldn't be told apart
+                self._demux = False
+                exec_id = self._exec_create(client, container_id, command)
+            else:
+                if stderr:
+                    log.debug(stderr.decode('utf8', 'replace'))
+        if not self._demux:
+            stdout = client.exec_start(exec_id)
+
+        output = (stdout or b'').decode('utf8')
+        exit_code = client.exec_inspect(exec_id)['ExitCode']
+        if exit_code:
+            raise CalledProcessError(exit_code, command, output)
+        return output
+
+    def containers(self):
+        """
+        Describe all containers, like ``docker ps -a``.
+
+        :rtype: str
+        """
+        client = self.client()
+        if client is None:
+            return check_output(['docker', 'ps', '-a']).decode('utf8')
+
+        lines = ['CONTAINER ID\tIMAGE\tSTATUS\tNAMES']
+        for container in client.containers(all=True):
+            lines.append('\t'.join([
+                container['Id'][:12], container['Image'],
+                container['Status'], ','.join(container['Names'])
+            ]))
+        return '\n'.join(lines) + '\n'
+
+
+engine = DockerEngine()
+
+
+def configure_engine(api, max_pool_size=None):
+    """
+    Choose how the OpenSwitch nodes run commands in their containers.
+
+    :param bool api: Use the Docker Engine API, or the ``docker`` CLI
+     otherwise.
+    :param int max_pool_size: Connections to the Docker daemon kept open.
+     ``None`` to leave it unchanged.
+    """
+    with engine._lock:
+        engine.api = api
+        if max_pool_size is not None:
+            engine.max_pool_size = max_pool_size
+        # Apply the new pool size on next use
+        engine._client = None
+
+
+__all__ = ['DockerEngine', 'engine', 'configure_engine']
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Extraction of the lines of the host syslog about a container.
+
+On busy hosts the syslog is gigabytes long, and mostly about other
+containers. The file is memory mapped and searched backwards from its end
+for the container, so only the lines mentioning it are looked at, down to
+the ones logged when the node was created. If none does, the whole window
+can be extracted instead.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from re import compile as regex
+from mmap import mmap, ACCESS_READ
+from time import mktime, localtime
+from calendar import timegm
+
+
+# Timestamp of the traditional syslog format, like "Oct 16 20:55:23"
+BSD_TIMESTAMP = regex(
+    br'^([A-Z][a-z]{2}) +(\d{1,2}) (\d{2}):(\d{2}):(\d{2}) '
+)
+
+# Timestamp of the RFC 5424 and RFC 3339 formats, like
+# "2016-10-16T20:55:23.123456+02:00"
+ISO_TIMESTAMP = regex(
+    br'^(?:<\d+>1 )?(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})'
+    br'(?:\.\d+)?(Z|[+-]\d{2}:?\d{2})?'
+)
+
+MONTHS = [
+    b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun',
+    b'Jul', b'Aug', b'Sep', b'Oct', b'Nov', b'Dec'
+]
+
+
+def parse_timestamp(line, year):
+    """
+    Parse the timestamp of a syslog line.
+
+    :param bytes line: The syslog line.
+    :param int year: Year of the timestamps without one.
+    :rtype: float
+    :return: Seconds since the epoch or ``None`` if the line has no
+     timestamp.
+    """
+    match = ISO_TIMESTAMP.match(line)
+    if match is not None:
+        fields = [int(field) for field in match.groups()[:6]]
+        offset = match.group(7)
+        if offset is None:
+            return mktime(tuple(fields) + (0, 0, -1))
+        seconds = timegm(tuple(fields) + (0, 0, 0))
+        if offset != b'Z':
+            offset = offset.replace(b':', b'')
+            minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+            seconds -= minutes * 60 * (1 if offset[:1] == b'+' else -1)
+        return seconds
+
+    match = BSD_TIMESTAMP.match(line)
+    if match is not None and match.group(1) in MONTHS:
+        month = MONTHS.index(match.group(1)) + 1
+        day, hour, minute, second = [int(x) for x in match.groups()[1:]]
+        return mktime((year, month, day, hour, minute, second, 0, 0, -1))
+
+    return None
+
+
+def _matching_lines(data, needles):
+    # Jump from an occurrence of the needles to the previous one, the other
+    # lines are never looked at
+    positions = [data.rfind(needle) for needle in needles]
+    while positions and max(positions) >= 0:
+        position = max(positions)
+        start = data.rfind(b'\n', 0, position) + 1
+        end = data.find(b'\n', position)
+        end = len(data) if end < 0 else end + 1
+        yield data[start:end]
+
+        positions = [
+            data.rfind(needle, 0, start) if found >= start else found
+            for needle, found in zip(needles, positions)
+        ]
+
+
+def _all_lines(data):
+    end = len(data)
+    while end > 0:
+        start = data.rfind(b'\n', 0, end - 1) + 1
+        yield data[start:end]
+        end = start
+
+
+def _window(lines, year, since, until, max_bytes, slack):
+    # Keep the lines, read backwards, logged within the window
+    kept = []
+    size = 0
+    for line in lines:
+        timestamp = parse_timestamp(line, year)
+        if timestamp is not None and until is not None and \
+                timestamp > until + 86400:
+            # The previous year, in the traditional format
+            timestamp = parse_timestamp(line, year - 1)
+        if timestamp is not None:
+            if since is not None and timestamp < since - slack:
+                break
+            if until is not None and timestamp > until or \
+                    since is not None and timestamp < since:
+                continue
+
+        if not line.endswith(b'\n'):
+            line += b'\n'
+        if size + len(line) > max_bytes:
+            return kept, True
+        kept.append(line)
+        size += len(line)
+    return kept, False
+
+
+def extract(
+        path, needles, since=None, until=None, max_bytes=256 * 1024,
+        slack=60.0, fallback=False):
+    """
+    Extract the lines of a syslog file mentioning any of some strings,
+    logged within a time window.
+
+    :param str path: Path to the syslog file.
+    :param list needles: Strings to look for, like the ID or the name of a
+     container.
+    :param float since: Seconds since the epoch the window starts at,
+     ``None`` to scan the whole file.
+    :param float until: Seconds since the epoch the window ends at, ``None``
+     for no end.
+    :param int max_bytes: Bytes of lines to keep. The most recent lines are
+     kept.
+    :param float slack: Seconds the lines may be out of order. The file is
+     searched until a matching line older than the start of the window by
+     more than these.
+    :param bool fallback: If no line of the window mentions the strings,
+     extract all of its lines instead.
+    :rtype: tuple
+    :return: The lines, in the order of the file, and whether some were left
+     out because of the cap.
+    """
+    needles = [
+        needle.encode('utf-8') if not isinstance(needle, bytes) else needle
+        for needle in needles if needle
+    ]
+    year = localtime(until).tm_year if until is not None else \
+        localtime().tm_year
+
+    with open(path, 'rb') as fd:
+        try:
+            data = mmap(fd.fileno(), 0, access=ACCESS_READ)
+        except ValueError:
+            # Empty file
+            return '', False
+
+        try:
+            lines, truncated = _window(
+                _matching_lines(data, needles), year, since, until,
+                max_bytes, slack
+            )
+            if not lines and fallback:
+                lines, truncated = _window(
+                    _all_lines(data), year, since, until, max_bytes, slack
+                )
+        finally:
+            data.close()
+
+    return b''.join(reversed(lines)).decode('utf-8', 'replace'), truncated
+
+
+__all__ = ['parse_timestamp', 'extract']
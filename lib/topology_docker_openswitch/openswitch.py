@@ -24,122 +24,556 @@ Custom Topology Docker Node for OpenSwitch.
 from __future__ import unicode_literals, absolute_import
 from __future__ import print_function, division
 
-from json import loads
-from subprocess import check_call
+from re import search, compile as regex
+from json import dumps, loads
+from collections import OrderedDict
+from os import fdopen, remove
+from os.path import exists, basename
+from time import time
+from tempfile import mkstemp
+from inspect import getsource
+from logging import getLogger
+from threading import Lock
+from subprocess import Popen, PIPE, CalledProcessError
+from multiprocessing.pool import ThreadPool
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
 
 from topology_docker.node import DockerNode
-from topology_docker.shell import DockerShell, DockerBashShell
+
+from . import ovsdb
+from .shell import LazyShells, OpenSwitchVtyshShell, OpenSwitchBashShell
+from .cache import image_cache
+from .artifacts import incremental_copy, log_follower
+from .diagnostics import diagnostics, BUNDLE as DIAGNOSTICS_BUNDLE
+from .engine import engine
+from .pool import warm_pool
+from .snapshot import snapshots
+from .scheduler import scheduler
+
+
+log = getLogger(__name__)
 
 
 SETUP_SCRIPT = """\
 import logging
 from sys import argv
-from time import sleep
-from os.path import exists, split
+from time import sleep, time
+from select import poll, POLLIN, POLLPRI, POLLERR
+from re import search
+from ctypes import CDLL, Structure, POINTER, c_uint, c_char_p, get_errno
+from os import read, close, listdir
+from os.path import exists, isdir, split, dirname
 from json import dumps, loads
 from shlex import split as shsplit
-from subprocess import check_call, check_output, call
-from socket import AF_UNIX, SOCK_STREAM, socket, gethostname
+from subprocess import Popen, PIPE, check_output, call
+from socket import gethostname
 
 import yaml
 
-config_timeout = 300
+from openswitch_ovsdb import OvsdbClient, updated_rows
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+# Seconds to wait for each stage to complete
+config_timeout = 30.0
+# Fallback polling period when no kernel notification is available
+poll_interval = 0.1
+# Safety net period to re-check a condition even without notifications
+recheck_interval = 1.0
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+CLONE_NEWNET = 0x40000000
+
 swns_netns = '/var/run/netns/swns'
 hwdesc_dir = '/etc/openswitch/hwdesc'
 db_sock = '/var/run/openvswitch/db.sock'
 switchd_pid = '/var/run/openvswitch/ops-switchd.pid'
-query = {
-    'method': 'transact',
-    'params': [
-        'OpenSwitch',
-        {
-            'op': 'select',
-            'table': 'System',
-            'where': [],
-            'columns': ['cur_hw']
-        }
-    ],
-    'id': id(db_sock)
-}
-sock = None
+sysfs_net = '/sys/class/net'
+ports_ready = '/tmp/ops-virt-ports-ready'
+ignored_ifaces = set(['lo', 'oobm', 'bonding_masters'])
+
+# Bring-up timings, in seconds since the script started
+started = monotonic()
+timings = {'started': time(), 'phases': [], 'ports': []}
+
+
+# Record the duration of a bring-up phase
+class phase(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = monotonic() - started
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = monotonic() - started
+        timings['phases'].append({
+            'name': self.name,
+            'start': self.start,
+            'end': end,
+            'duration': end - self.start,
+            'ok': exc_type is None
+        })
+        return False
+
+
+def write_timings():
+    timings['total'] = monotonic() - started
+    shared_dir_tmp = split(__file__)[0]
+    with open('{}/setup_timings.json'.format(shared_dir_tmp), 'w') as fd:
+        fd.write(dumps(timings))
+
+
+# Base readiness notifier. Subclasses provide fileno(), the file descriptor
+# polled for the given events.
+class Waiter(object):
+    events = POLLIN
+
+    def consume(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# Wakes up when entries are created in the deepest existing ancestor of a
+# path (inotify), following the path down as its parent directories appear
+class PathWaiter(Waiter):
+
+    def __init__(self, path):
+        self._libc = CDLL(None, use_errno=True)
+        self._path = path
+        self._watched = set()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(get_errno(), 'inotify_init1() failed')
+        self._arm()
+
+    def _arm(self):
+        parent = dirname(self._path)
+        while parent != '/' and not isdir(parent):
+            parent = dirname(parent)
+        if parent in self._watched:
+            return
+        wd = self._libc.inotify_add_watch(
+            self._fd, parent.encode('utf-8'),
+            IN_CREATE | IN_MOVED_TO | IN_ATTRIB | IN_CLOSE_WRITE
+        )
+        if wd < 0:
+            raise OSError(get_errno(), 'inotify_add_watch() failed')
+        self._watched.add(parent)
+
+    def fileno(self):
+        return self._fd
+
+    def consume(self):
+        # Drain pending events, their content is irrelevant as the condition
+        # is always re-evaluated after waking up
+        try:
+            while read(self._fd, 4096):
+                pass
+        except OSError:
+            pass
+        self._arm()
+
+    def close(self):
+        close(self._fd)
+
+
+# Wakes up when the kernel notifies a change of the UTS hostname
+class HostnameWaiter(Waiter):
+    events = POLLPRI | POLLERR
+
+    def __init__(self):
+        self._fd = open('/proc/sys/kernel/hostname', 'r')
+        self._fd.read()
+
+    def fileno(self):
+        return self._fd.fileno()
+
+    def consume(self):
+        self._fd.seek(0)
+        self._fd.read()
+
+    def close(self):
+        self._fd.close()
+
+
+# Create a waiter, or return None to fall back to polling if the kernel
+# notification facility is not available
+def watch(waiter_cls, *args):
+    try:
+        return waiter_cls(*args)
+    except Exception as e:
+        logging.debug('  - Falling back to polling: {}'.format(e))
+        return None
+
+
+# Block until condition() is true, sleeping on the waiter notifications in
+# between checks. Raise with the given error if the timeout expires first.
+def wait_until(condition, error, waiter=None, timeout=config_timeout):
+    deadline = monotonic() + timeout
+    poller = None
+    if waiter is not None:
+        poller = poll()
+        poller.register(waiter.fileno(), waiter.events)
+
+    try:
+        while not condition():
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise Exception(error)
+            if poller is None:
+                sleep(min(poll_interval, remaining))
+                continue
+            if poller.poll(min(remaining, recheck_interval) * 1000):
+                waiter.consume()
+    finally:
+        if waiter is not None:
+            waiter.close()
+
+
+def wait_for_path(path, error):
+    wait_until(lambda: exists(path), error, watch(PathWaiter, path))
+
+
+class IfNameIndex(Structure):
+    _fields_ = [('if_index', c_uint), ('if_name', c_char_p)]
 
 
-def create_interfaces():
+# List the interfaces of the current network namespace through netlink
+def if_names(libc):
+    libc.if_nameindex.restype = POINTER(IfNameIndex)
+    ifaces = libc.if_nameindex()
+    if not ifaces:
+        raise OSError(get_errno(), 'if_nameindex() failed')
+    try:
+        names = []
+        i = 0
+        while ifaces[i].if_index:
+            names.append(str(ifaces[i].if_name.decode('utf-8')))
+            i += 1
+        return names
+    finally:
+        libc.if_freenameindex(ifaces)
+
+
+# List the interfaces of the given network namespace through a sysfs listing
+def ip_netns_interfaces(netns, error):
+    logging.debug('  - Listing swns interfaces with ip: {}'.format(error))
+    return check_output(shsplit(
+        'ip netns exec {} ls {}'.format(split(netns)[1], sysfs_net)
+    )).decode('utf-8').split()
+
+
+# List the interfaces of the given network namespace by temporarily moving
+# into it, falling back to a listing through ip netns exec
+def netns_interfaces(netns):
+    try:
+        libc = CDLL(None, use_errno=True)
+        own = open('/proc/self/ns/net')
+    except (OSError, IOError) as e:
+        return ip_netns_interfaces(netns, e)
+
+    with own:
+        try:
+            with open(netns) as target:
+                if libc.setns(target.fileno(), CLONE_NEWNET) != 0:
+                    raise OSError(get_errno(), 'setns() failed')
+        except (OSError, IOError) as e:
+            return ip_netns_interfaces(netns, e)
+
+        try:
+            return if_names(libc)
+        except OSError as e:
+            error = e
+        finally:
+            # Never fall back from inside the namespace, everything the script
+            # runs afterwards would run there
+            if libc.setns(own.fileno(), CLONE_NEWNET) != 0:
+                raise Exception(
+                    'Failed to move back from {}: errno {}'.format(
+                        netns, get_errno()
+                    )
+                )
+
+    return ip_netns_interfaces(netns, error)
+
+
+# Run all the given (command, error) pairs in a single ip -batch process, in
+# the given network namespace if any. ip stops at the first failing command,
+# which is mapped back to its error.
+def ip_batch(commands, netns=None):
+    if not commands:
+        return
+    batch = '\\n'.join(command for command, _ in commands) + '\\n'
+    args = ['ip', '-batch', '-']
+    if netns is not None:
+        args = ['ip', 'netns', 'exec', netns] + args
+    proc = Popen(args, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    _, err = proc.communicate(batch.encode('utf-8'))
+    if proc.returncode == 0:
+        return
+
+    err = err.decode('utf-8', 'replace')
+    logging.error(err)
+    failed = search(r'Command failed .*:(\\d+)', err)
+    if failed is None:
+        raise Exception('Failed to create interfaces')
+    raise Exception(commands[int(failed.group(1)) - 1][1])
+
+
+# Hardware ports cached by the host for this image, if any
+def read_cached_hwports():
+    shared_dir_tmp = split(__file__)[0]
+    cached = '{}/hwports.json'.format(shared_dir_tmp)
+    if not exists(cached):
+        return None
+    with open(cached, 'r') as fd:
+        return [str(hwport) for hwport in loads(fd.read())]
+
+
+def read_hwdesc_hwports():
     # Read ports from hardware description
     with open('{}/ports.yaml'.format(hwdesc_dir), 'r') as fd:
-        ports_hwdesc = yaml.load(fd)
+        ports_hwdesc = yaml.load(
+            fd, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        )
     hwports = [str(p['name']) for p in ports_hwdesc['ports']]
 
+    # Hand them to the host so it can cache them for this image
+    shared_dir_tmp = split(__file__)[0]
+    with open('{}/hwports.json'.format(shared_dir_tmp), 'w') as fd:
+        fd.write(dumps(hwports))
+    return hwports
+
+
+# Port mapping computed by the host from the ports of the node, if any
+def read_planned_mapping():
+    shared_dir_tmp = split(__file__)[0]
+    planned = '{}/port_plan.json'.format(shared_dir_tmp)
+    if not exists(planned):
+        return None
+    with open(planned, 'r') as fd:
+        return dict(
+            (str(iface), str(hwport))
+            for iface, hwport in loads(fd.read()).items()
+        )
+
+
+def create_interfaces(hwports, planned=None):
     # Get list of already created ports
-    not_in_swns = check_output(shsplit(
-        'ls /sys/class/net/'
-    )).split()
-    in_swns = check_output(shsplit(
-        'ip netns exec swns ls /sys/class/net/'
-    )).split()
+    not_in_swns = sorted(
+        iface for iface in listdir(sysfs_net)
+        if iface not in ignored_ifaces
+    )
+    in_swns = set(netns_interfaces(swns_netns))
+
+    if len(not_in_swns) > len(hwports):
+        raise Exception(
+            'Failed to map ports with port labels: {} ports requested but '
+            'only {} hardware ports available'.format(
+                len(not_in_swns), len(hwports)
+            )
+        )
+
+    create_cmd_tpl = 'tuntap add dev {hwport} mode tap'
+    netns_cmd_tpl = 'link set dev {hwport} netns swns'
+    rename_int = 'link set dev {portlbl} name {hwport}'
+    delete_cmd_tpl = 'link delete dev {hwport}'
 
-    create_cmd_tpl = 'ip tuntap add dev {hwport} mode tap'
-    netns_cmd_tpl = 'ip link set {hwport} netns swns'
-    rename_int = 'ip link set {portlbl} name {hwport}'
+    deletes = []
+    commands = []
+    ports = []
+    replaced = []
 
-    # Save port mapping information
-    mapping_ports = {}
+    # Map the port with the labels as planned by the host, unless the
+    # interfaces of the container aren't the ones it planned for
+    if planned is not None and set(planned) == set(not_in_swns):
+        mapping_ports = planned
+    else:
+        if planned is not None:
+            logging.warning(
+                'Interfaces {} differ from the ones planned by the host {}, '
+                'mapping them again.'.format(not_in_swns, sorted(planned))
+            )
+        mapping_ports = dict(zip(not_in_swns, hwports))
 
-    # Map the port with the labels
     for portlbl in not_in_swns:
-        if portlbl in ['lo', 'oobm', 'bonding_masters']:
-            continue
-        hwport = hwports.pop(0)
-        mapping_ports[portlbl] = hwport
+        hwport = mapping_ports[portlbl]
         logging.info(
             '  - Port {portlbl} moved to swns netns as {hwport}.'.format(
                 **locals()
             )
         )
-        try:
-            check_call(shsplit(rename_int.format(**locals())))
-            check_call(shsplit(netns_cmd_tpl.format(hwport=hwport)))
-        except:
-            raise Exception('Failed to map ports with port labels')
-
-    # Writting mapping to file
-    shared_dir_tmp = split(__file__)[0]
-    with open('{}/port_mapping.json'.format(shared_dir_tmp), 'w') as json_file:
-        json_file.write(dumps(mapping_ports))
+        error = 'Failed to map ports with port labels'
+        # A converged switch already has a tap for every hardware port
+        if hwport in in_swns:
+            replaced.append(hwport)
+            deletes.append((
+                delete_cmd_tpl.format(hwport=hwport),
+                'Failed to delete tuntap replaced by port'
+            ))
+        commands.append((rename_int.format(**locals()), error))
+        commands.append((netns_cmd_tpl.format(hwport=hwport), error))
+        ports.append({'port': hwport, 'label': portlbl, 'action': 'mapped'})
 
+    # Create the remaining ports
+    mapped = set(mapping_ports.values())
     for hwport in hwports:
+        if hwport in mapped:
+            continue
         if hwport in in_swns:
             logging.info('  - Port {} already present.'.format(hwport))
             continue
 
         logging.info('  - Port {} created.'.format(hwport))
-        try:
-            check_call(shsplit(create_cmd_tpl.format(hwport=hwport)))
-        except:
-            raise Exception('Failed to create tuntap')
+        ports.append({'port': hwport, 'label': None, 'action': 'created'})
+        commands.append((
+            create_cmd_tpl.format(hwport=hwport),
+            'Failed to create tuntap'
+        ))
+        commands.append((
+            netns_cmd_tpl.format(hwport=hwport),
+            'Failed to move port to swns netns'
+        ))
 
-        try:
-            check_call(shsplit(netns_cmd_tpl.format(hwport=hwport)))
-        except:
-            raise Exception('Failed to move port to swns netns')
-    check_call(shsplit('touch /tmp/ops-virt-ports-ready'))
+    # All ports are created by the same ip process, so they share the start
+    # and end timestamps of the batch
+    batch_start = monotonic() - started
+    ip_batch(deletes, netns='swns')
+    ip_batch(commands)
+    batch_end = monotonic() - started
+    for port in ports:
+        port['start'] = batch_start
+        port['end'] = batch_end
+    timings['ports'].extend(ports)
+
+    # Writting mapping to file
+    shared_dir_tmp = split(__file__)[0]
+    with open('{}/port_mapping.json'.format(shared_dir_tmp), 'w') as json_file:
+        json_file.write(dumps(mapping_ports))
+
+    open(ports_ready, 'a').close()
     logging.info('  - Ports readiness notified to the image')
 
-def cur_cfg_is_set():
-    global sock
-    if sock is None:
-        sock = socket(AF_UNIX, SOCK_STREAM)
-        sock.connect(db_sock)
-    sock.send(dumps(query))
-    response = loads(sock.recv(4096))
+    return replaced
+
+
+# Restore the database of the snapshot the container was created from
+def restore_db():
+    shared_dir_tmp = split(__file__)[0]
+    with open('{}/ovsdb.backup'.format(shared_dir_tmp), 'r') as fd:
+        restored = call(
+            ['ovsdb-client', 'restore', 'unix:' + db_sock, 'OpenSwitch'],
+            stdin=fd
+        )
+    if restored != 0:
+        logging.warning('  - Unable to restore DB, waiting for daemons.')
+
+
+# Back up the database of a converged switch to snapshot it
+def backup_db():
+    shared_dir_tmp = split(__file__)[0]
+    with open('{}/ovsdb.backup'.format(shared_dir_tmp), 'w') as fd:
+        backed_up = call(
+            ['ovsdb-client', 'backup', 'unix:' + db_sock, 'OpenSwitch'],
+            stdout=fd
+        )
+    if backed_up != 0:
+        raise Exception('Failed to back up DB.')
+
+
+# Wakes up when the OVSDB server notifies an update of the monitored tables
+class OvsdbWaiter(Waiter):
+
+    def __init__(self, database, requests, callback):
+        self.client = OvsdbClient.connect(db_sock)
+        self.client.monitor(
+            database, requests, callback, timeout=config_timeout
+        )
+
+    def fileno(self):
+        return self.client.fileno()
+
+    def consume(self):
+        self.client.process(timeout=0)
+
+    def close(self):
+        self.client.close()
+
+
+# Track System.cur_hw, which is set to 1 once the hardware is configured
+class CurHwMonitor(OvsdbWaiter):
+
+    def __init__(self):
+        self.cur_hw = None
+        super(CurHwMonitor, self).__init__(
+            'OpenSwitch', {'System': {'columns': ['cur_hw']}}, self._update
+        )
+
+    def _update(self, updates):
+        for _, row in updated_rows(updates, 'System'):
+            self.cur_hw = row.get('cur_hw')
+
+    def is_set(self):
+        return self.cur_hw == 1
+
+
+# Get the /proc state letter of the process in the switchd pid file, or None
+# if the pid file or the process doesn't exist
+def switchd_process_state():
     try:
-        return response['result'][0]['rows'][0]['cur_hw'] == 1
-    except IndexError:
-        return 0
+        with open(switchd_pid, 'r') as fd:
+            pid = int(fd.read().strip())
+        with open('/proc/{}/stat'.format(pid), 'r') as fd:
+            stat = fd.read()
+    except (IOError, OSError, ValueError):
+        return None
+    return stat[stat.rindex(')') + 2]
+
 
+# Non forking equivalent of systemctl is-active: switchd is active once the
+# process in its pid file is alive. If it is dead, systemd is asked (once per
+# wake up) whether the unit failed, so the failure is reported right away
+# instead of waiting for the timeout.
 def ops_switchd_is_active():
-    is_active = call(["systemctl", "is-active", "switchd.service"])
-    return is_active == 0
+    state = switchd_process_state()
+    if state is not None and state not in 'ZXx':
+        return True
+
+    is_failed = call(
+        ['systemctl', 'is-failed', '--quiet', 'switchd.service']
+    )
+    if is_failed == 0:
+        raise Exception('ops-switchd entered the failed state.')
+    return False
+
+
+# Restart switchd, so it opens the ports that replaced the taps it had open
+def restart_switchd():
+    if call(['systemctl', 'restart', 'switchd.service']) != 0:
+        raise Exception('Failed to restart ops-switchd.')
+    wait_until(
+        ops_switchd_is_active,
+        'Timed out while waiting for ops-switchd to restart.',
+        watch(PathWaiter, switchd_pid)
+    )
+
 
 def main():
 
@@ -147,90 +581,265 @@ def main():
         logging.basicConfig(level=logging.DEBUG)
 
     logging.info('Waiting for swns netns...')
-    for i in range(0, config_timeout):
-        if not exists(swns_netns):
-            sleep(0.1)
-        else:
-            break
-    else:
-        raise Exception('Timed out while waiting for swns.')
+    with phase('swns'):
+        wait_for_path(swns_netns, 'Timed out while waiting for swns.')
 
-    logging.info('Waiting for hwdesc directory...')
-    for i in range(0, config_timeout):
-        if not exists(hwdesc_dir):
-            sleep(0.1)
-        else:
-            break
+    hwports = read_cached_hwports()
+    if hwports is None:
+        logging.info('Waiting for hwdesc directory...')
+        with phase('hwdesc'):
+            wait_for_path(
+                hwdesc_dir, 'Timed out while waiting for hwdesc directory.'
+            )
+            hwports = read_hwdesc_hwports()
     else:
-        raise Exception('Timed out while waiting for hwdesc directory.')
+        logging.info('Using {} cached hardware ports.'.format(len(hwports)))
 
     logging.info('Creating interfaces...')
-    create_interfaces()
+    with phase('interfaces'):
+        replaced = create_interfaces(hwports, read_planned_mapping())
+
+    # The switch was already set up by the warm pool
+    if '--ports-only' in argv:
+        if replaced:
+            logging.info('Restarting ops-switchd on the replaced ports...')
+            with phase('switchd_restart'):
+                restart_switchd()
+        return
 
     logging.info('Waiting for DB socket...')
-    for i in range(0, config_timeout):
-        if not exists(db_sock):
-            sleep(0.1)
-        else:
-            break
-    else:
-        raise Exception('Timed out while waiting for DB socket.')
+    with phase('db_sock'):
+        wait_for_path(db_sock, 'Timed out while waiting for DB socket.')
+
+    if '--restore' in argv:
+        logging.info('Restoring DB from snapshot...')
+        with phase('restore'):
+            restore_db()
 
     logging.info('Waiting for switchd pid...')
-    for i in range(0, config_timeout):
-        if not exists(switchd_pid):
-            sleep(0.1)
-        else:
-            break
-    else:
-        raise Exception('Timed out while waiting for switchd pid.')
+    with phase('switchd_pid'):
+        wait_for_path(
+            switchd_pid, 'Timed out while waiting for switchd pid.'
+        )
 
     logging.info('Waiting for ops-switchd to become active...')
-    for i in range(0, config_timeout):
-        if not ops_switchd_is_active():
-            sleep(0.1)
-        else:
-            break
-    else:
-        raise Exception('Timed out while waiting for ops-switchd '
-                        'to become active.')
+    with phase('switchd_active'):
+        wait_until(
+            ops_switchd_is_active,
+            'Timed out while waiting for ops-switchd to become active.',
+            watch(PathWaiter, switchd_pid)
+        )
 
     logging.info('Wait for final hostname...')
-    for i in range(0, config_timeout):
-        if gethostname() != 'switch':
-            sleep(0.1)
-        else:
-            break
-    else:
-        raise Exception('Timed out while waiting for final hostname.')
+    with phase('hostname'):
+        wait_until(
+            lambda: gethostname() == 'switch',
+            'Timed out while waiting for final hostname.',
+            watch(HostnameWaiter)
+        )
 
     logging.info('Waiting for cur_cfg...')
-    for i in range(0, config_timeout):
-        if not cur_cfg_is_set():
-            sleep(0.1)
-        else:
-            break
-    else:
-        raise Exception('Timed out while waiting for cur_cfg.')
+    with phase('cur_cfg'):
+        cur_hw = CurHwMonitor()
+        wait_until(
+            cur_hw.is_set, 'Timed out while waiting for cur_cfg.', cur_hw
+        )
+
+    if '--snapshot' in argv:
+        logging.info('Backing up DB for snapshot...')
+        with phase('backup'):
+            backup_db()
+
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    finally:
+        write_timings()
 """
 
 
-PROCESS_LOG = """
-#!/bin/bash
-ovs-vsctl list Daemon >> /tmp/logs
-echo "Coredump -->" >> /tmp/logs
-coredumpctl gdb >> /tmp/logs
-echo "All the running processes:" >> /tmp/logs
-ps -aef >> /tmp/logs
+class ParallelSetup(object):
+    """
+    Coordinator of the concurrent post build stage of OpenSwitch nodes.
 
-systemctl status >> /tmp/systemctl
-systemctl --state=failed --all >> /tmp/systemctl
+    When enabled, OpenSwitch nodes register themselves when created. Once
+    notified of the post build stage, each node submits its setup to a shared
+    thread pool and returns, so the platform notifies the next node right
+    away. The last registered node to be notified waits for all of the
+    submitted setups to complete and raises an exception aggregating the
+    errors of every failed node.
+
+    :param int max_workers: Maximum number of setups to run at the same time.
+     ``0`` disables the concurrent mode.
+    """
+
+    def __init__(self, max_workers=0):
+        self.max_workers = max_workers
+        self._lock = Lock()
+        self._pool = None
+        self._pool_size = None
+        self._registered = set()
+        self._submitted = []
+
+    def register(self, node):
+        """
+        Register a node to be set up concurrently, if enabled.
+        """
+        if self.max_workers > 0:
+            with self._lock:
+                self._registered.add(node)
+
+    def unregister(self, node):
+        """
+        Stop tracking a node, for example if it was destroyed before the post
+        build stage or the build was aborted before the last node joined.
+        """
+        with self._lock:
+            self._registered.discard(node)
+            self._submitted = [
+                (other, result) for other, result in self._submitted
+                if other is not node
+            ]
+
+    def submit(self, node):
+        """
+        Submit the setup of the given node.
+
+        :rtype: bool
+        :return: False if the node wasn't registered and must be set up
+         synchronously.
+        """
+        retired = None
+        with self._lock:
+            if node not in self._registered:
+                return False
+            self._registered.discard(node)
+
+            if self._pool is None or self._pool_size != self.max_workers:
+                retired = self._pool
+                self._pool = ThreadPool(self.max_workers)
+                self._pool_size = self.max_workers
+                if retired is not None:
+                    retired.close()
+
+            self._submitted.append(
+                (node, self._pool.apply_async(node._setup_system))
+            )
+            submitted = None
+            if not self._registered:
+                submitted = self._submitted
+                self._submitted = []
+
+        # Let the setups still running in the replaced pool finish, so its
+        # threads exit
+        if retired is not None:
+            retired.join()
+        if submitted is not None:
+            self._join(submitted)
+        return True
+
+    def _join(self, submitted):
+        errors = []
+        for node, result in submitted:
+            try:
+                result.get()
+            except Exception as e:
+                errors.append((node, e))
+
+        if errors:
+            raise Exception(
+                'Setup failed for {} OpenSwitch node(s):\n{}'.format(
+                    len(errors), '\n'.join(
+                        '    {}: {}'.format(node.identifier, e)
+                        for node, e in errors
+                    )
+                )
+            )
 
-ovsdb-client dump >> /tmp/ovsdb_dump
-"""
+
+parallel_setup = ParallelSetup()
+
+# Interfaces of the container the setup script doesn't map to hardware ports
+IGNORED_IFACES = set(['lo', 'oobm', 'bonding_masters'])
+
+# Prompt echoed by vtysh -E before each command
+VTYSH_ECHO = regex(r'^[\w.-]+(\([\-a-zA-Z0-9]*\))?# ')
+
+# Commands running a command as each shell, with its output redirected
+CAPTURE_COMMANDS = {
+    'vtysh': 'vtysh -c {quoted}',
+    'bash': '{command}',
+    'bash_swns': 'ip netns exec swns sh -c {quoted}',
+    'vsctl': 'ovs-vsctl {command}',
+}
+
+# Keyword arguments of DockerNode changing the container it creates
+CONTAINER_KWARGS = [
+    'registry', 'network_mode', 'environment', 'privileged', 'tty',
+    'shared_dir_base', 'shared_dir_mount', 'create_host_config_kwargs',
+    'create_container_kwargs'
+]
+
+
+# Attributes of DockerNode describing its container, taken over from the
+# warm pool
+DOCKER_NODE_ATTRIBUTES = [
+    '_pid', '_image', '_registry', '_command', '_hostname', '_environment',
+    '_client', '_container_name', '_shared_dir_base', '_shared_dir_mount',
+    '_shared_dir', '_create_host_config_kwargs', '_create_container_kwargs',
+    '_host_config', '_container_id'
+]
+
+
+def _vtysh_commands(config):
+    # Configuration lines, and the (line index, command) of the lines that
+    # are neither blank nor comments
+    if hasattr(config, 'splitlines'):
+        lines = config.splitlines()
+    else:
+        lines = list(config)
+    commands = [
+        (index, line.strip()) for index, line in enumerate(lines)
+        if line.strip() and not line.strip().startswith('!')
+    ]
+    return lines, commands
+
+
+def _vtysh_results(lines, commands, args, output):
+    # Split the output of vtysh -E at the echo of each argument, and map the
+    # error messages back to the configuration lines
+    outputs = []
+    for line in output.splitlines():
+        executed = len(outputs)
+        if executed < len(args) and VTYSH_ECHO.match(line) and \
+                line.rstrip().endswith('# {}'.format(args[executed])):
+            outputs.append([])
+        elif outputs:
+            outputs[-1].append(line.strip())
+    outputs = outputs[len(args) - len(commands):]
+
+    results = [None] * len(lines)
+    for position, (index, _) in enumerate(commands):
+        if position >= len(outputs):
+            results[index] = 'Not applied, a previous line failed'
+            continue
+        errors = [line for line in outputs[position] if line[:1] == '%']
+        if errors:
+            results[index] = '\n'.join(errors)
+    return results
+
+
+def configure_parallel_setup(max_workers):
+    """
+    Enable or disable the concurrent post build stage of OpenSwitch nodes.
+
+    Only affects nodes created after this call.
+
+    :param int max_workers: Maximum number of nodes to set up at the same
+     time. ``0`` to set up each node synchronously when notified.
+    """
+    parallel_setup.max_workers = max_workers
 
 
 class OpenSwitchNode(DockerNode):
@@ -241,6 +850,35 @@ class OpenSwitchNode(DockerNode):
     shell (in addition to bash).
 
     See :class:`topology_docker.node.DockerNode`.
+
+    :var dict setup_timings: Timings of the last run of the setup script, or
+     ``None`` if it didn't run yet. In seconds since the script started, it
+     has the keys ``started`` (wall clock epoch), ``total``, ``phases`` (list
+     of dictionaries with keys ``name``, ``start``, ``end``, ``duration`` and
+     ``ok``, in execution order) and ``ports`` (list of dictionaries with keys
+     ``port``, ``label``, ``action``, ``start`` and ``end``).
+    :var list hwports: Hardware ports of the image, as listed in its hardware
+     description, or ``None`` if they aren't known yet. They are cached per
+     image after the first setup, see :mod:`topology_docker_openswitch.cache`.
+
+    If snapshots are enabled, see
+    :func:`topology_docker_openswitch.snapshot.configure_snapshots`, the node
+    starts from the snapshot of its image, if any, or takes it once converged.
+
+    If the warm pool is enabled, see
+    :func:`topology_docker_openswitch.pool.configure_warm_pool`, the node
+    takes over a container already booted and converged with the same
+    configuration, if one is ready, and its setup only maps its ports.
+
+    The container is pinned to CPUs and its memory limited as configured
+    with :func:`topology_docker_openswitch.scheduler.configure_scheduler`,
+    unless overridden with the ``cpus`` and ``memory`` options of the node.
+    Explicit ``create_host_config_kwargs`` take precedence over both.
+
+    :param int cpus: CPUs to pin the container to, ``0`` to leave it
+     unpinned.
+    :param memory: Memory limit of the container, in bytes or as a Docker
+     memory string like ``512m``.
     """
 
     def __init__(
@@ -248,53 +886,494 @@ class OpenSwitchNode(DockerNode):
             image='topology/ops:latest', binds=None,
             **kwargs):
 
-        # Add binded directories
-        container_binds = [
-            '/dev/log:/dev/log',
-            '/sys/fs/cgroup:/sys/fs/cgroup:ro'
-        ]
-        if binds is not None:
-            container_binds.append(binds)
+        # Nodes booted in background to fill the warm pool
+        pool_member = kwargs.pop('_pool_member', False)
+
+        # Snapshot the container is created from, see _autopull()
+        self._snapshot = None
 
-        super(OpenSwitchNode, self).__init__(
-            identifier, image=image, command='/sbin/init',
-            binds=';'.join(container_binds), hostname='switch',
-            **kwargs
+        # When the container was created, to find its lines in the host logs
+        self._created_at = time()
+
+        cpus = kwargs.pop('cpus', None)
+        memory = kwargs.pop('memory', None)
+
+        # Take over a container of the warm pool, if any is ready, instead of
+        # creating one
+        self._pool_kwargs = dict(
+            (key, kwargs[key]) for key in CONTAINER_KWARGS if key in kwargs
+        )
+        self._pool_kwargs.update(
+            image=image, binds=binds, cpus=cpus, memory=memory
         )
+        self._pool_key = repr(sorted(self._pool_kwargs.items()))
+        self._pooled = False
+
+        pooled = None
+        if not pool_member:
+            pooled = warm_pool.acquire(
+                self._pool_key, self._boot_pool_member
+            )
+
+        if pooled is not None:
+            self._adopt(identifier, pooled, kwargs)
+        else:
+            self._create_container(
+                identifier, image, binds, cpus, memory, kwargs
+            )
+
+        # Shells are created on first use
+        self._shells = LazyShells(self._shells)
+        self._testlog = None
 
         # Add vtysh (default) shell
-        # FIXME: Create a subclass to handle better the particularities of
-        # vtysh, like prompt setup etc.
-        self._shells['vtysh'] = DockerShell(
-            self.container_id, 'vtysh', '(^|\n)switch(\([\-a-zA-Z0-9]*\))?#'
-        )
+        self._add_shell('vtysh', OpenSwitchVtyshShell)
 
         # Add bash shells
         initial_prompt = '(^|\n).*[#$] '
 
-        self._shells['bash'] = DockerBashShell(
-            self.container_id, 'bash',
+        self._add_shell(
+            'bash', OpenSwitchBashShell, 'bash',
             initial_prompt=initial_prompt
         )
-        self._shells['bash_swns'] = DockerBashShell(
-            self.container_id, 'ip netns exec swns bash',
+        self._add_shell(
+            'bash_swns', OpenSwitchBashShell, 'ip netns exec swns bash',
             initial_prompt=initial_prompt
         )
-        self._shells['vsctl'] = DockerBashShell(
-            self.container_id, 'bash',
+        self._add_shell(
+            'vsctl', OpenSwitchBashShell, 'bash',
             initial_prompt=initial_prompt,
             prefix='ovs-vsctl ', timeout=60
         )
 
+        self.setup_timings = None
+        self.hwports = pooled.hwports if pooled is not None else None
+
+        # Network namespace of each interface, None for the root namespace
+        self._port_netns = {}
+
+        # Persistent JSON-RPC connection to the OVSDB server
+        self._ovsdb = None
+        self._ovsdb_lock = Lock()
+
+        if not pool_member:
+            parallel_setup.register(self)
+
+    def start(self):
+        """
+        Start the docker node.
+
+        A container taken over from the warm pool is already running.
+
+        See :meth:`DockerNode.start` for more information.
+        """
+        if not self._pooled:
+            super(OpenSwitchNode, self).start()
+            return
+
+        self._pid = self._client.inspect_container(
+            self._container_id
+        )['State']['Pid']
+
+    def _add_shell(self, name, cls, *args, **kwargs):
+        """
+        Add a shell created the first time it is used.
+
+        :param str name: Name of the shell.
+        :param cls: Class of the shell.
+        """
+        def factory():
+            shell = cls(self.container_id, *args, **kwargs)
+            if self._testlog is not None:
+                shell._testlog = self._testlog
+            return shell
+
+        self._shells.lazy(name, factory)
+
+    def _set_test_log(self, log):
+        # Don't create the shells just to set their test log
+        self._testlog = log
+        for shell in self._shells.created():
+            shell._testlog = log
+
     def notify_post_build(self):
         """
         Get notified that the post build stage of the topology build was
         reached.
 
+        If the concurrent setup is enabled, see
+        :func:`configure_parallel_setup`, the setup of this node runs in
+        background and the last OpenSwitch node notified waits for all of
+        them.
+
         See :meth:`DockerNode.notify_post_build` for more information.
         """
         super(OpenSwitchNode, self).notify_post_build()
-        self._setup_system()
+        if not parallel_setup.submit(self):
+            self._setup_system()
+
+    def stop(self):
+        """
+        Request container to stop.
+
+        See :meth:`DockerNode.stop` for more information.
+        """
+        parallel_setup.unregister(self)
+        log_follower.stop(self)
+        incremental_copy.forget(self.shared_dir)
+        self._close_ovsdb()
+        try:
+            super(OpenSwitchNode, self).stop()
+        finally:
+            if self._placement is not None:
+                self._placement.release()
+
+    def ovsdb_transact(self, *operations, **kwargs):
+        """
+        Execute a transaction in the ``OpenSwitch`` database.
+
+        Unlike the ``vsctl`` shell, requests go through a persistent
+        JSON-RPC connection to the OVSDB server, relayed by a process
+        executed in the container the first time it's needed.
+
+        :param operations: The transaction operations, see RFC 7047.
+        :param float timeout: Seconds to wait for the reply.
+        :rtype: list
+        :return: The result of each operation.
+        """
+        timeout = kwargs.get('timeout', 60)
+
+        with self._ovsdb_lock:
+            if self._ovsdb is None:
+                self._ovsdb = ovsdb.OvsdbClient(ovsdb.PipeStream(Popen(
+                    self._ovsdb_relay_command(), stdin=PIPE, stdout=PIPE
+                )))
+            try:
+                return self._ovsdb.transact(
+                    'OpenSwitch', *operations, timeout=timeout
+                )
+            except ovsdb.OvsdbError as e:
+                # The server rejected the transaction, the connection is fine
+                if isinstance(e.args[0], list):
+                    raise
+                self._close_ovsdb(locked=True)
+                raise
+            except (IOError, OSError):
+                # The relay exited, the next call starts a new one
+                self._close_ovsdb(locked=True)
+                raise
+
+    def ovsdb_select(self, table, columns=None, where=(), **kwargs):
+        """
+        Select rows of a table of the ``OpenSwitch`` database.
+
+        See :meth:`ovsdb_transact`.
+
+        :param str table: Name of the table.
+        :param list columns: Columns to fetch, all of them if ``None``.
+        :param list where: Conditions the rows must match, like
+         ``[['name', '==', '1']]``.
+        :rtype: list
+        :return: The selected rows.
+        """
+        operation = {'op': 'select', 'table': table, 'where': list(where)}
+        if columns is not None:
+            operation['columns'] = list(columns)
+        return self.ovsdb_transact(operation, **kwargs)[0]['rows']
+
+    def ovsdb_set(self, table, records, key='name', **kwargs):
+        """
+        Set columns of several rows of the ``OpenSwitch`` database in a single
+        transaction, like ``ovs-vsctl set`` does for one row.
+
+        For example, to enable 48 interfaces in one round trip:
+
+        ::
+
+            switch.ovsdb_set('Interface', dict(
+                (str(port), {'user_config:admin': 'up'})
+                for port in range(1, 49)
+            ))
+
+        See :meth:`ovsdb_transact`.
+
+        :param str table: Name of the table.
+        :param dict records: Mapping of the values of the ``key`` column of
+         the rows to set to mappings of columns to their new values. Like
+         with ``ovs-vsctl``, ``column:key`` sets a single key of a map
+         column. Values are in the OVSDB JSON notation.
+        :param str key: Column identifying the rows.
+        :raises OvsdbError: If any of the rows doesn't exist, in which case
+         none of them is changed.
+        """
+        operations = []
+        for record, columns in sorted(records.items()):
+            where = [[key, '==', record]]
+
+            # Abort the whole transaction if the row doesn't exist
+            operations.append({
+                'op': 'wait', 'table': table, 'where': where,
+                'columns': [key], 'until': '!=', 'rows': [], 'timeout': 0
+            })
+
+            row = {}
+            for column, value in sorted(columns.items()):
+                if ':' not in column:
+                    row[column] = value
+                    continue
+                column, map_key = column.split(':', 1)
+                operations.append({
+                    'op': 'mutate', 'table': table, 'where': where,
+                    'mutations': [
+                        [column, 'delete', ['set', [map_key]]],
+                        [column, 'insert', ['map', [[map_key, value]]]]
+                    ]
+                })
+            if row:
+                operations.append({
+                    'op': 'update', 'table': table, 'where': where,
+                    'row': row
+                })
+
+        try:
+            self.ovsdb_transact(*operations, **kwargs)
+        except ovsdb.OvsdbError:
+            existing = set(
+                row[key] for row in self.ovsdb_select(table, [key], **kwargs)
+            )
+            missing = sorted(set(records) - existing)
+            if missing:
+                raise ovsdb.OvsdbError('No {} with {} {}'.format(
+                    table, key, ', '.join(missing)
+                ))
+            raise
+
+    def vtysh_config(self, config, configure=True):
+        """
+        Apply a block of vtysh configuration with a single command execution.
+
+        The ``vtysh`` shell waits for the prompt after every line. Instead,
+        the whole block is written to the shared directory and run by a
+        single ``vtysh`` process, echoing every command (``-E``) so its output
+        is mapped back to the input line.
+
+        ::
+
+            errors = switch.vtysh_config('''
+                interface 7
+                    ip address 10.0.0.1/24
+                    no shutdown
+            ''')
+            assert not any(errors)
+
+        :param config: Configuration lines, as a string or a sequence of
+         strings. Blank lines and ``!`` comments are ignored.
+        :param bool configure: Enter the configuration mode first.
+        :rtype: list
+        :return: One entry per input line, ``None`` if the line was applied
+         or ignored and the error message otherwise. vtysh stops at the first
+         failed line, so the lines after it are reported as not applied.
+        """
+        lines, commands = _vtysh_commands(config)
+        args = (['configure terminal'] if configure else []) + [
+            command for _, command in commands
+        ]
+
+        # A script per call, concurrent calls must not overwrite each other
+        fd, script = mkstemp(
+            prefix='vtysh_config_', suffix='.sh', dir=self.shared_dir
+        )
+        try:
+            with fdopen(fd, 'w') as script_fd:
+                script_fd.write('vtysh -E {}\n'.format(' '.join(
+                    '-c {}'.format(quote(arg)) for arg in args
+                )))
+
+            try:
+                output = self._docker_exec('sh {}/{}'.format(
+                    self.shared_dir_mount, basename(script)
+                ))
+            except CalledProcessError as e:
+                output = e.output or ''
+                if isinstance(output, bytes):
+                    output = output.decode('utf-8')
+        finally:
+            remove(script)
+
+        return _vtysh_results(lines, commands, args, output)
+
+    def capture_output(self, command, filename, shell='vtysh'):
+        """
+        Run a command and stream its output to a file in the shared
+        directory.
+
+        The shells hold the whole output of a command in memory, which is
+        wasteful for large outputs like the ones of ``show tech`` or
+        ``ovsdb-client dump``. Here the output is redirected to the file
+        inside the container instead.
+
+        :param str command: Command to run.
+        :param str filename: Name of the file, relative to the shared
+         directory.
+        :param str shell: Shell to run the command as, one of ``vtysh``,
+         ``bash``, ``bash_swns`` or ``vsctl``.
+        :rtype: str
+        :return: Path to the file in the host.
+        """
+        if shell not in CAPTURE_COMMANDS:
+            raise Exception('Unknown shell {}'.format(shell))
+
+        self._docker_exec('sh -c {}'.format(quote('{} > {}/{} 2>&1'.format(
+            CAPTURE_COMMANDS[shell].format(
+                command=command, quoted=quote(command)
+            ),
+            self.shared_dir_mount, filename
+        ))))
+        return '{}/{}'.format(self.shared_dir, filename)
+
+    def _docker_exec(self, command):
+        """
+        Execute a command inside the container, through the Docker Engine
+        API shared by all nodes.
+
+        See :class:`topology_docker_openswitch.engine.DockerEngine`.
+
+        :param str command: The command to execute.
+        """
+        log.debug('[{}]._docker_exec(\'{}\') ::'.format(
+            self._container_id, command
+        ))
+        response = engine.execute(self._container_id, command)
+        log.debug(response)
+        return response
+
+    def _docker_spawn(self, command):
+        """
+        Execute a command inside the container, leaving it running in
+        background.
+
+        :param str command: The command to execute.
+        """
+        log.debug('[{}]._docker_spawn(\'{}\')'.format(
+            self._container_id, command
+        ))
+        engine.execute(self._container_id, command, detach=True)
+
+    def _ovsdb_relay_command(self):
+        return [
+            'docker', 'exec', '-i', self.container_id,
+            'python', '{}/openswitch_ovsdb.py'.format(self.shared_dir_mount),
+            ovsdb.DB_SOCK
+        ]
+
+    def _close_ovsdb(self, locked=False):
+        if not locked:
+            with self._ovsdb_lock:
+                return self._close_ovsdb(locked=True)
+
+        if self._ovsdb is not None:
+            try:
+                self._ovsdb.close()
+            except Exception:
+                log.exception('Unable to close the OVSDB relay')
+            self._ovsdb = None
+
+    def _autopull(self):
+        """
+        Pull the image if necessary, and create the container from its
+        snapshot if any.
+
+        See :meth:`DockerNode._autopull` for more information.
+        """
+        super(OpenSwitchNode, self)._autopull()
+
+        self._snapshot = snapshots.lookup(self._client, self._image)
+        if self._snapshot is not None:
+            log.info('OpenSwitch node {} starts from snapshot {}'.format(
+                self.identifier, self._snapshot['image']
+            ))
+            self._image = self._snapshot['image']
+
+    def _create_container(self, identifier, image, binds, cpus, memory,
+                          kwargs):
+        """
+        Create the container of the node, placed on the host by the
+        scheduler.
+        """
+        self._placement = scheduler.place(cpus, memory)
+        container_kwargs = kwargs
+        if self._placement is not None:
+            host_config = self._placement.host_config_kwargs()
+            host_config.update(kwargs.get('create_host_config_kwargs') or {})
+            container_kwargs = dict(
+                kwargs, create_host_config_kwargs=host_config
+            )
+
+        # Add binded directories
+        container_binds = [
+            '/dev/log:/dev/log',
+            '/sys/fs/cgroup:/sys/fs/cgroup:ro'
+        ]
+        if binds is not None:
+            container_binds.append(binds)
+
+        try:
+            super(OpenSwitchNode, self).__init__(
+                identifier, image=image, command='/sbin/init',
+                binds=';'.join(container_binds), hostname='switch',
+                **container_kwargs
+            )
+        except Exception:
+            if self._placement is not None:
+                self._placement.release()
+            raise
+
+    def _adopt(self, identifier, pooled, kwargs):
+        """
+        Take over the container of a node of the warm pool.
+
+        The container and its shared directory were created by
+        :class:`DockerNode` for the pooled node, so only the base node is
+        initialized and the container state is taken from the pooled node.
+        """
+        metadata = dict(
+            (key, value) for key, value in kwargs.items()
+            if key not in CONTAINER_KWARGS
+        )
+        super(DockerNode, self).__init__(identifier, **metadata)
+
+        for attribute in DOCKER_NODE_ATTRIBUTES:
+            setattr(self, attribute, getattr(pooled, attribute))
+        self._created_at = pooled._created_at
+        self._placement = pooled._placement
+        self._pooled = True
+
+        # The pooled node is dropped, its connections aren't. The follower of
+        # its log is kept, it is found by the shared directory taken over.
+        pooled._close_ovsdb()
+
+        log.info('OpenSwitch node {} took over warm container {}'.format(
+            self.identifier, self._container_name
+        ))
+
+    def _boot_pool_member(self):
+        """
+        Create, start and set up a node with the same container
+        configuration as this one, to be kept in the warm pool.
+        """
+        node = self._create_pool_member()
+        try:
+            node.start()
+            node._setup_system()
+        except Exception:
+            node.stop()
+            raise
+        return node
+
+    def _create_pool_member(self):
+        return type(self)(
+            'warm_pool', _pool_member=True, **self._pool_kwargs
+        )
 
     def _setup_system(self):
         """
@@ -303,14 +1382,48 @@ class OpenSwitchNode(DockerNode):
         #. Wait for daemons to converge.
         #. Assign an interface to each port label.
         #. Create remaining interfaces.
+
+        On a container taken over from the warm pool, the daemons already
+        converged and only the ports are mapped.
         """
 
-        # Write the log gathering script
-        process_log = '{}/process_log.sh'.format(self.shared_dir)
-        with open(process_log, "w") as fd:
-            fd.write(PROCESS_LOG)
-        check_call('chmod 755 {}/process_log.sh'.format(self.shared_dir),
-                   shell=True)
+        # Follow the container log from now on, to slice it per test
+        log_follower.start(self)
+
+        # Write the OVSDB client used by the setup script
+        ovsdb_client = '{}/openswitch_ovsdb.py'.format(self.shared_dir)
+        with open(ovsdb_client, 'w') as fd:
+            fd.write(getsource(ovsdb))
+
+        # Hand the hardware ports cached for this image to the setup script,
+        # so it doesn't need to wait for and parse the hardware description
+        image_id = self._client.inspect_image(image=self._image)['Id']
+        hwports_file = '{}/hwports.json'.format(self.shared_dir)
+        self.hwports = image_cache.get(image_id, 'hwports')
+        if self.hwports is not None:
+            with open(hwports_file, 'w') as fd:
+                fd.write(dumps(self.hwports))
+
+            # With the hardware ports known, the ports are mapped before the
+            # setup script waits for the daemons
+            planned = self._map_ports(self.hwports)
+            with open('{}/port_plan.json'.format(self.shared_dir), 'w') as fd:
+                fd.write(dumps(planned))
+
+        # Restore the database of the snapshot, or take the snapshot of the
+        # image if no other node is taking it
+        args = ['-d']
+        snapshot_claimed = False
+        if self._pooled:
+            args.append('--ports-only')
+        elif self._snapshot is not None:
+            backup = '{}/ovsdb.backup'.format(self.shared_dir)
+            with open(backup, 'w') as fd:
+                fd.write(self._snapshot['backup'])
+            args.append('--restore')
+        elif snapshots.claim(image_id):
+            snapshot_claimed = True
+            args.append('--snapshot')
 
         # Write and execute setup script
         setup_script = '{}/openswitch_setup.py'.format(self.shared_dir)
@@ -318,35 +1431,153 @@ class OpenSwitchNode(DockerNode):
             fd.write(SETUP_SCRIPT)
 
         try:
-            self._docker_exec('python {}/openswitch_setup.py -d'
-                              .format(self.shared_dir_mount))
+            # Only mapping the ports of a warm container doesn't converge it
+            if self._pooled:
+                self._run_setup_script(args)
+            else:
+                with scheduler.setup():
+                    self._run_setup_script(args)
         except Exception as e:
-            check_call('touch {}/logs'.format(self.shared_dir), shell=True)
-            check_call('chmod 766 {}/logs'.format(self.shared_dir),
-                       shell=True)
-            self._docker_exec('/bin/bash {}/process_log.sh'
-                              .format(self.shared_dir_mount))
-            check_call(
-                'tail -n 2000 /var/log/syslog > {}/syslog'.format(
-                    self.shared_dir
-                ), shell=True)
-            check_call(
-                'docker ps -a >> {}/logs'.format(self.shared_dir),
-                shell=True
-            )
-            check_call('cat {}/logs'.format(self.shared_dir), shell=True)
+            if snapshot_claimed:
+                snapshots.release(image_id)
+            results = diagnostics.collect(self, e)
+            summary = []
+            for name, result in results.items():
+                if 'error' in result:
+                    summary.append('  {}: {}'.format(name, result['error']))
+                else:
+                    summary.append('  {}: exit status {}'.format(
+                        name, result['status']
+                    ))
+            log.error('Setup of {} failed, diagnostics in {}/{}:\n{}'.format(
+                self.identifier, self.shared_dir, DIAGNOSTICS_BUNDLE,
+                '\n'.join(summary)
+            ))
             raise e
+        finally:
+            self._load_setup_timings()
+
+        # Cache the hardware ports read by the setup script
+        if self.hwports is None:
+            with open(hwports_file, 'r') as fd:
+                self.hwports = loads(fd.read())
+            image_cache.set(image_id, 'hwports', self.hwports)
+
+        if snapshot_claimed:
+            self._take_snapshot(image_id)
 
         # Read back port mapping
         port_mapping = '{}/port_mapping.json'.format(self.shared_dir)
         with open(port_mapping, 'r') as fd:
             mappings = loads(fd.read())
 
+        # Every mapped port was moved to the swns namespace
+        self._port_netns.clear()
+        for hwport in mappings.values():
+            self._port_netns[hwport] = 'swns'
+
         if hasattr(self, 'ports'):
             self.ports.update(mappings)
             return
         self.ports = mappings
 
+    def _run_setup_script(self, args):
+        self._docker_exec('python {}/openswitch_setup.py {}'.format(
+            self.shared_dir_mount, ' '.join(args)
+        ))
+
+    def _take_snapshot(self, image_id):
+        """
+        Snapshot this converged node for the next nodes of its image.
+
+        A failed snapshot isn't fatal, the next node of the image tries again.
+        """
+        try:
+            with open('{}/ovsdb.backup'.format(self.shared_dir), 'r') as fd:
+                backup = fd.read()
+
+            # Containers started from the snapshot must wait for their own
+            # ports to be ready
+            self._docker_exec('rm -f /tmp/ops-virt-ports-ready')
+            try:
+                snapshots.take(
+                    self._client, self._container_id, image_id, backup
+                )
+            finally:
+                self._docker_exec('touch /tmp/ops-virt-ports-ready')
+        except Exception:
+            log.exception('Unable to snapshot OpenSwitch node {}'.format(
+                self.identifier
+            ))
+            snapshots.release(image_id)
+
+    def _map_ports(self, hwports):
+        """
+        Map the interfaces of the ports of this node to hardware ports, the
+        same way the setup script does.
+
+        :param list hwports: Hardware ports of the image.
+        :rtype: dict
+        :return: Mapping of interface names to hardware ports.
+        """
+        ifaces = sorted(
+            set(getattr(self, 'ports', {}).values()) - IGNORED_IFACES
+        )
+        if len(ifaces) > len(hwports):
+            raise Exception(
+                'Failed to map ports with port labels: {} ports requested but '
+                'only {} hardware ports available'.format(
+                    len(ifaces), len(hwports)
+                )
+            )
+        return dict(zip(ifaces, hwports))
+
+    def _load_setup_timings(self):
+        """
+        Read back the timings recorded by the setup script and log a summary.
+        """
+        timings_file = '{}/setup_timings.json'.format(self.shared_dir)
+        if not exists(timings_file):
+            return
+
+        with open(timings_file, 'r') as fd:
+            self.setup_timings = loads(fd.read())
+
+        log.info(
+            'OpenSwitch node {} setup took {:.2f}s ({} ports): {}'.format(
+                self.identifier,
+                self.setup_timings['total'],
+                len(self.setup_timings['ports']),
+                ', '.join(
+                    '{name} {duration:.2f}s{failed}'.format(
+                        failed='' if phase['ok'] else ' (failed)', **phase
+                    ) for phase in self.setup_timings['phases']
+                )
+            )
+        )
+
+    def disable(self):
+        """
+        Disable the node.
+
+        See :meth:`DockerNode.disable` for more information.
+        """
+        self._check_ports_state(
+            self.set_ports_state(dict.fromkeys(self.ports, False))
+        )
+        self._client.pause(self._container_id)
+
+    def enable(self):
+        """
+        Enable the node.
+
+        See :meth:`DockerNode.enable` for more information.
+        """
+        self._client.unpause(self._container_id)
+        self._check_ports_state(
+            self.set_ports_state(dict.fromkeys(self.ports, True))
+        )
+
     def set_port_state(self, portlbl, state):
         """
         Set the given port label to the given state.
@@ -356,11 +1587,133 @@ class OpenSwitchNode(DockerNode):
         iface = self.ports[portlbl]
         state = 'up' if state else 'down'
 
-        not_in_netns = self._docker_exec('ls /sys/class/net/').split()
-        prefix = '' if iface in not_in_netns else 'ip netns exec swns'
+        netns = self._get_ports_netns([iface])[iface]
+        try:
+            self._set_iface_state(iface, netns, state)
+        except Exception:
+            # The interface was moved behind our back, look for it again
+            del self._port_netns[iface]
+            moved = self._get_ports_netns([iface])[iface]
+            if moved == netns:
+                raise
+            self._set_iface_state(iface, moved, state)
+
+    def set_ports_state(self, states):
+        """
+        Set the state of several ports with a single command execution.
+
+        :param dict states: Mapping of port labels to their new state, True
+         for up and False for down.
+        :rtype: dict
+        :return: Mapping of the given port labels to ``None`` if their state
+         was set, or the error message otherwise.
+        """
+        ifaces = dict(
+            (portlbl, self.ports[portlbl]) for portlbl in states
+        )
+        netns = self._get_ports_netns(ifaces.values())
+
+        # One ip batch file per namespace, carrying on after failures
+        batches = OrderedDict([(None, []), ('swns', [])])
+        for portlbl in sorted(states):
+            batches[netns[ifaces[portlbl]]].append(portlbl)
+
+        commands = []
+        files = {}
+        scripts = []
+        try:
+            for namespace, portlbls in batches.items():
+                if not portlbls:
+                    continue
+
+                # A batch file per call, concurrent calls must not overwrite
+                # each other
+                fd, script = mkstemp(
+                    prefix='port_state_{}_'.format(namespace or 'root'),
+                    suffix='.batch', dir=self.shared_dir
+                )
+                scripts.append(script)
+                with fdopen(fd, 'w') as script_fd:
+                    for portlbl in portlbls:
+                        script_fd.write('link set dev {} {}\n'.format(
+                            ifaces[portlbl],
+                            'up' if states[portlbl] else 'down'
+                        ))
+
+                batch = '{}/{}'.format(
+                    self.shared_dir_mount, basename(script)
+                )
+                files[batch] = portlbls
+                commands.append('{}ip -force -batch {} 2>&1'.format(
+                    '' if namespace is None else
+                    'ip netns exec {} '.format(namespace),
+                    batch
+                ))
+
+            results = dict.fromkeys(states)
+            if not commands:
+                return results
 
+            output = self._docker_exec(
+                'sh -c "{}; true"'.format('; '.join(commands))
+            )
+        finally:
+            for script in scripts:
+                remove(script)
+
+        # ip reports the errors of a command before the line locating it
+        errors = []
+        for line in output.splitlines():
+            failed = search(r'Command failed (\S+):(\d+)$', line)
+            if failed is None:
+                errors.append(line.strip())
+                continue
+
+            portlbl = files[failed.group(1)][int(failed.group(2)) - 1]
+            results[portlbl] = '\n'.join(
+                error for error in errors if error
+            ) or line
+            errors = []
+            self._port_netns.pop(ifaces[portlbl], None)
+
+        return results
+
+    def _get_ports_netns(self, ifaces):
+        """
+        Get the network namespace of the given interfaces, listing the
+        interfaces of the root namespace if any of them isn't known yet.
+
+        :rtype: dict
+        :return: Mapping of interfaces to their network namespace, ``None``
+         for the root namespace.
+        """
+        if any(iface not in self._port_netns for iface in ifaces):
+            not_in_netns = self._docker_exec('ls /sys/class/net/').split()
+            for iface in ifaces:
+                self._port_netns[iface] = (
+                    None if iface in not_in_netns else 'swns'
+                )
+        return dict((iface, self._port_netns[iface]) for iface in ifaces)
+
+    def _set_iface_state(self, iface, netns, state):
+        prefix = '' if netns is None else 'ip netns exec {}'.format(netns)
         command = '{prefix} ip link set dev {iface} {state}'.format(**locals())
         self._docker_exec(command)
 
+    def _check_ports_state(self, results):
+        failed = dict(
+            (portlbl, error) for portlbl, error in results.items()
+            if error is not None
+        )
+        if failed:
+            raise Exception(
+                'Failed to set the state of {} port(s):\n{}'.format(
+                    len(failed), '\n'.join(
+                        '    {}: {}'.format(portlbl, error)
+                        for portlbl, error in sorted(failed.items())
+                    )
+                )
+            )
+
 
-__all__ = ['OpenSwitchNode']
+__all__ = ['OpenSwitchNode', 'ParallelSetup', 'configure_parallel_setup']
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Minimal OVSDB JSON-RPC client.
+
+This module only depends on the standard library and is compatible with the
+Python interpreter shipped in the OpenSwitch image, as it is copied into the
+container next to the setup script and used there too. Run as a script in
+the container, it relays its standard input and output to the OVSDB server
+socket, so clients on the host can talk to the server through
+``docker exec -i``, see :class:`PipeStream`.
+
+See RFC 7047 for the protocol specification.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from re import compile as regex
+from json import dumps, loads
+from select import select
+from sys import argv, stdin, stdout
+from os import read, write
+from codecs import getincrementaldecoder
+from socket import AF_UNIX, SOCK_STREAM, socket
+
+
+DB_SOCK = '/var/run/openvswitch/db.sock'
+
+_STRUCTURE = regex(r'["{}\[\]]')
+_STRING = regex(r'["\\]')
+
+
+class OvsdbError(Exception):
+    """
+    Error reported by the OVSDB server or while talking to it.
+    """
+
+
+class JsonStreamDecoder(object):
+    """
+    Incremental decoder that splits a stream of concatenated JSON objects.
+
+    Data may be fed in chunks of any size, split at any byte. Only structural
+    characters are scanned, so decoding is linear in the size of the stream.
+
+    ::
+
+        >>> decoder = JsonStreamDecoder()
+        >>> decoder.feed(b'{"id": 1, "result": ["a}"]}{"id"') == [
+        ...     {'id': 1, 'result': ['a}']}
+        ... ]
+        True
+        >>> decoder.feed(b': 2}') == [{'id': 2}]
+        True
+    """
+
+    def __init__(self):
+        self._utf8 = getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, data):
+        """
+        Feed a chunk of data to the decoder.
+
+        :param bytes data: Next chunk of the stream.
+        :rtype: list
+        :return: The list of JSON objects completed by this chunk.
+        """
+        buf = self._buffer + self._utf8.decode(data)
+        pos = self._pos
+        messages = []
+
+        while True:
+            scanner = _STRING if self._in_string else _STRUCTURE
+            match = scanner.search(buf, pos)
+            if match is None:
+                pos = len(buf)
+                break
+
+            char = match.group()
+            pos = match.end()
+
+            if char == '\\':
+                # Escaped character not received yet, re-scan next time
+                if pos >= len(buf):
+                    pos -= 1
+                    break
+                pos += 1
+            elif char == '"':
+                self._in_string = not self._in_string
+            elif char in '{[':
+                if self._depth == 0:
+                    self._start = match.start()
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    messages.append(loads(buf[self._start:pos]))
+                    buf = buf[pos:]
+                    pos = 0
+                    self._start = None
+
+        # Drop inter-message whitespace
+        if self._start is None:
+            buf = ''
+            pos = 0
+
+        self._buffer = buf
+        self._pos = pos
+        return messages
+
+
+class PipeStream(object):
+    """
+    Socket-like stream over the standard input and output of a process, for
+    example a relay to the OVSDB server run with ``docker exec -i``.
+
+    :param process: A :class:`subprocess.Popen` instance with pipes for its
+     standard input and output.
+    """
+
+    def __init__(self, process):
+        self._process = process
+
+    def fileno(self):
+        return self._process.stdout.fileno()
+
+    def sendall(self, data):
+        self._process.stdin.write(data)
+        self._process.stdin.flush()
+
+    def recv(self, size):
+        return read(self.fileno(), size)
+
+    def close(self):
+        try:
+            self._process.stdin.close()
+        finally:
+            # The relay exits once its input is closed, don't rely on it
+            if self._process.poll() is None:
+                self._process.terminate()
+            self._process.wait()
+            self._process.stdout.close()
+
+
+class OvsdbClient(object):
+    """
+    OVSDB JSON-RPC client over a stream socket.
+
+    Replies are matched to requests by id, so notifications and replies to
+    other requests arriving in between are dispatched correctly. Table
+    updates for monitors are delivered to the callback registered in
+    :meth:`monitor`.
+
+    :param sock: A connected stream socket, or any object with the
+     ``sendall``, ``recv``, ``fileno`` and ``close`` methods of one, like a
+     :class:`PipeStream`.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._decoder = JsonStreamDecoder()
+        self._next_id = 0
+        self._replies = {}
+        self._monitors = {}
+        self._early_updates = {}
+
+    @classmethod
+    def connect(cls, path=DB_SOCK):
+        """
+        Create a client connected to the given OVSDB server unix socket.
+
+        :param str path: Path to the server unix socket.
+        :rtype: OvsdbClient
+        """
+        sock = socket(AF_UNIX, SOCK_STREAM)
+        sock.connect(path)
+        return cls(sock)
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def close(self):
+        self._sock.close()
+
+    def _send(self, message):
+        self._sock.sendall(dumps(message).encode('utf-8'))
+
+    def request(self, method, params):
+        """
+        Send a request without waiting for its reply.
+
+        :param str method: JSON-RPC method.
+        :param list params: Method parameters.
+        :rtype: int
+        :return: The id of the request.
+        """
+        self._next_id += 1
+        self._send({'method': method, 'params': params, 'id': self._next_id})
+        return self._next_id
+
+    def process(self, timeout=None):
+        """
+        Read once from the socket and dispatch all the completed messages.
+
+        :param float timeout: Seconds to wait for data. ``None`` to block.
+        :rtype: bool
+        :return: False if no data was available before the timeout.
+        """
+        if timeout is not None:
+            readable, _, _ = select([self], [], [], timeout)
+            if not readable:
+                return False
+
+        data = self._sock.recv(65536)
+        if not data:
+            raise OvsdbError('Connection closed by the OVSDB server')
+
+        for message in self._decoder.feed(data):
+            self._dispatch(message)
+        return True
+
+    def _dispatch(self, message):
+        method = message.get('method')
+
+        if method is None:
+            self._replies[message.get('id')] = message
+        elif method == 'update':
+            monitor_id, updates = message['params']
+            callback = self._monitors.get(monitor_id)
+            if callback is not None:
+                callback(updates)
+            elif monitor_id in self._early_updates:
+                self._early_updates[monitor_id].append(updates)
+        elif method == 'echo':
+            self._send({
+                'id': message['id'], 'result': message['params'],
+                'error': None
+            })
+
+    def call(self, method, params, timeout=None):
+        """
+        Send a request and wait for its reply.
+
+        :param str method: JSON-RPC method.
+        :param list params: Method parameters.
+        :param float timeout: Seconds to wait for the reply. ``None`` to
+         wait forever.
+        :return: The result of the request.
+        """
+        request_id = self.request(method, params)
+        while request_id not in self._replies:
+            if not self.process(timeout=timeout):
+                raise OvsdbError(
+                    'Timed out waiting for reply to {}'.format(method)
+                )
+
+        reply = self._replies.pop(request_id)
+        if reply.get('error') is not None:
+            raise OvsdbError(reply['error'])
+        return reply['result']
+
+    def transact(self, database, *operations, **kwargs):
+        """
+        Execute a transaction in the given database.
+
+        :param str database: Name of the database.
+        :param operations: The transaction operations.
+        :param float timeout: Seconds to wait for the reply.
+        :rtype: list
+        :return: The result of each operation.
+        """
+        results = self.call(
+            'transact', [database] + list(operations), **kwargs
+        )
+        errors = [
+            result for result in results
+            if result is not None and 'error' in result
+        ]
+        if errors:
+            raise OvsdbError(errors)
+        return results
+
+    def monitor(self, database, requests, callback, **kwargs):
+        """
+        Subscribe to changes in the given tables.
+
+        :param str database: Name of the database.
+        :param dict requests: Monitor requests, mapping each table name to a
+         monitor request like ``{'columns': ['cur_hw']}``.
+        :param callback: Function receiving the table updates. It is called
+         with the initial contents of the tables and then on every change.
+        :param float timeout: Seconds to wait for the initial contents.
+        :return: The id of the monitor.
+        """
+        monitor_id = 'monitor-{}'.format(self._next_id)
+
+        # Updates may arrive along with the initial contents, hold them until
+        # the initial contents are delivered
+        self._early_updates[monitor_id] = []
+        try:
+            initial = self.call(
+                'monitor', [database, monitor_id, requests], **kwargs
+            )
+        finally:
+            early_updates = self._early_updates.pop(monitor_id)
+
+        callback(initial)
+        for updates in early_updates:
+            callback(updates)
+        self._monitors[monitor_id] = callback
+        return monitor_id
+
+    def monitor_cancel(self, monitor_id, **kwargs):
+        """
+        Cancel a monitor previously created with :meth:`monitor`.
+
+        :param monitor_id: The id of the monitor.
+        """
+        del self._monitors[monitor_id]
+        self.call('monitor_cancel', [monitor_id], **kwargs)
+
+
+def updated_rows(updates, table):
+    """
+    Iterate the new contents of the inserted or modified rows of a table.
+
+    :param dict updates: Table updates as received by a monitor callback.
+    :param str table: Name of the table.
+    :return: Iterator of ``(uuid, row)`` tuples.
+    """
+    for uuid, row in updates.get(table, {}).items():
+        if 'new' in row:
+            yield uuid, row['new']
+
+
+def relay(path=DB_SOCK):
+    """
+    Relay the standard input and output of this process to the OVSDB server
+    unix socket until either side closes.
+
+    :param str path: Path to the server unix socket.
+    """
+    sock = socket(AF_UNIX, SOCK_STREAM)
+    sock.connect(path)
+    stdin_fd = stdin.fileno()
+    stdout_fd = stdout.fileno()
+
+    try:
+        while True:
+            readable, _, _ = select([stdin_fd, sock], [], [])
+            if stdin_fd in readable:
+                data = read(stdin_fd, 65536)
+                if not data:
+                    return
+                sock.sendall(data)
+            if sock in readable:
+                data = sock.recv(65536)
+                if not data:
+                    return
+                while data:
+                    data = data[write(stdout_fd, data):]
+    finally:
+        sock.close()
+
+
+__all__ = [
+    'DB_SOCK', 'OvsdbError', 'JsonStreamDecoder', 'PipeStream',
+    'OvsdbClient', 'updated_rows', 'relay'
+]
+
+
+if __name__ == '__main__':
+    relay(*argv[1:])
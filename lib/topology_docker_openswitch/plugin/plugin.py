@@ -17,8 +17,340 @@
 
 from os.path import exists, basename, splitext
 from os import makedirs
-from shutil import copytree, Error
-from logging import warning
+
+from pytest import hookimpl
+
+
+def pytest_addoption(parser):
+    """
+    pytest hook to add CLI arguments.
+    """
+    group = parser.getgroup(
+        'topology_docker_openswitch', 'OpenSwitch nodes for topology_docker'
+    )
+    group.addoption(
+        '--topology-openswitch-parallel-setup',
+        type=int,
+        default=0,
+        metavar='N',
+        help=(
+            'Set up OpenSwitch nodes concurrently, running at most N setup '
+            'scripts at the same time (0 to set them up one by one)'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-warm-pool',
+        type=int,
+        default=0,
+        metavar='N',
+        help=(
+            'Keep N OpenSwitch containers booted in background per image, '
+            'ready to be taken over by new nodes (0 to disable)'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-warm-pool-idle',
+        type=float,
+        default=600.0,
+        metavar='SECONDS',
+        help=(
+            'Stop warm pool containers not taken over after these seconds '
+            '(default: 600)'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-cpus',
+        type=int,
+        default=0,
+        metavar='N',
+        help=(
+            'Pin each OpenSwitch container to N CPUs of its own, spread over '
+            'the NUMA nodes of the host (0 to leave them unpinned)'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-memory',
+        type=int,
+        default=None,
+        metavar='MIB',
+        help='Limit the memory of each OpenSwitch container to MIB mebibytes'
+    )
+    group.addoption(
+        '--topology-openswitch-max-setups',
+        type=int,
+        default=0,
+        metavar='N',
+        help=(
+            'Run at most N OpenSwitch setup scripts, which wait for the '
+            'daemons to converge, at the same time, including the ones of '
+            'the warm pool (0 for no limit). Containers still start booting '
+            'when the platform starts them'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-snapshot',
+        action='store_true',
+        help=(
+            'Snapshot the first converged OpenSwitch container of each image '
+            'and start the next ones from the snapshot'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-keep-snapshots',
+        action='store_true',
+        help=(
+            'Keep the snapshot images at the end of the session, for later '
+            'sessions to start from them. They are removed otherwise'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-docker-cli',
+        action='store_true',
+        help=(
+            'Run commands in the OpenSwitch containers with the docker CLI '
+            'instead of the Docker Engine API'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-docker-connections',
+        type=int,
+        default=32,
+        metavar='N',
+        help=(
+            'Keep up to N connections to the Docker daemon open to run '
+            'commands concurrently (default: 32)'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-incremental-logs',
+        action='store_true',
+        help=(
+            'Copy only the log bytes appended during each test to its '
+            'directory, and hard link the files that did not change'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-follow-logs',
+        action='store_true',
+        help=(
+            'Follow the /var/log/messages of each OpenSwitch container as it '
+            'grows, and collect only the lines logged during each test'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-collect-concurrency',
+        type=int,
+        default=8,
+        metavar='N',
+        help=(
+            'Collect the artifacts of up to N OpenSwitch nodes at the same '
+            'time after each test (default: 8)'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-collect-deadline',
+        type=float,
+        default=120.0,
+        metavar='SECONDS',
+        help=(
+            'Abandon the collection of the artifacts of a node after these '
+            'seconds (default: 120)'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-artifacts',
+        choices=['always', 'failed'],
+        default='always',
+        help=(
+            'Collect all the artifacts of the OpenSwitch nodes after every '
+            'test (always), or only after the tests that failed or errored, '
+            'and lightweight ones otherwise (failed) (default: always)'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-artifacts-light-size',
+        type=int,
+        default=64,
+        metavar='KIB',
+        help=(
+            'Largest file collected as a lightweight artifact, in KiB '
+            '(default: 64)'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-artifacts-test-budget',
+        type=int,
+        default=0,
+        metavar='MIB',
+        help='Collect at most these MiB of artifacts per test (0: no limit)'
+    )
+    group.addoption(
+        '--topology-openswitch-artifacts-session-budget',
+        type=int,
+        default=0,
+        metavar='MIB',
+        help=(
+            'Collect at most these MiB of artifacts per session (0: no limit)'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-artifacts-compression',
+        choices=['gz', 'zst'],
+        default=None,
+        help=(
+            'Stream the artifacts of each node into a compressed archive '
+            'instead of copying them (zst requires the zstandard package)'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-diagnostics-timeout',
+        type=float,
+        default=10.0,
+        metavar='SECONDS',
+        help=(
+            'Seconds each diagnostic probe of an OpenSwitch node that failed '
+            'to set up may take (default: 10)'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-diagnostics-max-output',
+        type=int,
+        default=256,
+        metavar='KIB',
+        help='KiB of output kept per diagnostic probe (default: 256)'
+    )
+    group.addoption(
+        '--topology-openswitch-diagnostics-syslog-daemons',
+        action='store_true',
+        help=(
+            'Also keep the host syslog lines of the OpenSwitch daemons in the '
+            'diagnostics, which include the ones of every OpenSwitch '
+            'container of the host'
+        )
+    )
+    group.addoption(
+        '--topology-openswitch-cache-dir',
+        default=None,
+        metavar='DIR',
+        help=(
+            'Directory to persist the data cached per OpenSwitch image '
+            '(default: a directory in the system temporary directory)'
+        )
+    )
+
+
+def pytest_configure(config):
+    """
+    pytest hook to configure plugin.
+    """
+    from topology_docker_openswitch.openswitch import configure_parallel_setup
+    from topology_docker_openswitch.cache import configure_image_cache
+    from topology_docker_openswitch.pool import configure_warm_pool
+    from topology_docker_openswitch.snapshot import configure_snapshots
+    from topology_docker_openswitch.scheduler import configure_scheduler
+    from topology_docker_openswitch.engine import configure_engine
+    from topology_docker_openswitch.diagnostics import configure_diagnostics
+    from topology_docker_openswitch.artifacts import (
+        configure_incremental_copy, configure_log_follower,
+        configure_collector, configure_policy
+    )
+
+    configure_parallel_setup(
+        config.getoption('--topology-openswitch-parallel-setup')
+    )
+    configure_warm_pool(
+        config.getoption('--topology-openswitch-warm-pool'),
+        config.getoption('--topology-openswitch-warm-pool-idle')
+    )
+
+    memory = config.getoption('--topology-openswitch-memory')
+    configure_scheduler(
+        config.getoption('--topology-openswitch-cpus'),
+        memory * 1024 * 1024 if memory is not None else None,
+        config.getoption('--topology-openswitch-max-setups')
+    )
+
+    configure_snapshots(
+        config.getoption('--topology-openswitch-snapshot'),
+        config.getoption('--topology-openswitch-keep-snapshots')
+    )
+
+    configure_engine(
+        not config.getoption('--topology-openswitch-docker-cli'),
+        config.getoption('--topology-openswitch-docker-connections')
+    )
+
+    configure_diagnostics(
+        config.getoption('--topology-openswitch-diagnostics-timeout'),
+        config.getoption('--topology-openswitch-diagnostics-max-output') *
+        1024,
+        config.getoption('--topology-openswitch-diagnostics-syslog-daemons')
+    )
+
+    configure_incremental_copy(
+        config.getoption('--topology-openswitch-incremental-logs')
+    )
+    configure_log_follower(
+        config.getoption('--topology-openswitch-follow-logs')
+    )
+    configure_collector(
+        config.getoption('--topology-openswitch-collect-concurrency'),
+        config.getoption('--topology-openswitch-collect-deadline')
+    )
+    configure_policy(
+        collect=config.getoption('--topology-openswitch-artifacts'),
+        light_size=config.getoption(
+            '--topology-openswitch-artifacts-light-size'
+        ) * 1024,
+        test_budget=config.getoption(
+            '--topology-openswitch-artifacts-test-budget'
+        ) * 1024 * 1024,
+        session_budget=config.getoption(
+            '--topology-openswitch-artifacts-session-budget'
+        ) * 1024 * 1024,
+        compression=config.getoption(
+            '--topology-openswitch-artifacts-compression'
+        )
+    )
+
+    cache_dir = config.getoption('--topology-openswitch-cache-dir')
+    if cache_dir is not None:
+        configure_image_cache(cache_dir)
+
+
+def pytest_unconfigure(config):
+    """
+    pytest hook to stop the containers left in the warm pool, and remove the
+    snapshot images taken during the session.
+    """
+    from topology_docker_openswitch.pool import warm_pool
+    from topology_docker_openswitch.snapshot import snapshots
+
+    # The warm containers may have been created from the snapshots
+    warm_pool.shutdown(wait=True)
+    snapshots.remove()
+
+
+@hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    """
+    pytest hook to record whether a test failed or errored, so its
+    artifacts are collected accordingly.
+    """
+    outcome = yield
+    report = outcome.get_result()
+    if report.when in ['setup', 'call'] and report.failed:
+        item.topology_openswitch_failed = True
+
+
+def pytest_runtest_setup(item):
+    """
+    pytest hook to mark the end of the followed logs of the nodes, so their
+    slices collected after the test start with its setup.
+    """
+    from topology_docker_openswitch.artifacts import log_follower
+
+    log_follower.mark()
 
 
 def pytest_runtest_teardown(item):
@@ -27,46 +359,31 @@ def pytest_runtest_teardown(item):
     the name, then copies the folders defined in the shared_dir_mount attribute
     of each openswitch container, additionally the /var/log/messages of the
     container is copied to the same folder.
+
+    The nodes are collected concurrently, and the artifacts collected depend
+    on the outcome of the test, see
+    :class:`topology_docker_openswitch.artifacts.ArtifactCollector`.
     """
+    from topology_docker_openswitch.artifacts import collector
+
     if 'topology' in item.funcargs:
         topology = item.funcargs['topology']
         if topology.engine == 'docker':
-            logs_path = '/var/log/messages'
-            for node in topology.nodes:
-                node_obj = topology.get(node)
-                if node_obj.metadata.get('type', None) == 'openswitch':
-                    shared_dir = node_obj.shared_dir
-                    try:
-                        node_obj.send_command(
-                            'cat {} > {}/var_messages.log'.format(
-                                logs_path, node_obj.shared_dir_mount
-                            ),
-                            shell='bash',
-                            silent=True
-                        )
-                    except Error:
-                        warning(
-                            'Unable to get {} from container'.format(logs_path)
-                        )
-                    test_suite = splitext(basename(item.parent.name))[0]
-                    path_name = '/tmp/{}_{}_{}'.format(
-                        test_suite, item.name, str(id(item))
-                    )
-                    if not exists(path_name):
-                        makedirs(path_name)
-                    try:
-                        copytree(
-                            shared_dir, '{}/{}'.format(
-                                path_name,
-                                basename(shared_dir)
-                            )
-                        )
-                    except Error as err:
-                        errors = err.args[0]
-                        for error in errors:
-                            src, dest, msg = error
-                            warning(
-                                'Unable to copy file {}, Error {}'.format(
-                                    src, msg
-                                )
-                            )
+            nodes = [
+                topology.get(node) for node in topology.nodes
+                if topology.get(node).metadata.get('type', None) ==
+                'openswitch'
+            ]
+            if not nodes:
+                return
+
+            test_suite = splitext(basename(item.parent.name))[0]
+            path_name = '/tmp/{}_{}_{}'.format(
+                test_suite, item.name, str(id(item))
+            )
+            if not exists(path_name):
+                makedirs(path_name)
+            collector.collect(
+                nodes, path_name,
+                failed=getattr(item, 'topology_openswitch_failed', False)
+            )
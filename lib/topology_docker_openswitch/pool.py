@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Warm pool of pre-booted OpenSwitch containers.
+
+Booting ``/sbin/init`` and waiting for the OpenSwitch daemons to converge
+dominates the build time of a topology. The warm pool keeps a number of
+nodes booted and converged in background, per container configuration, so
+new nodes can take over one of their containers and only map their ports.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from time import time
+from atexit import register
+from logging import getLogger
+from collections import deque
+from threading import Thread, Lock, Event, current_thread
+
+
+log = getLogger(__name__)
+
+
+class WarmPool(object):
+    """
+    Pool of booted and converged OpenSwitch nodes, ready to be handed out.
+
+    Nodes are kept per key, usually the image and container configuration
+    they were created with. Every time a node is requested, the pool of its
+    key is refilled in background up to the configured size. Nodes left idle
+    for longer than the idle timeout are stopped.
+
+    :param int size: Number of ready nodes to keep per key. ``0`` disables
+     the pool.
+    :param float idle_timeout: Seconds a ready node may wait to be handed out
+     before being stopped.
+    """
+
+    def __init__(self, size=0, idle_timeout=600.0):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._lock = Lock()
+        self._ready = {}
+        self._booting = {}
+        self._boots = set()
+        self._closed = Event()
+        self._janitor = None
+
+    def acquire(self, key, factory):
+        """
+        Take a ready node out of the pool and refill it in background.
+
+        :param key: Hashable key of the requested node configuration.
+        :param factory: Callable that creates, starts and sets up a node of
+         the requested configuration, to refill the pool.
+        :return: A ready node or ``None`` if none is available.
+        """
+        if self.size <= 0 or self._closed.is_set():
+            return None
+
+        with self._lock:
+            ready = self._ready.setdefault(key, deque())
+            node = ready.popleft()[0] if ready else None
+            self._refill(key, factory)
+
+        if node is None:
+            log.info('Warm pool empty, booting a new node')
+        return node
+
+    def ready(self, key):
+        """
+        Number of nodes ready to be handed out for the given key.
+
+        :rtype: int
+        """
+        with self._lock:
+            return len(self._ready.get(key, ()))
+
+    def shutdown(self, wait=False):
+        """
+        Stop all ready nodes, and nodes still booting once they are ready.
+
+        The pool is disabled until configured again, see
+        :func:`configure_warm_pool`.
+
+        :param bool wait: Wait for the nodes still booting to be stopped.
+        """
+        self._closed.set()
+        with self._lock:
+            nodes = [
+                node for ready in self._ready.values() for node, _ in ready
+            ]
+            self._ready.clear()
+            self._janitor = None
+            boots = list(self._boots)
+        for node in nodes:
+            self._stop(node)
+        if wait:
+            for boot in boots:
+                boot.join()
+
+    def _refill(self, key, factory):
+        # Must be called with the lock held
+        missing = (
+            self.size - len(self._ready[key]) - self._booting.get(key, 0)
+        )
+        for _ in range(missing):
+            self._booting[key] = self._booting.get(key, 0) + 1
+            boot = Thread(target=self._boot, args=(key, factory))
+            boot.daemon = True
+            self._boots.add(boot)
+            boot.start()
+
+        if self._janitor is None:
+            self._janitor = Thread(target=self._evict_idle)
+            self._janitor.daemon = True
+            self._janitor.start()
+
+    def _boot(self, key, factory):
+        node = None
+        try:
+            node = factory()
+        except Exception:
+            log.exception('Unable to boot a node for the warm pool')
+        finally:
+            with self._lock:
+                self._booting[key] -= 1
+                keep = (
+                    node is not None and not self._closed.is_set() and
+                    len(self._ready.setdefault(key, deque())) < self.size
+                )
+                if keep:
+                    self._ready[key].append((node, time()))
+
+        if node is not None and not keep:
+            self._stop(node)
+
+        with self._lock:
+            self._boots.discard(current_thread())
+
+    def _evict_idle(self):
+        while not self._closed.wait(max(1.0, self.idle_timeout / 4)):
+            evicted = []
+            with self._lock:
+                deadline = time() - self.idle_timeout
+                for ready in self._ready.values():
+                    while ready and ready[0][1] < deadline:
+                        evicted.append(ready.popleft()[0])
+            for node in evicted:
+                log.info('Evicting idle node {} from the warm pool'.format(
+                    node.container_name
+                ))
+                self._stop(node)
+
+    def _stop(self, node):
+        try:
+            node.stop()
+        except Exception:
+            log.exception('Unable to stop warm pool node {}'.format(
+                node.container_name
+            ))
+
+
+warm_pool = WarmPool()
+register(warm_pool.shutdown)
+
+
+def configure_warm_pool(size, idle_timeout=None):
+    """
+    Enable or disable the warm pool of OpenSwitch nodes.
+
+    :param int size: Number of booted nodes to keep ready per image and
+     container configuration. ``0`` to boot every node when created.
+    :param float idle_timeout: Seconds a ready node may wait to be handed out
+     before being stopped. ``None`` to leave it unchanged.
+    """
+    warm_pool.size = size
+    if idle_timeout is not None:
+        warm_pool.idle_timeout = idle_timeout
+    if size > 0:
+        warm_pool._closed.clear()
+
+
+__all__ = ['WarmPool', 'warm_pool', 'configure_warm_pool']
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Placement of the OpenSwitch containers on the CPUs and memory of the host.
+
+Without constraints, every container of a dense topology competes for the
+same cores while booting, and convergence slows down more than linearly with
+the number of nodes. The scheduler pins each container to its own cores,
+spread over the NUMA nodes of the host, optionally limits its memory, and
+bounds how many nodes run their setup script at the same time.
+
+The containers created by the platform start booting as soon as they are
+started, and the platform runs commands in them before their setup, so
+their boot can't be deferred. The setup script creates the interfaces the
+OpenSwitch daemons wait for, so bounding the setups bounds how many nodes
+converge at once, across the parallel setup pool and the warm pool.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from glob import glob
+from logging import getLogger
+from threading import Condition
+from contextlib import contextmanager
+from multiprocessing import cpu_count
+from os.path import basename
+
+try:
+    from os import sched_getaffinity
+except ImportError:
+    sched_getaffinity = None
+
+
+log = getLogger(__name__)
+
+
+def parse_cpulist(cpulist):
+    """
+    Parse a list of CPUs in the format of the kernel, like ``0-3,8``.
+
+    :param str cpulist: The list of CPUs.
+    :rtype: list
+    :return: The CPU numbers.
+    """
+    cpus = []
+    for item in cpulist.strip().split(','):
+        if not item:
+            continue
+        first, _, last = item.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def host_topology():
+    """
+    Find the NUMA nodes of the host and the CPUs this process may use on
+    each one.
+
+    :rtype: list
+    :return: Tuples of the NUMA node number and its CPUs. A single node with
+     all the CPUs if the host doesn't describe its NUMA nodes.
+    """
+    if sched_getaffinity is not None:
+        allowed = set(sched_getaffinity(0))
+    else:
+        allowed = set(range(cpu_count()))
+
+    topology = []
+    for path in glob('/sys/devices/system/node/node[0-9]*'):
+        try:
+            with open('{}/cpulist'.format(path), 'r') as fd:
+                cpus = set(parse_cpulist(fd.read())) & allowed
+        except (IOError, OSError, ValueError):
+            continue
+        if cpus:
+            topology.append((int(basename(path)[4:]), sorted(cpus)))
+
+    if not topology:
+        return [(0, sorted(allowed))]
+    return sorted(topology)
+
+
+class Placement(object):
+    """
+    CPUs and memory assigned to a container.
+
+    :var list cpus: CPUs the container is pinned to, empty if not pinned.
+    :var int numa_node: NUMA node of the CPUs, or ``None`` if they span
+     several ones or the host has a single one.
+    :var memory: Memory limit of the container, in bytes or as a Docker
+     memory string like ``512m``, or ``None`` if not limited.
+    """
+
+    def __init__(self, scheduler, cpus, numa_node, memory):
+        self.cpus = cpus
+        self.numa_node = numa_node
+        self.memory = memory
+        self._scheduler = scheduler
+
+    def host_config_kwargs(self):
+        """
+        Get the arguments of ``create_host_config()`` applying the placement.
+
+        :rtype: dict
+        """
+        kwargs = {}
+        if self.cpus:
+            kwargs['cpuset_cpus'] = ','.join(str(cpu) for cpu in self.cpus)
+        if self.numa_node is not None:
+            kwargs['cpuset_mems'] = str(self.numa_node)
+        if self.memory is not None:
+            kwargs['mem_limit'] = self.memory
+        return kwargs
+
+    def release(self):
+        """
+        Give the CPUs back to the scheduler once the container is gone.
+        Releasing more than once has no effect.
+        """
+        self._scheduler._release(self)
+
+
+class PlacementScheduler(object):
+    """
+    Assigner of CPUs and memory to the OpenSwitch containers of the host.
+
+    Each container is placed on the least loaded NUMA node able to hold it,
+    on its least loaded CPUs, so containers only share cores once every core
+    is taken.
+
+    :param int cpus: CPUs each container is pinned to. ``0`` disables the
+     pinning.
+    :param memory: Memory limit of each container, in bytes or as a Docker
+     memory string like ``512m``. ``None`` for no limit.
+    :param int max_setups: Maximum number of nodes running their setup
+     script at the same time. ``0`` for no limit.
+    :param list topology: NUMA nodes and their CPUs, as returned by
+     :func:`host_topology`. ``None`` to find them on first use.
+    """
+
+    def __init__(self, cpus=0, memory=None, max_setups=0, topology=None):
+        self.cpus = cpus
+        self.memory = memory
+        self.max_setups = max_setups
+        self._topology = topology
+        self._condition = Condition()
+        self._load = {}
+        self._placements = set()
+        self._setting_up = 0
+
+    def topology(self):
+        """
+        Get the NUMA nodes and CPUs containers are placed on.
+
+        :rtype: list
+        """
+        with self._condition:
+            if self._topology is None:
+                self._topology = host_topology()
+                log.debug('Host topology for OpenSwitch containers: {}'.format(
+                    self._topology
+                ))
+            return self._topology
+
+    def place(self, cpus=None, memory=None):
+        """
+        Assign CPUs and memory to a new container.
+
+        :param int cpus: CPUs to pin the container to. ``None`` for the
+         default of the scheduler.
+        :param memory: Memory limit of the container. ``None`` for the default
+         of the scheduler.
+        :rtype: :class:`Placement`
+        :return: The placement of the container, or ``None`` if it isn't
+         constrained.
+        """
+        cpus = int(self.cpus if cpus is None else cpus)
+        memory = self.memory if memory is None else memory
+        if cpus <= 0 and memory is None:
+            return None
+
+        topology = self.topology()
+        with self._condition:
+            chosen = []
+            numa_node = None
+            if cpus > 0:
+                def load(cpus):
+                    return sum(self._load.get(cpu, 0) for cpu in cpus) / \
+                        len(cpus)
+
+                fitting = [
+                    (node, node_cpus) for node, node_cpus in topology
+                    if len(node_cpus) >= cpus
+                ]
+                if fitting:
+                    node, candidates = min(
+                        fitting, key=lambda item: (load(item[1]), item[0])
+                    )
+                    if len(topology) > 1:
+                        numa_node = node
+                else:
+                    # Wider than any NUMA node
+                    candidates = [
+                        cpu for _, node_cpus in topology for cpu in node_cpus
+                    ]
+
+                chosen = sorted(sorted(
+                    candidates, key=lambda cpu: (self._load.get(cpu, 0), cpu)
+                )[:cpus])
+                for cpu in chosen:
+                    self._load[cpu] = self._load.get(cpu, 0) + 1
+
+            placement = Placement(self, chosen, numa_node, memory)
+            self._placements.add(placement)
+            return placement
+
+    def _release(self, placement):
+        with self._condition:
+            if placement not in self._placements:
+                return
+            self._placements.discard(placement)
+            for cpu in placement.cpus:
+                self._load[cpu] -= 1
+
+    def load(self):
+        """
+        Get the number of containers placed on each CPU.
+
+        :rtype: dict
+        """
+        with self._condition:
+            return dict(
+                (cpu, count) for cpu, count in self._load.items() if count
+            )
+
+    @contextmanager
+    def setup(self):
+        """
+        Wait for a setup slot and hold it for the duration of the block.
+        """
+        with self._condition:
+            while 0 < self.max_setups <= self._setting_up:
+                self._condition.wait()
+            self._setting_up += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._setting_up -= 1
+                self._condition.notify_all()
+
+
+scheduler = PlacementScheduler()
+
+
+def configure_scheduler(cpus, memory=None, max_setups=0):
+    """
+    Choose how OpenSwitch containers are placed on the host.
+
+    Only affects nodes created after this call, except for the number of
+    nodes running their setup script at the same time.
+
+    :param int cpus: CPUs each container is pinned to. ``0`` disables the
+     pinning.
+    :param memory: Memory limit of each container, in bytes or as a Docker
+     memory string like ``512m``. ``None`` for no limit.
+    :param int max_setups: Maximum number of nodes running their setup
+     script at the same time. ``0`` for no limit.
+    """
+    with scheduler._condition:
+        scheduler.cpus = cpus
+        scheduler.memory = memory
+        scheduler.max_setups = max_setups
+        scheduler._condition.notify_all()
+
+
+__all__ = [
+    'parse_cpulist', 'host_topology', 'Placement', 'PlacementScheduler',
+    'scheduler', 'configure_scheduler'
+]
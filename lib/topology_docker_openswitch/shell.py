@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+OpenSwitch shells.
+
+Commands like ``show running-config``, ``show tech`` or ``ovsdb-client dump``
+produce megabytes of output. By default pexpect searches the prompt in the
+whole buffer every time new output is read, so these shells bound the search
+to the tail of the buffer and read in larger chunks.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from threading import Lock
+from collections import OrderedDict
+
+from topology_docker.shell import DockerShell, DockerBashShell
+
+
+# Prompt of vtysh, anchored to the end of the output so it doesn't match the
+# prompts echoed in the output of commands
+VTYSH_PROMPT = r'(^|\n)switch(\([\-a-zA-Z0-9]*\))?# ?$'
+
+# Bytes at the end of the buffer where the prompt is searched
+SEARCH_WINDOW_SIZE = 4096
+
+# Bytes read from the shell at once
+MAX_READ = 65536
+
+
+class BoundedSearchMixin(object):
+    """
+    Shell mixin that bounds the prompt search of pexpect to the tail of its
+    buffer.
+
+    :param int searchwindowsize: Bytes at the end of the buffer where the
+     prompt is searched.
+    :param int maxread: Bytes read from the shell at once.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # The base shell merges these with its own spawn arguments
+        spawn_args = {
+            'searchwindowsize': kwargs.pop(
+                'searchwindowsize', SEARCH_WINDOW_SIZE
+            ),
+            'maxread': kwargs.pop('maxread', MAX_READ),
+        }
+        spawn_args.update(kwargs.pop('spawn_args', None) or {})
+        kwargs['spawn_args'] = spawn_args
+        super(BoundedSearchMixin, self).__init__(*args, **kwargs)
+
+
+class OpenSwitchVtyshShell(BoundedSearchMixin, DockerShell):
+    """
+    ``vtysh`` shell of an OpenSwitch container.
+
+    :param str container: Container unique identifier.
+    """
+
+    def __init__(self, container, **kwargs):
+        super(OpenSwitchVtyshShell, self).__init__(
+            container, 'vtysh', VTYSH_PROMPT, **kwargs
+        )
+
+
+class OpenSwitchBashShell(BoundedSearchMixin, DockerBashShell):
+    """
+    Bash shell of an OpenSwitch container.
+
+    :param str container: Container unique identifier.
+    :param str command: Command that launches the shell.
+    """
+
+
+class LazyShells(OrderedDict):
+    """
+    Ordered dictionary of shells that creates each shell on first lookup.
+
+    Shells added with :meth:`lazy` are listed like any other, but are only
+    created, and then kept, the first time they are looked up, so nodes don't
+    pay for the shells a test never uses.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._factories = {}
+        self._lock = Lock()
+        super(LazyShells, self).__init__(*args, **kwargs)
+
+    def lazy(self, name, factory):
+        """
+        Add a shell created on first lookup.
+
+        :param str name: Name of the shell.
+        :param factory: Callable that creates the shell.
+        """
+        with self._lock:
+            self._factories[name] = factory
+            OrderedDict.__setitem__(self, name, None)
+
+    def __getitem__(self, name):
+        with self._lock:
+            shell = OrderedDict.__getitem__(self, name)
+            if shell is None and name in self._factories:
+                shell = self._factories.pop(name)()
+                OrderedDict.__setitem__(self, name, shell)
+            return shell
+
+    def __setitem__(self, name, shell):
+        with self._lock:
+            self._factories.pop(name, None)
+            OrderedDict.__setitem__(self, name, shell)
+
+    def get(self, name, default=None):
+        if name not in self:
+            return default
+        return self[name]
+
+    def created(self):
+        """
+        List the shells created so far.
+
+        :rtype: list
+        """
+        with self._lock:
+            return [
+                OrderedDict.__getitem__(self, name) for name in self
+                if name not in self._factories
+            ]
+
+
+__all__ = [
+    'VTYSH_PROMPT',
+    'BoundedSearchMixin',
+    'LazyShells',
+    'OpenSwitchVtyshShell',
+    'OpenSwitchBashShell'
+]
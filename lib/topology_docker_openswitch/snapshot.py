@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Snapshots of converged OpenSwitch containers.
+
+A snapshot is the file system of a converged container, committed as a new
+image, along with a backup of its ``OpenSwitch`` OVSDB database, which lives
+in a tmpfs and so isn't part of the commit. Nodes of an image with a snapshot
+start from the snapshot image and restore the database as soon as its server
+is up, instead of waiting for the daemons to populate it.
+
+Snapshots are recorded in the :mod:`topology_docker_openswitch.cache`, keyed
+by the ID of the original image, so a changed image never uses the snapshot
+of its predecessor. The snapshot images are removed at the end of the session
+that took them, unless kept for later sessions, see
+:func:`configure_snapshots`.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from logging import getLogger
+from threading import Lock
+
+from .cache import image_cache
+
+
+log = getLogger(__name__)
+
+
+class SnapshotStore(object):
+    """
+    Registry of the snapshots of converged OpenSwitch containers per image.
+
+    :param cache: Cache to record the snapshots in.
+    :type cache: :class:`topology_docker_openswitch.cache.ImageCache`
+    :param bool enabled: Take and use snapshots.
+    :param bool keep: Keep the snapshot images when removing the snapshots
+     taken, for later sessions to use them.
+    """
+
+    def __init__(self, cache, enabled=False, keep=False):
+        self.cache = cache
+        self.enabled = enabled
+        self.keep = keep
+        self._lock = Lock()
+        self._claimed = set()
+        self._taken = []
+
+    def lookup(self, client, image):
+        """
+        Get the snapshot of an image, if any.
+
+        :param client: Docker API client.
+        :param str image: Name of the original image.
+        :rtype: dict
+        :return: Dictionary with keys ``image``, the ID of the snapshot image,
+         and ``backup``, the OVSDB backup, or ``None`` if there's no snapshot
+         of the current version of the image.
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            image_id = client.inspect_image(image=image)['Id']
+        except Exception:
+            return None
+
+        snapshot = self.cache.get(image_id, 'snapshot')
+        if snapshot is None:
+            return None
+
+        # The snapshot image may have been removed since
+        try:
+            client.inspect_image(image=snapshot['image'])
+        except Exception:
+            log.warning('Snapshot image {} of {} is gone'.format(
+                snapshot['image'], image
+            ))
+            return None
+
+        return snapshot
+
+    def claim(self, image_id):
+        """
+        Claim the right to take the snapshot of an image, so only one node
+        takes it.
+
+        :param str image_id: ID of the original image.
+        :rtype: bool
+        :return: True if the caller must take the snapshot.
+        """
+        if not self.enabled:
+            return False
+
+        with self._lock:
+            if image_id in self._claimed or \
+                    self.cache.get(image_id, 'snapshot') is not None:
+                return False
+            self._claimed.add(image_id)
+            return True
+
+    def release(self, image_id):
+        """
+        Give up a claim, for example if the node failed to converge, so
+        another node takes the snapshot.
+
+        :param str image_id: ID of the original image.
+        """
+        with self._lock:
+            self._claimed.discard(image_id)
+
+    def take(self, client, container_id, image_id, backup):
+        """
+        Commit a converged container and record it as the snapshot of its
+        image.
+
+        :param client: Docker API client.
+        :param str container_id: ID of the converged container.
+        :param str image_id: ID of the image the container was created from.
+        :param str backup: OVSDB backup of the container database.
+        """
+        commit = client.commit(
+            container_id,
+            repository='topology_docker_openswitch/snapshot',
+            tag=image_id.split(':')[-1][:12],
+            message='Converged OpenSwitch snapshot of {}'.format(image_id)
+        )
+        # Data derived from the original image applies to the snapshot too
+        hwports = self.cache.get(image_id, 'hwports')
+        if hwports is not None:
+            self.cache.set(commit['Id'], 'hwports', hwports)
+
+        self.cache.set(image_id, 'snapshot', {
+            'image': commit['Id'],
+            'backup': backup
+        })
+        with self._lock:
+            self._taken.append((client, image_id, commit['Id']))
+        log.info('Took snapshot {} of image {}'.format(
+            commit['Id'], image_id
+        ))
+
+    def remove(self):
+        """
+        Remove the snapshot images taken by this store and forget them,
+        unless they are kept.
+        """
+        with self._lock:
+            taken = self._taken
+            self._taken = []
+            if self.keep:
+                return
+            for _, image_id, _ in taken:
+                self._claimed.discard(image_id)
+
+        for client, image_id, snapshot in taken:
+            self.cache.delete(image_id, 'snapshot')
+            self.cache.delete(snapshot, 'hwports')
+            try:
+                client.remove_image(snapshot, force=True)
+            except Exception:
+                log.warning('Unable to remove snapshot image {}'.format(
+                    snapshot
+                ), exc_info=True)
+
+
+snapshots = SnapshotStore(image_cache)
+
+
+def configure_snapshots(enabled, keep=None):
+    """
+    Enable or disable the snapshots of converged OpenSwitch containers.
+
+    :param bool enabled: Take a snapshot of the first node of each image that
+     converges, and start later nodes of the image from it.
+    :param bool keep: Keep the snapshot images at the end of the session, for
+     later sessions to use them. ``None`` to leave it unchanged.
+    """
+    snapshots.enabled = enabled
+    if keep is not None:
+        snapshots.keep = keep
+
+
+__all__ = ['SnapshotStore', 'snapshots', 'configure_snapshots']
@@ -65,6 +65,10 @@ setup(
 
     # Dependencies
     install_requires=find_requirements('requirements.txt'),
+    extras_require={
+        'zstd': ['zstandard'],
+        'benchmark': ['pyszn'],
+    },
 
     # Metadata
     author='Hewlett Packard Enterprise Development LP',
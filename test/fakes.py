@@ -0,0 +1,715 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Local stand-in of the Docker engine and of the OpenSwitch image.
+
+:class:`FakeBackend` replaces the Docker client used by
+:class:`topology_docker.node.DockerNode`, so :class:`FakeOpenSwitchNode`
+runs the real :class:`OpenSwitchNode` code. Each container is a directory
+tree (:class:`FakeContainer`) where a boot thread plays the convergence of
+the OpenSwitch daemons with configurable delays. The steps are creating the
+swns netns and the hardware description, serving the OpenSwitch database
+through a JSON-RPC unix socket (:class:`FakeOvsdbServer`), writing the
+switchd pid file and setting ``System.cur_hw``.
+
+The setup script is executed in-process with its paths relocated into the
+container tree. Its ``ip`` and ``systemctl`` calls are answered by an
+in-memory model of the container network namespaces.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from re import compile as regex
+from binascii import hexlify
+from copy import deepcopy
+from json import dumps, loads
+from shutil import rmtree
+from tempfile import mkdtemp
+from contextlib import contextmanager
+from os import getpid, makedirs, rmdir, rename, urandom
+from os.path import join, exists, dirname, basename
+from shlex import split as shsplit
+from threading import Thread, Event, Lock
+from itertools import count
+from subprocess import Popen, check_output, CalledProcessError
+from socket import AF_UNIX, SOCK_STREAM, socket, error as socket_error
+from time import time
+import sys
+
+import topology_docker.node
+
+from topology_docker_openswitch import ovsdb
+from topology_docker_openswitch.openswitch import OpenSwitchNode
+
+
+_CONTAINER_PATH = regex(r'(?<![\w./-])/(?:var|etc|tmp|run)/[^\s;|>&]*')
+
+
+class FakeOvsdbServer(object):
+    """
+    OVSDB JSON-RPC server serving a single ``System`` row and an
+    ``Interface`` table.
+
+    Supports the ``monitor`` (``System`` only), ``monitor_cancel``,
+    ``transact`` (``select``, ``update``, ``mutate`` of maps and ``wait``
+    operations with equality conditions) and ``echo`` methods.
+
+    :param str path: Path of the unix socket to listen on.
+    :param list interfaces: Names of the rows of the ``Interface`` table.
+    """
+
+    def __init__(self, path, interfaces=()):
+        self.path = path
+        self.system = {'cur_hw': 0}
+        self.interfaces = dict(
+            ('interface-{}'.format(name), {
+                'name': name, 'user_config': ['map', []],
+                'admin_state': 'down', 'link_state': 'down'
+            })
+            for name in interfaces
+        )
+        self._lock = Lock()
+        self._monitors = []
+        self._clients = []
+        self._sock = socket(AF_UNIX, SOCK_STREAM)
+        self._sock.bind(path)
+        self._sock.listen(16)
+        self._thread = Thread(target=self._accept)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._sock.accept()
+            except socket_error:
+                return
+            self._clients.append(client)
+            thread = Thread(target=self._serve, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    def _send(self, client, message):
+        try:
+            client.sendall(dumps(message).encode('utf-8'))
+        except socket_error:
+            pass
+
+    def _serve(self, client):
+        decoder = ovsdb.JsonStreamDecoder()
+        while True:
+            try:
+                data = client.recv(65536)
+            except socket_error:
+                data = None
+            if not data:
+                with self._lock:
+                    self._monitors = [
+                        monitor for monitor in self._monitors
+                        if monitor[0] is not client
+                    ]
+                return
+            for message in decoder.feed(data):
+                self._handle(client, message)
+
+    def _rows(self, columns=None):
+        row = dict(
+            (column, value) for column, value in self.system.items()
+            if columns is None or column in columns
+        )
+        return {'System': {'system-uuid': {'new': row}}}
+
+    def _handle(self, client, message):
+        method = message.get('method')
+        params = message.get('params')
+        reply = {'id': message.get('id'), 'error': None, 'result': None}
+
+        if method == 'monitor':
+            _, monitor_id, requests = params
+            columns = requests.get('System', {}).get('columns')
+            with self._lock:
+                self._monitors.append((client, monitor_id, columns))
+                reply['result'] = self._rows(columns)
+        elif method == 'monitor_cancel':
+            with self._lock:
+                self._monitors = [
+                    monitor for monitor in self._monitors
+                    if monitor[1] != params[0]
+                ]
+            reply['result'] = {}
+        elif method == 'transact':
+            with self._lock:
+                reply['result'] = self._transact(params[1:])
+        elif method == 'echo':
+            reply['result'] = params
+        else:
+            reply['error'] = 'unknown method'
+
+        self._send(client, reply)
+
+    def _transact(self, operations):
+        # Transactions are atomic, roll back on errors
+        saved = deepcopy((self.system, self.interfaces))
+        results = []
+        for op in operations:
+            table = {
+                'System': {'system-uuid': self.system},
+                'Interface': self.interfaces
+            }[op['table']]
+            rows = [
+                row for row in table.values()
+                if all(row.get(column) == value
+                       for column, _, value in op.get('where', []))
+            ]
+
+            if op['op'] == 'select':
+                results.append({'rows': [
+                    dict(
+                        (column, value) for column, value in row.items()
+                        if column in op.get('columns', row)
+                    )
+                    for row in rows
+                ]})
+            elif op['op'] == 'wait':
+                if bool(rows) != (op['until'] == '!='):
+                    results.append({'error': 'timed out'})
+                    break
+                results.append({})
+            elif op['op'] == 'update':
+                for row in rows:
+                    row.update(op['row'])
+                results.append({'count': len(rows)})
+            elif op['op'] == 'mutate':
+                for row in rows:
+                    for column, mutator, (_, operand) in op['mutations']:
+                        pairs = dict(row[column][1])
+                        if mutator == 'delete':
+                            for key in operand:
+                                pairs.pop(key, None)
+                        else:
+                            for key, value in operand:
+                                pairs.setdefault(key, value)
+                        row[column] = ['map', sorted(pairs.items())]
+                results.append({'count': len(rows)})
+            else:
+                results.append({'error': 'not supported'})
+                break
+
+        if results and 'error' in results[-1]:
+            self.system, self.interfaces = saved
+        return results
+
+    def set_system(self, **columns):
+        """
+        Update the ``System`` row and notify the monitors.
+        """
+        with self._lock:
+            self.system.update(columns)
+            for client, monitor_id, monitored in self._monitors:
+                self._send(client, {
+                    'id': None, 'method': 'update',
+                    'params': [monitor_id, self._rows(monitored)]
+                })
+
+    def close(self):
+        self._sock.close()
+        for client in self._clients:
+            client.close()
+
+
+class FakeContainer(object):
+    """
+    Directory tree standing for an OpenSwitch container.
+
+    :param str root: Directory of the container file system.
+    :param dict binds: Mapping of container paths to host directories.
+    :param int hwports: Number of ports in the hardware description.
+    :param float step_delay: Seconds each boot step takes to complete.
+    :param bool switchd_fails: Make switchd die and its unit fail.
+    :param bool from_snapshot: The container was created from a snapshot,
+     so its hardware description is already in place and restoring its
+     database converges it.
+    :param float exec_delay: Seconds each command execution takes, standing
+     for the round trip of ``docker exec``.
+    """
+
+    def __init__(
+            self, root, binds, hwports=54, step_delay=0.05,
+            switchd_fails=False, from_snapshot=False, exec_delay=0.0):
+        self.root = root
+        self.exec_delay = exec_delay
+        self.link_state = {}
+        self.from_snapshot = from_snapshot
+        self.restored = False
+        self._restore_lock = Lock()
+        self.binds = binds
+        self.hwports = hwports
+        self.step_delay = step_delay
+        self.switchd_fails = switchd_fails
+        self.hostname = 'switch'
+        self.ovsdb = None
+        self.boot_schedule = None
+        self.started = Event()
+        self._stopped = Event()
+        self._spawned = []
+
+        self.root_ns = set(['lo'])
+        self.swns = set(['lo'])
+        makedirs(self.path('/sys/class/net/lo'))
+        makedirs(self.path('/var/log'))
+        makedirs(self.path('/tmp'))
+        with open(self.path('/var/log/messages'), 'w') as fd:
+            fd.write('fake container booting\n')
+
+    def path(self, container_path):
+        """
+        Get the host path of a path inside the container.
+        """
+        for mount, host_dir in self.binds.items():
+            if container_path == mount or \
+                    container_path.startswith(mount.rstrip('/') + '/'):
+                return host_dir + container_path[len(mount):]
+        return self.root + container_path
+
+    def add_port(self, name):
+        """
+        Add an interface to the container root namespace, as the platform
+        does when linking a port.
+        """
+        self.root_ns.add(name)
+        makedirs(self.path('/sys/class/net/{}'.format(name)))
+
+    # Boot of the image
+
+    def start(self):
+        self.boot_schedule = []
+        thread = Thread(target=self._boot)
+        thread.daemon = True
+        thread.start()
+        self.started.set()
+
+    def _step(self, name):
+        self._stopped.wait(self.step_delay)
+        self.boot_schedule.append((name, time()))
+
+    def _boot(self):
+        self._step('swns')
+        makedirs(dirname(self.path('/var/run/netns/swns')))
+        open(self.path('/var/run/netns/swns'), 'w').close()
+
+        if not self.from_snapshot:
+            self._step('hwdesc')
+        hwdesc = self.path('/etc/openswitch/hwdesc')
+        makedirs(hwdesc + '.tmp')
+        with open(join(hwdesc + '.tmp', 'ports.yaml'), 'w') as fd:
+            fd.write('ports:\n')
+            for port in range(1, self.hwports + 1):
+                fd.write('  - name: {}\n'.format(port))
+        rename(hwdesc + '.tmp', hwdesc)
+
+        # The daemons wait for the virtual ports to be ready
+        while not exists(self.path('/tmp/ops-virt-ports-ready')):
+            if self._stopped.wait(0.005):
+                return
+
+        self._step('db_sock')
+        makedirs(self.path('/var/run/openvswitch'))
+        self.ovsdb = FakeOvsdbServer(
+            self.path('/var/run/openvswitch/db.sock'),
+            interfaces=[str(port) for port in range(1, self.hwports + 1)]
+        )
+
+        self._step('switchd_pid')
+        with open(self.path('/var/run/openvswitch/ops-switchd.pid'), 'w') \
+                as fd:
+            fd.write('{}\n'.format(0 if self.switchd_fails else getpid()))
+
+        # Unless its database was already restored from a snapshot
+        self._step('cur_hw_pending')
+        with self._restore_lock:
+            if not self.restored:
+                self.boot_schedule.append(('cur_hw', time()))
+                self.ovsdb.set_system(cur_hw=1)
+
+    def stop(self):
+        self._stopped.set()
+        for process in self._spawned:
+            process.terminate()
+            process.wait()
+        if self.ovsdb is not None:
+            self.ovsdb.close()
+        rmtree(self.root, ignore_errors=True)
+
+    # Commands run inside the container
+
+    def ip_batch(self, commands, netns=None):
+        """
+        Apply the ``ip -batch`` commands of the setup script to the model of
+        the network namespaces.
+        """
+        for command, error in commands:
+            args = command.split()
+            if netns == 'swns' and args[:2] == ['link', 'delete']:
+                if args[3] not in self.swns:
+                    raise Exception(error)
+                self.swns.remove(args[3])
+            elif netns is not None:
+                raise Exception(error)
+            elif args[:2] == ['tuntap', 'add']:
+                if args[3] in self.root_ns:
+                    raise Exception(error)
+                self.add_port(args[3])
+            elif args[:2] == ['link', 'set'] and args[4] == 'name':
+                if args[3] == args[5]:
+                    continue
+                if args[3] not in self.root_ns or args[5] in self.root_ns:
+                    raise Exception(error)
+                self.root_ns.remove(args[3])
+                self.root_ns.add(args[5])
+                rename(
+                    self.path('/sys/class/net/{}'.format(args[3])),
+                    self.path('/sys/class/net/{}'.format(args[5]))
+                )
+            elif args[:2] == ['link', 'set'] and args[4] == 'netns':
+                if args[3] not in self.root_ns or args[3] in self.swns:
+                    raise Exception(error)
+                self.root_ns.remove(args[3])
+                self.swns.add(args[3])
+                rmdir(self.path('/sys/class/net/{}'.format(args[3])))
+            else:
+                raise Exception(error)
+
+    def call(self, args, stdin=None, stdout=None):
+        """
+        Answer the ``systemctl`` and ``ovsdb-client`` calls of the setup
+        script.
+        """
+        if args[:2] == ['systemctl', 'is-failed']:
+            return 0 if self.switchd_fails else 1
+        if args[:2] == ['systemctl', 'restart']:
+            self.boot_schedule.append(('switchd_restart', time()))
+            return 0
+        if args[:2] == ['ovsdb-client', 'backup']:
+            stdout.write(dumps(self.ovsdb.system))
+        elif args[:2] == ['ovsdb-client', 'restore']:
+            with self._restore_lock:
+                self.restored = True
+                self.boot_schedule.append(('cur_hw', time()))
+                self.ovsdb.set_system(**loads(stdin.read()))
+        return 0
+
+    def run_setup_script(self, script, args=()):
+        """
+        Run the setup script in-process with its paths relocated.
+
+        :param str script: Path of the script inside the container.
+        :param list args: Command line arguments of the script.
+        """
+        host_script = self.path(script)
+        with open(host_script, 'r') as fd:
+            source = fd.read()
+
+        # The script imports the OVSDB client shipped next to it
+        sys.modules.setdefault('openswitch_ovsdb', ovsdb)
+
+        namespace = {'__name__': 'openswitch_setup', '__file__': host_script}
+        exec(compile(source, host_script, 'exec'), namespace)
+        for name in [
+                'swns_netns', 'hwdesc_dir', 'db_sock', 'switchd_pid',
+                'sysfs_net', 'ports_ready']:
+            namespace[name] = self.path(namespace[name])
+        namespace.update({
+            'argv': [script] + list(args),
+            'ip_batch': self.ip_batch,
+            'netns_interfaces': lambda netns: list(self.swns),
+            'gethostname': lambda: self.hostname,
+            'call': self.call,
+        })
+
+        try:
+            namespace['main']()
+        finally:
+            namespace['write_timings']()
+        return ''
+
+    def set_link_state(self, netns, iface, state):
+        """
+        Set the state of an interface of a namespace, as ``ip link set``.
+        """
+        if iface not in (self.swns if netns == 'swns' else self.root_ns):
+            raise Exception(
+                'Cannot find device "{}"'.format(iface)
+            )
+        self.link_state[iface] = state
+
+    def ip_link_batches(self, script):
+        """
+        Run the ``ip -force -batch`` files of a ``sh -c`` script, returning
+        the error output of ip.
+        """
+        output = []
+        for command in script.split(';'):
+            args = command.split()
+            if not args or args == ['true']:
+                continue
+            netns = None
+            if args[:3] == ['ip', 'netns', 'exec']:
+                netns = args[3]
+                args = args[4:]
+            with open(self.path(args[3]), 'r') as fd:
+                lines = fd.read().splitlines()
+            for number, line in enumerate(lines, 1):
+                words = line.split()
+                try:
+                    self.set_link_state(netns, words[3], words[4])
+                except Exception as e:
+                    output.append(str(e))
+                    output.append('Command failed {}:{}'.format(
+                        args[3], number
+                    ))
+        return '\n'.join(output)
+
+    def _relocate(self, command):
+        return _CONTAINER_PATH.sub(
+            lambda match: self.path(match.group(0)), command
+        )
+
+    def spawn(self, command):
+        """
+        Execute a command inside the container in background, until the
+        container stops.
+        """
+        self._spawned.append(Popen(shsplit(self._relocate(command))))
+
+    def execute(self, command):
+        """
+        Execute a command inside the container.
+        """
+        self._stopped.wait(self.exec_delay)
+
+        args = command.split()
+        if len(args) > 1 and args[0] == 'python' and \
+                basename(args[1]) == 'openswitch_setup.py':
+            return self.run_setup_script(args[1], args[2:])
+
+        if args == ['ls', '/sys/class/net/']:
+            return '\n'.join(sorted(self.root_ns)) + '\n'
+
+        if args[:3] == ['ip', 'netns', 'exec'] and args[4:7] == [
+                'ip', 'link', 'set']:
+            self.set_link_state(args[3], args[8], args[9])
+            return ''
+        if args[:3] == ['ip', 'link', 'set']:
+            self.set_link_state(None, args[4], args[5])
+            return ''
+
+        if args[:2] == ['sh', '-c'] and '-batch' in command:
+            return self.ip_link_batches(shsplit(command)[2])
+
+        return check_output(
+            ['sh', '-c', self._relocate(command)]
+        ).decode('utf-8')
+
+
+class FakeDockerClient(object):
+    """
+    Docker client answering from a :class:`FakeBackend`.
+    """
+
+    backend = None
+
+    def __init__(self, *args, **kwargs):
+        if self.backend is None:
+            raise Exception('No fake backend installed')
+
+    def images(self, *args, **kwargs):
+        return [{'RepoTags': [self.backend.image]}]
+
+    def inspect_image(self, image=None, **kwargs):
+        if image in self.backend.snapshots:
+            return {'Id': image, 'Created': '2016-01-02', 'RepoTags': []}
+        if image not in [self.backend.image, self.backend.image_id]:
+            raise Exception('No such image: {}'.format(image))
+        return {
+            'Id': self.backend.image_id, 'Created': '2016-01-01',
+            'RepoTags': [self.backend.image]
+        }
+
+    def commit(self, container, **kwargs):
+        image_id = 'sha256:{}'.format(hexlify(urandom(32)).decode())
+        self.backend.snapshots.add(image_id)
+        return {'Id': image_id}
+
+    def remove_image(self, image, force=False):
+        self.backend.snapshots.remove(image)
+
+    def create_host_config(self, **kwargs):
+        return kwargs
+
+    def create_container(self, **kwargs):
+        return {'Id': self.backend.create_container(**kwargs)}
+
+    def inspect_container(self, container=None, **kwargs):
+        return {'Id': container, 'State': {'Pid': getpid()}}
+
+    def start(self, container):
+        self.backend.containers[container].start()
+
+    def stop(self, container):
+        self.backend.containers[container].stop()
+
+    def wait(self, container):
+        return 0
+
+    def remove_container(self, container):
+        del self.backend.containers[container]
+
+    def pause(self, container):
+        pass
+
+    def unpause(self, container):
+        pass
+
+
+_installed_lock = Lock()
+_installed = []
+
+
+class FakeBackend(object):
+    """
+    Stand-in Docker engine holding :class:`FakeContainer` instances.
+
+    :param str image: Name of the only image available.
+    :param container_kwargs: Keyword arguments for the containers.
+    """
+
+    def __init__(self, image='topology/ops:latest', **container_kwargs):
+        self.image = image
+        # A new image for every backend, so nothing is cached across them
+        self.image_id = 'sha256:{}'.format(hexlify(urandom(32)).decode())
+        self.workdir = mkdtemp(prefix='openswitch_fake_')
+        self.shared_dir_base = join(self.workdir, 'shared')
+        self.container_kwargs = container_kwargs
+        self.containers = {}
+        self.snapshots = set()
+        self._numbers = count(1)
+
+    def create_container(
+            self, image=None, name=None, host_config=None, **kwargs):
+        binds = {}
+        for bind in (host_config or {}).get('binds', []):
+            host_dir, mount = bind.split(':')[:2]
+            if host_dir.startswith(self.shared_dir_base):
+                binds[mount] = host_dir
+
+        number = next(self._numbers)
+        container_id = '{:064x}'.format(number)
+        self.containers[container_id] = FakeContainer(
+            join(self.workdir, str(number)), binds,
+            from_snapshot=image in self.snapshots, **self.container_kwargs
+        )
+        return container_id
+
+    @contextmanager
+    def installed(self):
+        """
+        Context manager making :class:`topology_docker.node.DockerNode`
+        instances created in it use this backend.
+        """
+        name = 'APIClient' if hasattr(topology_docker.node, 'APIClient') \
+            else 'Client'
+        # Nodes may be created concurrently, for example by the warm pool,
+        # so the client is only restored when the outermost context exits
+        with _installed_lock:
+            if not _installed:
+                _installed.append(getattr(topology_docker.node, name))
+                setattr(topology_docker.node, name, FakeDockerClient)
+            _installed.append(self)
+            FakeDockerClient.backend = self
+        try:
+            yield self
+        finally:
+            with _installed_lock:
+                _installed.pop()
+                if len(_installed) == 1:
+                    setattr(topology_docker.node, name, _installed.pop())
+
+    def close(self):
+        for container in list(self.containers.values()):
+            container.stop()
+        rmtree(self.workdir, ignore_errors=True)
+
+
+class FakeOpenSwitchNode(OpenSwitchNode):
+    """
+    :class:`OpenSwitchNode` running on a :class:`FakeBackend`.
+
+    :param str identifier: Node unique identifier.
+    :param FakeBackend backend: The fake Docker engine.
+    :param list ports: Port labels linked to this node.
+    """
+
+    def __init__(self, identifier, backend, ports=(), **kwargs):
+        kwargs.setdefault('type', 'openswitch')
+        self.backend = backend
+        with backend.installed():
+            super(FakeOpenSwitchNode, self).__init__(
+                identifier, image=backend.image,
+                shared_dir_base=backend.shared_dir_base, **kwargs
+            )
+        self.container = backend.containers[self.container_id]
+        for portlbl in ports:
+            self.container.add_port(portlbl)
+            self.ports[portlbl] = portlbl
+
+    def _create_pool_member(self):
+        return type(self)(
+            'warm_pool', self.backend, _pool_member=True,
+            binds=self._pool_kwargs['binds']
+        )
+
+    def _ovsdb_relay_command(self):
+        return [
+            sys.executable, '{}/openswitch_ovsdb.py'.format(self.shared_dir),
+            self.container.path(ovsdb.DB_SOCK)
+        ]
+
+    def _docker_exec(self, command):
+        try:
+            return self.container.execute(command)
+        except CalledProcessError:
+            raise
+        except Exception as e:
+            raise CalledProcessError(1, command, str(e))
+
+    def _docker_spawn(self, command):
+        self.container.spawn(command)
+
+    def send_command(self, cmd, shell=None, silent=False):
+        if shell in ['bash', 'bash_swns']:
+            return self._docker_exec(cmd)
+        return super(FakeOpenSwitchNode, self).send_command(
+            cmd, shell=shell, silent=silent
+        )
+
+
+__all__ = [
+    'FakeOvsdbServer', 'FakeContainer', 'FakeDockerClient', 'FakeBackend',
+    'FakeOpenSwitchNode'
+]
@@ -22,7 +22,8 @@ Testing helpers for OpenSwitch support node for the Topology framework.
 from __future__ import unicode_literals, absolute_import
 from __future__ import print_function, division
 
-from time import sleep
+from time import sleep, time
+from threading import Thread
 
 
 def wait_until_interface_up(switch, portlbl, timeout=30, polling_frequency=1):
@@ -49,4 +50,114 @@ def wait_until_interface_up(switch, portlbl, timeout=30, polling_frequency=1):
         )
 
 
-__all__ = ['wait_until_interface_up']
+def get_interfaces_state(switch):
+    """
+    Get the administrative and link state of every interface of a switch with
+    a single OVSDB query, through its persistent OVSDB connection.
+
+    :param switch: The switch node.
+    :rtype: dict
+    :return: Mapping of interface names to ``(admin_state, link_state)``
+     tuples, with ``None`` for unset states.
+    """
+    rows = switch.ovsdb_select(
+        'Interface', ['name', 'admin_state', 'link_state']
+    )
+
+    def value(column):
+        # Empty optional columns are encoded as empty sets
+        return column if not isinstance(column, list) else None
+
+    return dict(
+        (row['name'], (value(row['admin_state']), value(row['link_state'])))
+        for row in rows
+    )
+
+
+def wait_until_interfaces_up(
+        switch_ports, timeout=30, min_interval=0.05, max_interval=1.0):
+    """
+    Wait until all the given ports of all the given switches are up.
+
+    The switches are polled concurrently, querying all the ports of a switch
+    at once. The polling interval of each switch starts at ``min_interval``
+    and grows up to ``max_interval`` while its ports are still down.
+
+    :param switch_ports: Mapping of switch nodes to lists of port labels, or
+     list of ``(switch, portlbl)`` tuples.
+    :param float timeout: Number of seconds to wait.
+    :param float min_interval: Initial seconds between polls of a switch.
+    :param float max_interval: Maximum seconds between polls of a switch.
+    :return: None if all interfaces are brought-up. If not, an assertion is
+     raised listing the ports that never came up.
+    """
+    if not hasattr(switch_ports, 'items'):
+        grouped = {}
+        for switch, portlbl in switch_ports:
+            grouped.setdefault(switch, []).append(portlbl)
+        switch_ports = grouped
+
+    deadline = time() + timeout
+    # Switches whose worker fails before polling are reported as pending
+    pending = dict(
+        (switch, dict.fromkeys(portlbls, 'never polled'))
+        for switch, portlbls in switch_ports.items()
+    )
+
+    def poll(switch, portlbls):
+        ifaces = dict(
+            (portlbl, switch.ports.get(portlbl, portlbl))
+            for portlbl in portlbls
+        )
+        interval = min_interval
+        while True:
+            try:
+                states = get_interfaces_state(switch)
+                error = None
+            except Exception as e:
+                states = {}
+                error = str(e)
+
+            down = dict(
+                (portlbl, states.get(iface, error or 'no such interface'))
+                for portlbl, iface in ifaces.items()
+                if states.get(iface) != ('up', 'up')
+            )
+            if not down or time() >= deadline:
+                return down
+
+            sleep(min(interval, max(0, deadline - time())))
+            interval = min(interval * 1.5, max_interval)
+
+    def wait(switch, portlbls):
+        try:
+            pending[switch] = poll(switch, portlbls)
+        except Exception as e:
+            pending[switch] = dict.fromkeys(portlbls, str(e))
+
+    threads = [
+        Thread(target=wait, args=(switch, portlbls))
+        for switch, portlbls in switch_ports.items()
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    never_up = [
+        '{}:{} {}'.format(switch.identifier, portlbl, state)
+        for switch, down in pending.items()
+        for portlbl, state in sorted(down.items())
+    ]
+    assert not never_up, (
+        'Interfaces never brought-up after waiting for {} seconds '
+        '(admin state, link state):\n    {}'.format(
+            timeout, '\n    '.join(sorted(never_up))
+        )
+    )
+
+
+__all__ = [
+    'wait_until_interface_up', 'get_interfaces_state',
+    'wait_until_interfaces_up'
+]
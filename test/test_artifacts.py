@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+Test suite for the collection of the artifacts of the nodes.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from os import stat
+from json import loads
+from time import time
+from threading import Event
+import tarfile
+
+from topology_docker_openswitch.artifacts import (
+    IncrementalCopy, LogFollower, ArtifactPolicy, ArtifactCollector,
+    MANIFEST, SKIPPED, FOLLOWED_LOG, FOLLOWER_PID, incremental_copy
+)
+from topology_docker_openswitch.cache import image_cache, configure_image_cache
+from topology_docker_openswitch.engine import engine, configure_engine
+
+from .fakes import FakeBackend, FakeOpenSwitchNode
+
+
+def test_incremental_copy(tmpdir):
+    """
+    Check that appended bytes, unchanged and rewritten files are copied as
+    such, keeping the layout of the tree.
+    """
+    shared = tmpdir.mkdir('shared')
+    shared.join('logs').write('first\n')
+    shared.join('state.json').write('{"a": 1}')
+    shared.mkdir('var').join('messages').write('boot\n')
+
+    copy = IncrementalCopy(enabled=True)
+    copy.copytree(str(shared), str(tmpdir.join('test1')))
+    assert tmpdir.join('test1', 'var', 'messages').read() == 'boot\n'
+    assert not tmpdir.join('test1', MANIFEST).check()
+
+    shared.join('logs').write('second\n', mode='a')
+    shared.join('var', 'messages').write('reboot\n')
+    copy.copytree(str(shared), str(tmpdir.join('test2')))
+
+    assert tmpdir.join('test2', 'logs').read() == 'second\n'
+    assert tmpdir.join('test2', 'var', 'messages').read() == 'reboot\n'
+    assert stat(str(tmpdir.join('test2', 'state.json'))).st_ino == \
+        stat(str(tmpdir.join('test1', 'state.json'))).st_ino
+    assert loads(tmpdir.join('test2', MANIFEST).read()) == {'logs': 6}
+
+    copy.copytree(str(shared), str(tmpdir.join('test3')))
+    assert tmpdir.join('test3', 'logs').read() == ''
+    assert loads(tmpdir.join('test3', MANIFEST).read()) == {'logs': 13}
+
+
+class StubNode(object):
+
+    shared_dir_mount = '/var/topology'
+
+    def __init__(self, identifier, shared_dir, hang=None):
+        self.identifier = identifier
+        self.shared_dir = shared_dir
+        self.hang = hang
+        self.spawned = []
+        self.executed = []
+
+    def _docker_spawn(self, command):
+        self.spawned.append(command)
+
+    def _docker_exec(self, command):
+        self.executed.append(command)
+        return ''
+
+    def capture_output(self, command, filename, shell='vtysh'):
+        if self.hang is not None:
+            self.hang.wait(10)
+        with open('{}/{}'.format(self.shared_dir, filename), 'w') as fd:
+            fd.write(command)
+
+
+def test_collector_deadline(tmpdir):
+    """
+    Check that nodes are collected concurrently and that a hung node is
+    abandoned after its deadline.
+    """
+    hang = Event()
+    nodes = [
+        StubNode('sw1', str(tmpdir.mkdir('sw1'))),
+        StubNode('sw2', str(tmpdir.mkdir('sw2')), hang=hang),
+        StubNode('sw3', str(tmpdir.mkdir('sw3'))),
+    ]
+    collector = ArtifactCollector(
+        IncrementalCopy(), ArtifactPolicy(), concurrency=2, deadline=0.5
+    )
+
+    start = time()
+    try:
+        abandoned = collector.collect(nodes, str(tmpdir.join('test')))
+    finally:
+        hang.set()
+
+    assert time() - start < 5
+    assert abandoned == ['sw2']
+    assert tmpdir.join('test', 'sw1', 'var_messages.log').read() == \
+        'cat /var/log/messages'
+    assert tmpdir.join('test', 'sw3', 'var_messages.log').check()
+
+
+def test_collector_policy(tmpdir):
+    """
+    Check that only lightweight artifacts are collected after tests that
+    passed, within the budgets, and streamed into archives.
+    """
+    shared = tmpdir.mkdir('sw1')
+    shared.join('small.log').write('x' * 10)
+    shared.join('large.log').write('x' * 1000)
+    node = StubNode('sw1', str(shared))
+
+    policy = ArtifactPolicy(
+        collect='failed', light_size=100, session_budget=1500,
+        compression='gz'
+    )
+    collector = ArtifactCollector(IncrementalCopy(), policy)
+
+    collector.collect([node], str(tmpdir.mkdir('passed')))
+    with tarfile.open(str(tmpdir.join('passed', 'sw1.tar.gz'))) as tar:
+        assert tar.getnames() == ['sw1/small.log']
+    assert not tmpdir.join('passed', SKIPPED).check()
+
+    collector.collect([node], str(tmpdir.mkdir('failed')), failed=True)
+    with tarfile.open(str(tmpdir.join('failed', 'sw1.tar.gz'))) as tar:
+        assert sorted(tar.getnames()) == [
+            'sw1/large.log', 'sw1/small.log', 'sw1/var_messages.log'
+        ]
+
+    # The session budget is exhausted
+    collector.collect([node], str(tmpdir.mkdir('again')), failed=True)
+    with tarfile.open(str(tmpdir.join('again', 'sw1.tar.gz'))) as tar:
+        assert sorted(tar.getnames()) == [
+            'sw1/small.log', 'sw1/var_messages.log'
+        ]
+    assert tmpdir.join('again', SKIPPED).read() == '{}\n'.format(
+        shared.join('large.log')
+    )
+
+
+def test_collector_incremental_budget(tmpdir):
+    """
+    Check that incremental copies only take the bytes they write from the
+    budgets.
+    """
+    shared = tmpdir.mkdir('sw1')
+    shared.join('var_messages.log').write('')
+    shared.join('state.json').write('x' * 600)
+    shared.join('growing.log').write('x' * 300)
+    node = StubNode('sw1', str(shared))
+
+    policy = ArtifactPolicy(session_budget=1500)
+    collector = ArtifactCollector(IncrementalCopy(enabled=True), policy)
+
+    collector.collect([node], str(tmpdir.mkdir('test1')))
+    assert policy._used == 600 + 300 + len('cat /var/log/messages')
+
+    # The unchanged file is linked, only the appended bytes are copied
+    shared.join('growing.log').write('y' * 100, mode='a')
+    for test in ['test2', 'test3', 'test4']:
+        collector.collect([node], str(tmpdir.mkdir(test)))
+        assert not tmpdir.join(test, SKIPPED).check()
+    assert tmpdir.join('test2', 'sw1', 'growing.log').read() == 'y' * 100
+    assert tmpdir.join('test4', 'sw1', 'state.json').read() == 'x' * 600
+    assert policy._used == 600 + 300 + 100 + 4 * len('cat /var/log/messages')
+
+
+def test_log_follower(tmpdir):
+    """
+    Check that the followed log is sliced per test at line boundaries, and
+    left out of the collected artifacts.
+    """
+    shared = tmpdir.mkdir('sw1')
+    node = StubNode('sw1', str(shared))
+    follower = LogFollower(enabled=True)
+    collector = ArtifactCollector(
+        IncrementalCopy(), ArtifactPolicy(), follower=follower
+    )
+
+    follower.start(node)
+    follower.start(node)
+    assert len(node.spawned) == 1
+    assert FOLLOWED_LOG in node.spawned[0]
+
+    followed = shared.join(FOLLOWED_LOG)
+    followed.write('boot\nfirst\nsec')
+    collector.collect([node], str(tmpdir.mkdir('test1')))
+    assert tmpdir.join('test1', 'sw1', 'var_messages.log').read() == \
+        'boot\nfirst\n'
+    assert not tmpdir.join('test1', 'sw1', FOLLOWED_LOG).check()
+
+    followed.write('ond\nthird\n', mode='a')
+    collector.collect([node], str(tmpdir.mkdir('test2')))
+    assert tmpdir.join('test2', 'sw1', 'var_messages.log').read() == \
+        'second\nthird\n'
+
+    # The lines logged between tests are left out, up to the last complete
+    # one at the start of the test
+    followed.write('between\nstill', mode='a')
+    follower.mark()
+    followed.write(' writing\nfourth\n', mode='a')
+    collector.collect([node], str(tmpdir.mkdir('test3')))
+    assert tmpdir.join('test3', 'sw1', 'var_messages.log').read() == \
+        'still writing\nfourth\n'
+
+    follower.stop(node)
+    assert not follower.following(node)
+    assert len(node.executed) == 1
+    assert FOLLOWER_PID in node.executed[0]
+    assert 'kill' in node.executed[0]
+    follower.stop(node)
+    assert len(node.executed) == 1
+
+
+def test_incremental_copy_forgotten_on_stop(tmpdir):
+    """
+    Check that the copies of the shared directory of a node are forgotten
+    once it is stopped.
+    """
+    directory, api = image_cache.directory, engine.api
+    configure_image_cache(None)
+    configure_engine(False)
+    backend = FakeBackend(step_delay=0.01)
+    enabled = incremental_copy.enabled
+    incremental_copy.enabled = True
+    try:
+        node = FakeOpenSwitchNode('sw1', backend)
+        node.start()
+        node.notify_post_build()
+        incremental_copy.copytree(node.shared_dir, str(tmpdir.join('test1')))
+
+        def copied():
+            return [
+                path for path in incremental_copy._files
+                if path.startswith(node.shared_dir)
+            ]
+
+        assert copied()
+        node.stop()
+        assert not copied()
+    finally:
+        incremental_copy.enabled = enabled
+        backend.close()
+        configure_image_cache(directory)
+        configure_engine(api)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Test suite for the per image cache.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+import sys
+from json import dumps
+
+from pytest import raises
+
+from topology_docker_openswitch import ovsdb
+from topology_docker_openswitch.cache import ImageCache
+from topology_docker_openswitch.openswitch import OpenSwitchNode, SETUP_SCRIPT
+
+
+def test_image_cache_persistence(tmpdir):
+    """
+    Check that entries are persisted per image and read back by a new cache.
+    """
+    hwports = ['1', '2', '3']
+    cache = ImageCache(str(tmpdir))
+    cache.set('sha256:abc', 'hwports', hwports)
+
+    assert cache.get('sha256:abc', 'hwports') == hwports
+
+    reloaded = ImageCache(str(tmpdir))
+    assert reloaded.get('sha256:abc', 'hwports') == hwports
+    assert reloaded.get('sha256:def', 'hwports') is None
+    assert reloaded.get('sha256:abc', 'snapshot') is None
+
+
+class PortsNode(object):
+
+    def __init__(self, ports):
+        self.ports = ports
+
+
+def test_map_ports(tmpdir):
+    """
+    Check that the host maps the ports like the setup script, fails early
+    without enough hardware ports, and that the script applies the plan.
+    """
+    node = PortsNode({'2': '2', '10': '10', 'mgmt': 'oobm', '1': '1'})
+    planned = OpenSwitchNode._map_ports(node, ['1', '2', '3', '4'])
+    assert planned == {'1': '1', '10': '2', '2': '3'}
+
+    with raises(Exception) as e:
+        OpenSwitchNode._map_ports(node, ['1', '2'])
+    assert '3 ports requested but only 2' in str(e.value)
+
+    # Load the setup script, without running it, as the container would
+    sys.modules.setdefault('openswitch_ovsdb', ovsdb)
+    script = str(tmpdir.join('openswitch_setup.py'))
+    setup_script = {'__name__': 'openswitch_setup', '__file__': script}
+    exec(compile(SETUP_SCRIPT, script, 'exec'), setup_script)
+
+    # The setup script reads the plan from the shared directory
+    assert setup_script['read_planned_mapping']() is None
+    tmpdir.join('port_plan.json').write(dumps(planned))
+    assert setup_script['read_planned_mapping']() == planned
+
+    # and applies it when it planned for the interfaces of the container
+    net = tmpdir.mkdir('net')
+    for iface in ['lo', '1', '2', '10']:
+        net.mkdir(iface)
+    batches = []
+    setup_script.update({
+        'sysfs_net': str(net),
+        'ports_ready': str(tmpdir.join('ports_ready')),
+        'netns_interfaces': lambda netns: [],
+        'ip_batch': lambda commands, netns=None: batches.append(commands),
+    })
+
+    def renamed(plan):
+        del batches[:]
+        setup_script['create_interfaces'](['1', '2', '3', '4'], plan)
+        return sorted(
+            command for command, _ in batches[-1] if ' name ' in command
+        )
+
+    assert renamed({'1': '4', '10': '2', '2': '3'}) == [
+        'link set dev 1 name 4', 'link set dev 10 name 2',
+        'link set dev 2 name 3',
+    ]
+    assert ('tuntap add dev 1 mode tap', 'Failed to create tuntap') in \
+        batches[-1]
+    assert renamed({'1': '4', '2': '3'}) == renamed(None) == [
+        'link set dev 1 name 1', 'link set dev 10 name 2',
+        'link set dev 2 name 3',
+    ]
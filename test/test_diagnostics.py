@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+Test suite for the diagnostics of the nodes that failed to set up.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from json import loads
+from time import time, strftime, localtime
+from shlex import split as shsplit
+from subprocess import check_output
+
+from topology_docker_openswitch.diagnostics import (
+    Probe, SyslogProbe, Diagnostics, BUNDLE
+)
+
+
+class StubNode(object):
+
+    identifier = 'sw1'
+    container_id = 'abc'
+
+    def __init__(self, shared_dir):
+        self.shared_dir = shared_dir
+
+    def _docker_exec(self, command):
+        # Run the command in the host instead of the container
+        return check_output(shsplit(command)).decode('utf-8')
+
+
+def test_diagnostics_bounded(tmpdir):
+    """
+    Check that probes run concurrently, within their timeout, and that their
+    output is capped.
+    """
+    def failing(node, max_output):
+        raise Exception('No daemon')
+
+    diagnostics = Diagnostics([
+        Probe('hello', 'echo hello'),
+        Probe('large', 'yes | head -c 5000'),
+        Probe('hung', 'sleep 30'),
+        Probe('failed', 'echo nope; exit 3'),
+        Probe('host', lambda node, max_output: (node.identifier, False)),
+        Probe('broken', failing),
+    ], timeout=1, max_output=1000)
+
+    start = time()
+    results = diagnostics.collect(StubNode(str(tmpdir)), Exception('Boom'))
+    assert time() - start < 5
+
+    assert results['hello']['output'] == 'hello\n'
+    assert results['hello']['status'] == 0
+    assert len(results['large']['output']) == 1000
+    assert results['large']['truncated']
+    assert results['hung']['timed_out']
+    assert results['failed']['status'] == 3
+    assert results['failed']['output'] == 'nope\n'
+    assert results['host']['output'] == 'sw1'
+    assert results['broken']['error'] == 'No daemon'
+
+    bundle = loads(tmpdir.join(BUNDLE).read())
+    assert bundle['error'] == 'Boom'
+    assert list(bundle['probes']) == list(results)
+
+
+def test_syslog_probe(tmpdir):
+    """
+    Check that only the syslog lines of the container of the node are kept,
+    unless the lines of the OpenSwitch daemons are asked for.
+    """
+    now = int(time())
+
+    def line(offset, text):
+        return '{} host {}\n'.format(
+            strftime('%b %d %H:%M:%S', localtime(now + offset)), text
+        )
+
+    syslog = tmpdir.join('syslog')
+    syslog.write(''.join([
+        line(-5, 'dockerd[1]: container abc started'),
+        line(-4, 'ovsdb-server[40]: listening on db.sock'),
+        line(-3, 'dockerd[1]: container def started'),
+        line(-2, 'ops-switchd[41]: fatal error, exiting'),
+    ]))
+
+    node = StubNode(str(tmpdir))
+    node.container_name = 'sw1_abc'
+    node._created_at = now - 10
+
+    probe = SyslogProbe('syslog', path=str(syslog))
+    assert probe.run(node, 1, 1000)['output'] == \
+        line(-5, 'dockerd[1]: container abc started')
+
+    probe.daemons = True
+    assert probe.run(node, 1, 1000)['output'] == ''.join([
+        line(-5, 'dockerd[1]: container abc started'),
+        line(-4, 'ovsdb-server[40]: listening on db.sock'),
+        line(-2, 'ops-switchd[41]: fatal error, exiting'),
+    ])
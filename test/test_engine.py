@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+Test suite for the Docker Engine API access.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from pytest import raises
+from subprocess import CalledProcessError
+
+from topology_docker_openswitch.engine import DockerEngine
+
+
+class StubClient(object):
+
+    def __init__(self, exit_code=0, demux=True):
+        self.exit_code = exit_code
+        self.demux = demux
+        self.commands = []
+
+    def exec_create(self, container, cmd, stdout=True, stderr=True):
+        self.commands.append((container, cmd, stderr))
+        return {'Id': str(len(self.commands)), 'stderr': stderr}
+
+    def exec_start(self, exec_id, **kwargs):
+        if 'demux' in kwargs:
+            if not self.demux:
+                raise TypeError('demux')
+            return b'output\n', b'warning\n'
+        # Without demux, both streams are merged
+        return b'output\nwarning\n' if exec_id['stderr'] else b'output\n'
+
+    def exec_inspect(self, exec_id):
+        return {'ExitCode': self.exit_code}
+
+
+def test_engine_api_exec():
+    """
+    Check that commands run through the Engine API and that failures raise
+    like the docker CLI does.
+    """
+    engine = DockerEngine()
+    engine._client = StubClient()
+
+    assert engine.execute('abc', 'ip link set "port 1" up') == 'output\n'
+    assert engine._client.commands == [
+        ('abc', ['ip', 'link', 'set', 'port 1', 'up'], True)
+    ]
+
+    # Older clients only get the standard output too
+    engine._client = StubClient(demux=False)
+    assert engine.execute('abc', 'true') == 'output\n'
+    assert engine.execute('abc', 'true') == 'output\n'
+    assert [stderr for _, _, stderr in engine._client.commands] == [
+        True, False, False
+    ]
+    engine._demux = True
+
+    engine._client = StubClient(exit_code=2)
+    with raises(CalledProcessError) as e:
+        engine.execute('abc', 'false')
+    assert e.value.returncode == 2
+    assert e.value.output == 'output\n'
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+Test suite for the testing helpers.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from time import time
+
+from pytest import raises
+
+from .helpers import get_interfaces_state, wait_until_interfaces_up
+
+
+class StubSwitch(object):
+    """
+    Switch whose interfaces come up after some polls.
+    """
+
+    def __init__(self, identifier, up_after):
+        self.identifier = identifier
+        self.ports = {'1': '1', '2': '2'}
+        self.up_after = up_after
+        self.polls = []
+
+    def ovsdb_select(self, table, columns=None, where=()):
+        assert table == 'Interface'
+        self.polls.append(time())
+        up = len(self.polls) > self.up_after
+        return [
+            {
+                'name': '1', 'admin_state': 'up',
+                'link_state': 'up' if up else 'down'
+            },
+            {
+                'name': '2', 'admin_state': 'up' if up else ['set', []],
+                'link_state': 'up' if up else ['set', []]
+            },
+        ]
+
+
+def test_get_interfaces_state():
+    """
+    Check that the states are read from a single OVSDB select.
+    """
+    switch = StubSwitch('sw1', up_after=1)
+    assert get_interfaces_state(switch) == {
+        '1': ('up', 'down'), '2': (None, None)
+    }
+    assert len(switch.polls) == 1
+
+
+def test_wait_until_interfaces_up():
+    """
+    Check that the polling backs off until the ports are up, and that ports
+    never up are reported once timed out.
+    """
+    switch = StubSwitch('sw1', up_after=4)
+    wait_until_interfaces_up(
+        {switch: ['1', '2']}, timeout=5, min_interval=0.02, max_interval=0.05
+    )
+    assert len(switch.polls) == 5
+    intervals = [
+        after - before for before, after in zip(switch.polls, switch.polls[1:])
+    ]
+    # Sleeps last at least as asked, the upper bound allows for loaded hosts
+    for interval, expected in zip(intervals, [0.02, 0.03, 0.045, 0.05]):
+        assert expected * 0.9 <= interval < expected + 1
+
+    stuck = StubSwitch('sw2', up_after=1000)
+    start = time()
+    with raises(AssertionError) as e:
+        wait_until_interfaces_up(
+            [(stuck, '1'), (stuck, '2')], timeout=0.3, min_interval=0.02,
+            max_interval=0.05
+        )
+    assert 0.3 <= time() - start < 5
+    assert "sw2:1 ('up', 'down')" in str(e.value)
+    assert 'sw2:2 (None, None)' in str(e.value)
+
+
+def test_wait_until_interfaces_up_failed_worker():
+    """
+    Check that the ports of a switch whose worker failed are reported.
+    """
+    broken = StubSwitch('sw3', up_after=0)
+    broken.ports = None
+
+    with raises(AssertionError) as e:
+        wait_until_interfaces_up(
+            {broken: ['1'], StubSwitch('sw4', up_after=0): ['1']}, timeout=1
+        )
+    assert 'sw3:1 ' in str(e.value)
+    assert 'sw4' not in str(e.value)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+Test suite for the extraction of the lines of the host syslog.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from time import time, strftime, localtime
+
+from topology_docker_openswitch.hostlog import parse_timestamp, extract
+
+
+def test_parse_timestamp():
+    """
+    Check the timestamps of the traditional and RFC 3339 formats.
+    """
+    assert parse_timestamp(b'2016-10-16T20:55:23+02:00 host', 2016) == \
+        parse_timestamp(b'2016-10-16T18:55:23.000123Z host', 2016)
+    assert parse_timestamp(b'Oct 16 20:55:23 host', 2016) == \
+        parse_timestamp(b'2016-10-16 20:55:23 host', 2016)
+    assert parse_timestamp(b'Oct  6 20:55:23 host', 2016) is not None
+    assert parse_timestamp(b'no timestamp', 2016) is None
+
+
+def test_extract(tmpdir):
+    """
+    Check that only the lines about the container within the window are
+    extracted, up to the cap.
+    """
+    now = int(time())
+
+    def line(offset, text):
+        return '{} host {}\n'.format(
+            strftime('%b %d %H:%M:%S', localtime(now + offset)), text
+        )
+
+    syslog = tmpdir.join('syslog')
+    syslog.write(''.join(
+        [line(-3600, 'abc123 before the container')] +
+        [line(-10, 'other{} noise'.format(i)) for i in range(200)] +
+        [line(-5, 'abc123 created'), line(-4, 'sw1 started')] +
+        [line(-3, 'other noise') for i in range(200)] +
+        [line(-2, 'abc123 failed'), line(60, 'abc123 after the failure')]
+    ))
+
+    text, truncated = extract(
+        str(syslog), ['abc123', 'sw1'], since=now - 10, until=now
+    )
+    assert text == ''.join([
+        line(-5, 'abc123 created'), line(-4, 'sw1 started'),
+        line(-2, 'abc123 failed'),
+    ])
+    assert not truncated
+
+    # The most recent lines are kept
+    text, truncated = extract(
+        str(syslog), ['abc123'], since=now - 10, until=now, max_bytes=40
+    )
+    assert text == line(-2, 'abc123 failed')
+    assert truncated
+
+    # Without a window, and without a newline at the end
+    syslog.write('abc123 last', mode='a')
+    text, truncated = extract(str(syslog), ['abc123'])
+    assert text.startswith(line(-3600, 'abc123 before the container'))
+    assert text.endswith(
+        line(60, 'abc123 after the failure') + 'abc123 last\n'
+    )
+
+    tmpdir.join('empty').write('')
+    assert extract(str(tmpdir.join('empty')), ['abc123']) == ('', False)
+
+
+def test_extract_daemons_and_fallback(tmpdir):
+    """
+    Check that the lines of the daemons of the container, logged without its
+    ID, are extracted, and that the whole window is extracted when no line
+    mentions the container.
+    """
+    from topology_docker_openswitch.diagnostics import SYSLOG_IDENTIFIERS
+
+    now = int(time())
+
+    def line(offset, text):
+        return '{} host {}\n'.format(
+            strftime('%b %d %H:%M:%S', localtime(now + offset)), text
+        )
+
+    syslog = tmpdir.join('syslog')
+    syslog.write(''.join([
+        line(-3600, 'ops-switchd[12]: of an older node'),
+        line(-5, 'dockerd[1]: container abc123 started'),
+        line(-4, 'ovsdb-server[40]: listening on db.sock'),
+        line(-3, 'cron[7]: unrelated'),
+        line(-2, 'ops-switchd[41]: fatal error, exiting'),
+    ]))
+
+    text, truncated = extract(
+        str(syslog), ['abc123'] + SYSLOG_IDENTIFIERS,
+        since=now - 10, until=now
+    )
+    assert text == ''.join([
+        line(-5, 'dockerd[1]: container abc123 started'),
+        line(-4, 'ovsdb-server[40]: listening on db.sock'),
+        line(-2, 'ops-switchd[41]: fatal error, exiting'),
+    ])
+
+    # Nothing about the container, the window is extracted unfiltered
+    text, truncated = extract(
+        str(syslog), ['def456'], since=now - 10, until=now, fallback=True
+    )
+    assert text == ''.join([
+        line(-5, 'dockerd[1]: container abc123 started'),
+        line(-4, 'ovsdb-server[40]: listening on db.sock'),
+        line(-3, 'cron[7]: unrelated'),
+        line(-2, 'ops-switchd[41]: fatal error, exiting'),
+    ])
+    assert extract(
+        str(syslog), ['def456'], since=now - 10, until=now
+    ) == ('', False)
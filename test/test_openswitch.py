@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+Test suite for the host side of the OpenSwitch node.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+import sys
+from os import makedirs, listdir
+from os.path import join, exists, basename
+from time import time, sleep
+from threading import Thread
+
+from pytest import raises, fixture
+
+from topology_docker_openswitch import ovsdb
+from topology_docker_openswitch.openswitch import (
+    OpenSwitchNode, ParallelSetup, SETUP_SCRIPT
+)
+
+
+class StubNode(object):
+
+    def __init__(self, identifier, error=None):
+        self.identifier = identifier
+        self.error = error
+        self.set_up = False
+
+    def _setup_system(self):
+        if self.error is not None:
+            raise Exception(self.error)
+        self.set_up = True
+
+
+def test_parallel_setup_aborted_build():
+    """
+    Check that the nodes of an aborted build don't leak into the next one,
+    and that resizing the pool retires the previous one.
+    """
+    setup = ParallelSetup(max_workers=2)
+
+    failed = StubNode('sw1', error='Boom')
+    aborted = StubNode('sw2')
+    for node in [failed, aborted]:
+        setup.register(node)
+    assert setup.submit(failed)
+
+    # The build is aborted before sw2 is notified
+    for node in [failed, aborted]:
+        setup.unregister(node)
+
+    nodes = [StubNode('sw3'), StubNode('sw4')]
+    for node in nodes:
+        setup.register(node)
+    setup.max_workers = 3
+    retired = setup._pool
+    for node in nodes:
+        assert setup.submit(node)
+    assert all(node.set_up for node in nodes)
+    # The replaced pool was closed
+    with raises(ValueError):
+        retired.apply_async(len, ([],))
+
+    broken = StubNode('sw5', error='Boom')
+    setup.register(broken)
+    with raises(Exception) as e:
+        setup.submit(broken)
+    assert 'sw5: Boom' in str(e.value)
+    assert 'sw1' not in str(e.value)
+
+    assert not setup.submit(StubNode('sw6'))
+
+
+class VtyshNode(object):
+    """
+    Node running the vtysh configuration scripts with a canned output.
+    """
+
+    def __init__(self, shared_dir, output):
+        self.shared_dir = shared_dir
+        self.shared_dir_mount = '/tmp'
+        self.output = output
+        self.scripts = []
+
+    def _docker_exec(self, command):
+        script = basename(command.split()[-1])
+        with open(join(self.shared_dir, script)) as fd:
+            self.scripts.append((script, fd.read()))
+        return self.output
+
+
+def test_vtysh_config(tmpdir):
+    """
+    Check that the echoed vtysh output is split back into the configuration
+    lines, with the lines after the failed one reported as not applied.
+    """
+    node = VtyshNode(str(tmpdir), '\n'.join([
+        'switch# configure terminal',
+        'switch(config)# interface 7',
+        'switch(config-if)# ip address 10.0.0.1/24',
+        'switch(config-if)# ip address 10.0.0.300/24',
+        '% Invalid input detected.',
+        '% Unknown command.',
+    ]))
+    config = (
+        'interface 7',
+        '    ip address 10.0.0.1/24',
+        '',
+        '    ! A comment',
+        '    ip address 10.0.0.300/24',
+        '    no shutdown',
+    )
+
+    assert OpenSwitchNode.vtysh_config(node, config) == [
+        None, None, None, None,
+        '% Invalid input detected.\n% Unknown command.',
+        'Not applied, a previous line failed',
+    ]
+    assert OpenSwitchNode.vtysh_config(node, '\n'.join(config)) == \
+        OpenSwitchNode.vtysh_config(node, list(config))
+
+    # Every call ran its own script, removed afterwards
+    names = [name for name, _ in node.scripts]
+    assert len(set(names)) == len(names) == 3
+    assert not listdir(str(tmpdir))
+    assert node.scripts[0][1] == (
+        "vtysh -E -c 'configure terminal' -c 'interface 7' "
+        "-c 'ip address 10.0.0.1/24' -c 'ip address 10.0.0.300/24' "
+        "-c 'no shutdown'\n"
+    )
+
+
+@fixture
+def setup_script(tmpdir):
+    """
+    Load the setup script, without running it, as the container would.
+    """
+    # The script imports the OVSDB client shipped next to it
+    sys.modules.setdefault('openswitch_ovsdb', ovsdb)
+
+    script = str(tmpdir.join('openswitch_setup.py'))
+    namespace = {'__name__': 'openswitch_setup', '__file__': script}
+    exec(compile(SETUP_SCRIPT, script, 'exec'), namespace)
+    return namespace
+
+
+def later(delay, function, *args):
+    thread = Thread(target=lambda: (sleep(delay), function(*args)))
+    thread.start()
+    return thread
+
+
+def test_setup_path_waiter(tmpdir, setup_script):
+    """
+    Check that waiting for a path wakes up on its creation, following its
+    parent directories as they appear, without waiting for the re-checks.
+    """
+    path = join(str(tmpdir), 'run', 'netns', 'swns')
+
+    def create():
+        makedirs(join(str(tmpdir), 'run'))
+        sleep(0.05)
+        makedirs(join(str(tmpdir), 'run', 'netns'))
+        sleep(0.05)
+        open(path, 'w').close()
+
+    waiter = setup_script['watch'](setup_script['PathWaiter'], path)
+    assert waiter is not None
+
+    thread = later(0.1, create)
+    start = time()
+    setup_script['wait_until'](
+        lambda: exists(path), 'No path', waiter, timeout=5
+    )
+    thread.join()
+    assert time() - start < setup_script['recheck_interval']
+
+
+def test_setup_wait_until_polling(setup_script):
+    """
+    Check that waiting falls back to polling when the waiter is unavailable.
+    """
+    class BrokenWaiter(setup_script['Waiter']):
+        def __init__(self):
+            raise OSError('No notifications')
+
+    assert setup_script['watch'](BrokenWaiter) is None
+
+    ready = []
+    thread = later(0.1, ready.append, True)
+    start = time()
+    setup_script['wait_until'](lambda: ready, 'Not ready', timeout=5)
+    thread.join()
+    assert time() - start < setup_script['recheck_interval']
+
+
+def test_setup_wait_until_timeout(setup_script):
+    """
+    Check that waiting raises the given error once timed out, closing the
+    waiter.
+    """
+    waiter = setup_script['watch'](setup_script['HostnameWaiter'])
+    assert waiter is not None
+
+    start = time()
+    with raises(Exception) as e:
+        setup_script['wait_until'](
+            lambda: False, 'Hostname never set', waiter, timeout=0.3
+        )
+    assert str(e.value) == 'Hostname never set'
+    assert 0.3 <= time() - start < setup_script['recheck_interval']
+    assert waiter._fd.closed
+
+
+def test_setup_ip_batch(setup_script):
+    """
+    Check that the failing command of a batch is mapped back to its error.
+    """
+    runs = []
+
+    class CannedPopen(object):
+        returncode = 1
+
+        def __init__(self, args, **kwargs):
+            self.args = args
+
+        def communicate(self, batch):
+            runs.append((self.args, batch.decode('utf-8')))
+            return b'', (
+                b'RTNETLINK answers: File exists\n'
+                b'Command failed -:2\n'
+            )
+
+    setup_script['Popen'] = CannedPopen
+    commands = [
+        ('link delete dev 1', 'Failed to delete 1'),
+        ('link delete dev 2', 'Failed to delete 2'),
+        ('link delete dev 3', 'Failed to delete 3'),
+    ]
+    with raises(Exception) as e:
+        setup_script['ip_batch'](commands, netns='swns')
+    assert str(e.value) == 'Failed to delete 2'
+    assert runs == [(
+        ['ip', 'netns', 'exec', 'swns', 'ip', '-batch', '-'],
+        'link delete dev 1\nlink delete dev 2\nlink delete dev 3\n'
+    )]
+
+    setup_script['ip_batch']([], netns='swns')
+    assert len(runs) == 1
+
+
+def test_setup_netns_interfaces_stuck(tmpdir, setup_script):
+    """
+    Check that failing to move back from the switch namespace raises instead
+    of falling back to listing with ip.
+    """
+    class StuckLibc(object):
+        def __init__(self):
+            self.setns_calls = 0
+            self.stuck = True
+
+        def setns(self, fd, nstype):
+            self.setns_calls += 1
+            return -1 if self.stuck and self.setns_calls > 1 else 0
+
+    libc = StuckLibc()
+    fallbacks = []
+    netns = tmpdir.join('swns')
+    netns.write('')
+    setup_script.update({
+        'CDLL': lambda name, use_errno: libc,
+        'if_names': lambda libc: ['1', '2'],
+        'check_output': lambda args: fallbacks.append(args),
+    })
+
+    with raises(Exception) as e:
+        setup_script['netns_interfaces'](str(netns))
+    assert 'Failed to move back from {}'.format(netns) in str(e.value)
+    assert libc.setns_calls == 2
+    assert not fallbacks
+
+    libc.stuck = False
+    assert setup_script['netns_interfaces'](str(netns)) == ['1', '2']
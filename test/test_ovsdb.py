@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Test suite for the OVSDB JSON-RPC client.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+import sys
+from json import dumps
+from os.path import join
+from threading import Thread, Lock
+from subprocess import Popen, PIPE
+from socket import socketpair, socket, AF_UNIX, SOCK_STREAM
+
+from pytest import raises
+
+from topology_docker_openswitch import ovsdb
+from topology_docker_openswitch.ovsdb import (
+    JsonStreamDecoder, OvsdbClient, PipeStream, updated_rows
+)
+from topology_docker_openswitch.openswitch import OpenSwitchNode
+
+
+def test_decoder_byte_by_byte():
+    """
+    Check that messages split at any byte, including inside escapes and
+    multibyte characters, are decoded once complete.
+    """
+    messages = [
+        {'id': 1, 'result': ['quoted \\" brace } ñ']},
+        {'id': None, 'method': 'update', 'params': ['m', {}]},
+    ]
+    stream = '\n'.join(dumps(message) for message in messages)
+    stream = stream.encode('utf-8')
+
+    decoder = JsonStreamDecoder()
+    decoded = []
+    for i in range(len(stream)):
+        decoded.extend(decoder.feed(stream[i:i + 1]))
+
+    assert decoded == messages
+
+
+def test_client_matches_replies_and_dispatches_updates():
+    """
+    Check that a monitor reply is matched by id even when it is preceded by
+    a reply to another request and followed by an update notification.
+    """
+    client_sock, server_sock = socketpair()
+    client = OvsdbClient(client_sock)
+    cur_hw = []
+
+    def callback(updates):
+        for _, row in updated_rows(updates, 'System'):
+            cur_hw.append(row['cur_hw'])
+
+    server_sock.sendall(dumps({'id': 99, 'result': [], 'error': None})
+                        .encode('utf-8'))
+    server_sock.sendall(dumps({
+        'id': 1, 'error': None,
+        'result': {'System': {'uuid': {'new': {'cur_hw': 0}}}}
+    }).encode('utf-8'))
+    server_sock.sendall(dumps({
+        'id': None, 'method': 'update',
+        'params': ['monitor-0', {'System': {'uuid': {'new': {'cur_hw': 1}}}}]
+    }).encode('utf-8'))
+
+    client.monitor(
+        'OpenSwitch', {'System': {'columns': ['cur_hw']}}, callback,
+        timeout=1
+    )
+    while client.process(timeout=0.1):
+        pass
+
+    assert cur_hw == [0, 1]
+    client.close()
+    server_sock.close()
+
+
+def echo_server(path, connections=1):
+    """
+    Serve the given number of connections on a unix socket, replying to
+    every request with its parameters.
+    """
+    server = socket(AF_UNIX, SOCK_STREAM)
+    server.bind(path)
+    server.listen(connections)
+
+    def serve():
+        for _ in range(connections):
+            conn, _ = server.accept()
+            decoder = JsonStreamDecoder()
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                for message in decoder.feed(data):
+                    conn.sendall(dumps({
+                        'id': message['id'], 'error': None,
+                        'result': message['params']
+                    }).encode('utf-8'))
+            conn.close()
+
+    thread = Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    return server, thread
+
+
+def relay_command(path):
+    return [sys.executable, ovsdb.__file__.replace('.pyc', '.py'), path]
+
+
+def test_client_through_relay(tmpdir):
+    """
+    Check that a client talks to a server through the relay process, as
+    done on the host through ``docker exec -i``.
+    """
+    path = join(str(tmpdir), 'db.sock')
+    server, thread = echo_server(path)
+
+    process = Popen(relay_command(path), stdin=PIPE, stdout=PIPE)
+    client = OvsdbClient(PipeStream(process))
+    assert client.call('echo', ['ñ'] * 10000, timeout=5) == ['ñ'] * 10000
+    assert client.call('echo', [1], timeout=5) == [1]
+
+    client.close()
+    thread.join(5)
+    server.close()
+
+
+class RelayNode(object):
+    """
+    Node whose OVSDB relay runs in the host.
+    """
+
+    ovsdb_transact = OpenSwitchNode.ovsdb_transact
+    _close_ovsdb = OpenSwitchNode._close_ovsdb
+
+    def __init__(self, path):
+        self.path = path
+        self._ovsdb = None
+        self._ovsdb_lock = Lock()
+
+    def _ovsdb_relay_command(self):
+        return relay_command(self.path)
+
+
+def test_transact_after_relay_exited(tmpdir):
+    """
+    Check that the connection of a node is dropped once its relay exited, so
+    the next transaction starts a new relay.
+    """
+    path = join(str(tmpdir), 'db.sock')
+    server, thread = echo_server(path, connections=2)
+    node = RelayNode(path)
+
+    assert node.ovsdb_transact({'op': 'comment'}, timeout=5) == [
+        'OpenSwitch', {'op': 'comment'}
+    ]
+    client = node._ovsdb
+    process = client._sock._process
+    process.kill()
+    process.wait()
+
+    with raises((IOError, OSError)):
+        node.ovsdb_transact({'op': 'comment'}, timeout=5)
+    assert node._ovsdb is None
+
+    assert node.ovsdb_transact({'op': 'comment'}, timeout=5) == [
+        'OpenSwitch', {'op': 'comment'}
+    ]
+    assert node._ovsdb is not client
+
+    node._close_ovsdb()
+    thread.join(5)
+    server.close()
@@ -24,7 +24,7 @@ from __future__ import print_function, division
 
 from time import sleep
 
-from .helpers import wait_until_interface_up
+from .helpers import wait_until_interfaces_up
 
 
 TOPOLOGY = """
@@ -86,8 +86,7 @@ def test_ping(topology):
         ctx.no_shutdown()
 
     # Wait until interfaces are up
-    for switch, portlbl in [(sw1, '3'), (sw1, '4'), (sw2, '3'), (sw2, '4')]:
-        wait_until_interface_up(switch, portlbl)
+    wait_until_interfaces_up({sw1: ['3', '4'], sw2: ['3', '4']})
 
     # Set static routes in switches
     sw1.libs.ip.add_route('10.0.30.0/24', '10.0.20.2', shell='bash_swns')
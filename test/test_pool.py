@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Test suite for the warm pool of OpenSwitch nodes.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from time import time, sleep
+
+from topology_docker_openswitch.pool import (
+    WarmPool, warm_pool, configure_warm_pool
+)
+from topology_docker_openswitch.cache import image_cache, configure_image_cache
+from topology_docker_openswitch.engine import engine, configure_engine
+from topology_docker_openswitch.artifacts import (
+    log_follower, configure_log_follower, FOLLOWED_LOG
+)
+
+from .fakes import FakeBackend, FakeOpenSwitchNode
+
+
+class StubNode(object):
+
+    container_name = 'stub'
+
+    def __init__(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+def followers(container):
+    # Followers of the log still running in a fake container
+    return [
+        process for process in container._spawned
+        if FOLLOWED_LOG in ' '.join(process.args) and process.poll() is None
+    ]
+
+
+def wait_ready(pool, key, count, timeout=5.0):
+    deadline = time() + timeout
+    while pool.ready(key) < count:
+        assert time() < deadline
+        sleep(0.01)
+
+
+def test_warm_pool_refill_and_shutdown():
+    """
+    Check that the pool refills in background after each request and stops
+    the nodes left when shut down.
+    """
+    pool = WarmPool(size=2)
+    booted = []
+
+    def factory():
+        booted.append(StubNode())
+        return booted[-1]
+
+    assert pool.acquire('image', factory) is None
+    wait_ready(pool, 'image', 2)
+
+    # Nodes boot concurrently, so any of the first two may be handed out
+    node = pool.acquire('image', factory)
+    assert node in booted[:2]
+    wait_ready(pool, 'image', 2)
+    assert len(booted) == 3
+    assert pool.ready('other') == 0
+
+    pool.shutdown()
+    assert pool.acquire('image', factory) is None
+    assert not node.stopped
+    assert all(other.stopped for other in booted if other is not node)
+
+
+def test_warm_pool_idle_eviction():
+    """
+    Check that nodes left idle in the pool are stopped and not handed out.
+    """
+    pool = WarmPool(size=1, idle_timeout=0.2)
+    booted = []
+
+    def factory():
+        booted.append(StubNode())
+        return booted[-1]
+
+    assert pool.acquire('image', factory) is None
+    wait_ready(pool, 'image', 1)
+
+    deadline = time() + 5
+    while not booted[0].stopped:
+        assert time() < deadline
+        sleep(0.05)
+    assert pool.ready('image') == 0
+
+    pool.shutdown()
+
+
+def test_warm_pool_adoption():
+    """
+    Check that a node takes over a warm container without creating one, and
+    that the taps of its linked ports are replaced and switchd restarted.
+    The follower of the log of the container is handed over to the node.
+    """
+    directory, api = image_cache.directory, engine.api
+    configure_image_cache(None)
+    configure_engine(False)
+    backend = FakeBackend(step_delay=0.01)
+    configure_warm_pool(1)
+    configure_log_follower(True)
+    try:
+        first = FakeOpenSwitchNode('sw0', backend)
+        first.start()
+        first.notify_post_build()
+        wait_ready(warm_pool, first._pool_key, 1)
+
+        created = []
+        create_container = backend.create_container
+
+        def record(name=None, **kwargs):
+            created.append(name)
+            return create_container(name=name, **kwargs)
+
+        backend.create_container = record
+        node = FakeOpenSwitchNode('sw1', backend, ports=['1', '2'])
+        assert node._pooled
+        assert node.container_name.startswith('warm_pool')
+        assert not [name for name in created if name.startswith('sw1')]
+
+        node.start()
+        node.notify_post_build()
+        assert node.ports == {'1': '1', '2': '2'}
+        assert set(['1', '2']) <= node.container.swns
+        assert 'switchd_restart' in dict(node.container.boot_schedule)
+        assert node.setup_timings['phases'][-1]['name'] == 'switchd_restart'
+
+        assert log_follower.following(node)
+        assert len(followers(node.container)) == 1
+        log_follower.stop(node)
+        deadline = time() + 5
+        while followers(node.container):
+            assert time() < deadline
+            sleep(0.01)
+    finally:
+        configure_log_follower(False)
+        configure_warm_pool(0)
+        # The refill boot must be done with the backend before it is closed
+        warm_pool.shutdown(wait=True)
+        backend.close()
+        configure_image_cache(directory)
+        configure_engine(api)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+Test suite for the placement of OpenSwitch containers on the host.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from time import sleep
+from threading import Thread, Lock
+
+from topology_docker_openswitch.scheduler import (
+    parse_cpulist, host_topology, PlacementScheduler
+)
+
+
+def test_parse_cpulist():
+    """
+    Check the parsing of the lists of CPUs of the kernel.
+    """
+    assert parse_cpulist('0-3,8,10-11\n') == [0, 1, 2, 3, 8, 10, 11]
+    assert parse_cpulist('') == []
+    assert host_topology()
+
+
+def test_placement_spread():
+    """
+    Check that containers are spread over the NUMA nodes and their CPUs, and
+    that released CPUs are reused.
+    """
+    scheduler = PlacementScheduler(
+        cpus=2, memory='512m', topology=[(0, [0, 1, 2, 3]), (1, [4, 5, 6, 7])]
+    )
+
+    placements = [scheduler.place() for _ in range(4)]
+    assert [p.numa_node for p in placements] == [0, 1, 0, 1]
+    assert [p.cpus for p in placements] == [[0, 1], [4, 5], [2, 3], [6, 7]]
+    assert placements[1].host_config_kwargs() == {
+        'cpuset_cpus': '4,5', 'cpuset_mems': '1', 'mem_limit': '512m'
+    }
+
+    # Every CPU is taken, containers start sharing them
+    shared = scheduler.place()
+    assert shared.cpus == [0, 1]
+    shared.release()
+
+    placements[2].release()
+    placements[2].release()
+    assert scheduler.place().cpus == [2, 3]
+
+    # Wider than a NUMA node
+    wide = scheduler.place(cpus=6)
+    assert len(wide.cpus) == 6
+    assert 'cpuset_mems' not in wide.host_config_kwargs()
+
+    assert PlacementScheduler().place() is None
+    assert PlacementScheduler().place(memory=1024).host_config_kwargs() == {
+        'mem_limit': 1024
+    }
+
+
+def test_setup_slots():
+    """
+    Check that no more than the maximum number of nodes set up at once.
+    """
+    scheduler = PlacementScheduler(max_setups=2)
+    lock = Lock()
+    running = []
+    peak = []
+
+    def setup():
+        with scheduler.setup():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            sleep(0.05)
+            with lock:
+                running.pop()
+
+    threads = [Thread(target=setup) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+Test suite for the OpenSwitch shells.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from re import search
+
+from topology_docker_openswitch.shell import (
+    VTYSH_PROMPT, LazyShells, OpenSwitchVtyshShell, OpenSwitchBashShell
+)
+
+
+def test_vtysh_prompt_anchored():
+    """
+    Check that the vtysh prompt only matches at the end of the output.
+    """
+    assert search(VTYSH_PROMPT, 'output\nswitch# ')
+    assert search(VTYSH_PROMPT, 'output\nswitch(config-if)#')
+    assert not search(VTYSH_PROMPT, 'switch(config)# interface 1\nmore')
+
+
+def test_bounded_search_spawn_args():
+    """
+    Check that the shells bound the prompt search of pexpect.
+    """
+    vtysh = OpenSwitchVtyshShell('container', searchwindowsize=1024)
+    assert vtysh._spawn_args['searchwindowsize'] == 1024
+    assert vtysh._spawn_args['maxread'] == 65536
+    # The defaults of the base shell are kept
+    assert vtysh._spawn_args['env'] == {'TERM': 'dumb'}
+    assert vtysh._spawn_args['echo'] is False
+
+    bash = OpenSwitchBashShell(
+        'container', 'bash', spawn_args={'maxread': 2048}
+    )
+    assert bash._spawn_args['searchwindowsize'] == 4096
+    assert bash._spawn_args['maxread'] == 2048
+    assert bash._get_connect_command() == 'docker exec -i -t container bash'
+
+
+def test_lazy_shells():
+    """
+    Check that shells are created on first lookup only, and once.
+    """
+    created = []
+
+    def factory():
+        created.append(object())
+        return created[-1]
+
+    shells = LazyShells()
+    shells.lazy('vtysh', factory)
+    shells.lazy('bash', factory)
+
+    assert list(shells.keys()) == ['vtysh', 'bash']
+    assert 'bash' in shells
+    assert not created
+    assert shells.created() == []
+
+    bash = shells['bash']
+    assert shells.get('bash') is bash
+    assert shells.created() == [bash]
+    assert created == [bash]
+    assert shells.get('other') is None
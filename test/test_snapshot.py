@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Test suite for the snapshots of converged OpenSwitch containers.
+"""
+
+from __future__ import unicode_literals, absolute_import
+from __future__ import print_function, division
+
+from topology_docker_openswitch.cache import ImageCache
+from topology_docker_openswitch.snapshot import SnapshotStore
+
+
+class StubClient(object):
+
+    def __init__(self):
+        self.images = set(['sha256:original'])
+
+    def inspect_image(self, image=None):
+        if image not in self.images:
+            raise Exception('No such image: {}'.format(image))
+        return {'Id': image}
+
+    def commit(self, container, **kwargs):
+        self.images.add('sha256:snapshot')
+        return {'Id': 'sha256:snapshot'}
+
+    def remove_image(self, image, force=False):
+        self.images.remove(image)
+
+
+def test_snapshots_removed(tmpdir):
+    """
+    Check that the snapshot images taken are removed and forgotten, so the
+    next session takes them again, unless they are kept.
+    """
+    cache = ImageCache(str(tmpdir))
+    client = StubClient()
+    store = SnapshotStore(cache, enabled=True)
+
+    assert store.claim('sha256:original')
+    store.take(client, 'container', 'sha256:original', 'backup')
+    assert store.lookup(client, 'sha256:original')['image'] == \
+        'sha256:snapshot'
+
+    store.remove()
+    assert client.images == set(['sha256:original'])
+    assert store.lookup(client, 'sha256:original') is None
+    assert ImageCache(str(tmpdir)).get('sha256:original', 'snapshot') is None
+    assert store.claim('sha256:original')
+
+    store.keep = True
+    store.take(client, 'container', 'sha256:original', 'backup')
+    store.remove()
+    assert 'sha256:snapshot' in client.images
+    assert ImageCache(str(tmpdir)).get('sha256:original', 'snapshot') == {
+        'image': 'sha256:snapshot', 'backup': 'backup'
+    }